@@ -1,5 +1,21 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
 
 
 class MynotesConfig(AppConfig):
     name = 'mynotes'
+
+    def ready(self):
+        from . import models, references, search, sqlite, terms
+
+        connection_created.connect(sqlite.on_connection_created, dispatch_uid='sqlite')
+        post_migrate.connect(search.on_post_migrate, sender=self, dispatch_uid='search')
+        post_migrate.connect(terms.on_post_migrate, sender=self, dispatch_uid='terms')
+
+        # Keep process-wide cache of reference rows in sync with db
+        for model in references.REFERENCE_FIELDS:
+            post_save.connect(references.on_reference_changed, sender=model, dispatch_uid='references')
+            post_delete.connect(references.on_reference_changed, sender=model, dispatch_uid='references')
+        post_save.connect(references.on_tree_changed, sender=models.Tree, dispatch_uid='references')
+        post_delete.connect(references.on_tree_changed, sender=models.Tree, dispatch_uid='references')
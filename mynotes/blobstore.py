@@ -0,0 +1,174 @@
+"""
+Description: Content-addressed store of binary blobs (file attachments) on local disk. Blobs are keyed by SHA-256
+digest of their content, hence identical content is stored only once. Blobs are moved into place only once completely
+written, so that a partially written blob is never visible.
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+
+from django.conf import settings
+
+from . import constants
+
+
+def get_blob_root():
+    """Get directory under which blobs are stored
+
+    Returns:
+        Directory path
+    """
+    return getattr(settings, 'MYNOTES_BLOB_ROOT', os.path.join(settings.BASE_DIR, constants.BLOB_DIRECTORY))
+
+
+def get_blob_path(digest):
+    """Get path of a blob, blobs are fanned out in two levels of directories by leading characters of digest
+
+    Args:
+        digest (str): SHA-256 hex digest of blob's content
+
+    Returns:
+        File path
+    """
+    return os.path.join(get_blob_root(), digest[:2], digest[2:4], digest)
+
+
+def store_blob(uploaded_file):
+    """Store content of an uploaded file as a blob, unless a blob with the same content is already stored. Content
+    is read in chunks, and uploads already spooled to a temporary file are hard linked into place where possible.
+
+    Args:
+        uploaded_file (django.core.files.uploadedfile.UploadedFile): Uploaded file
+
+    Returns:
+        Tuple of SHA-256 hex digest and size of the content
+    """
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in uploaded_file.chunks(constants.BLOB_CHUNK_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+    digest = digest.hexdigest()
+
+    path = get_blob_path(digest)
+    if _touch_blob(path):
+        return digest, size
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        try:
+            os.link(uploaded_file.temporary_file_path(), path)
+            return digest, size
+        except FileExistsError:
+            # Same content is stored by a concurrent upload in the meantime
+            if _touch_blob(path):
+                return digest, size
+        except OSError:
+            # Temporary file is on another file system, or links are not supported, hence content is copied
+            pass
+
+    # Content is written to a temporary file in the same directory, so that it can be renamed into place atomically
+    descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.upload-')
+    try:
+        with os.fdopen(descriptor, 'wb') as blob:
+            for chunk in uploaded_file.chunks(constants.BLOB_CHUNK_SIZE):
+                blob.write(chunk)
+            blob.flush()
+            os.fsync(blob.fileno())
+        os.replace(temporary_path, path)
+    except Exception as e:
+        os.unlink(temporary_path)
+        raise Exception("Failed to store blob '{}'. Reason - {}".format(digest, e))
+    return digest, size
+
+
+def _touch_blob(path):
+    """Mark a stored blob as just stored, since compaction deletes unreferenced blobs older than a grace period. A blob
+    reused by an upload is not referenced by any attachment until the upload is committed, hence it would be deleted
+    in the meantime if it was stored long ago.
+
+    Args:
+        path (str): File path of the blob
+
+    Returns:
+        True if blob is stored, False if it is not (or is deleted by compaction in the meantime)
+    """
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def list_blobs(min_age=0):
+    """List digests of all the stored blobs
+
+    Args:
+        min_age (int): Skip blobs stored less than these many seconds ago
+
+    Yields:
+        SHA-256 hex digest of blob's content
+    """
+    root = get_blob_root()
+    now = time.time()
+    for directory, _, files in os.walk(root):
+        for file_name in files:
+            if file_name.startswith('.'):
+                # Blob being written
+                continue
+            if now - os.path.getmtime(os.path.join(directory, file_name)) >= min_age:
+                yield file_name
+
+
+def delete_blob(digest):
+    """Delete a blob, if stored
+
+    Args:
+        digest (str): SHA-256 hex digest of blob's content
+    """
+    try:
+        os.unlink(get_blob_path(digest))
+    except FileNotFoundError:
+        pass
+
+
+def open_blob(digest):
+    """Open a blob for reading
+
+    Args:
+        digest (str): SHA-256 hex digest of blob's content
+
+    Returns:
+        Binary file object
+
+    Raises:
+        FileNotFoundError: If blob is not stored
+    """
+    return open(get_blob_path(digest), 'rb')
+
+
+class BlobRange:
+    """Read-only file-like view of a range of bytes of an open blob, for serving partial content"""
+
+    def __init__(self, blob, start, end):
+        """
+        Args:
+            blob (file): Binary file object of the blob, closed along with the range
+            start (int): Offset of first byte
+            end (int): Offset of last byte, inclusive
+        """
+        self.blob = blob
+        self.blob.seek(start)
+        self.remaining = end - start + 1
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        content = self.blob.read(size)
+        self.remaining -= len(content)
+        return content
+
+    def close(self):
+        self.blob.close()
@@ -22,6 +22,84 @@ NOTES_DOCUMENT_TYPE = "notes"
 ROOT_DIRECTORY = "root"
 DAILY_NOTES_DIRECTORY = "daily-notes"
 PERSONAL_DIRECTORY = "personal"
+TREE_PATH_SEPARATOR = "/"
+TREE_MAX_DEPTH = 32
 
 # Date-time
 DISPLAY_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Content storage
+INLINE_CONTENT_LIMIT = 1024
+CONTENT_CHUNK_SIZE = 64 * 1024
+CONTENT_COMPRESSION_LEVEL = 6
+
+# Revisions
+REVISION_SNAPSHOT_INTERVAL = 20
+# Autosaves within these many seconds of the autosave which recorded the latest revision amend that revision
+REVISION_AUTOSAVE_WINDOW = 10 * 60
+
+# Autosave
+EDIT_INSERT_OPERATION = "insert"
+EDIT_DELETE_OPERATION = "delete"
+MAX_EDIT_OPERATIONS = 1000
+
+# Attachments
+BLOB_DIRECTORY = "blobs"
+BLOB_CHUNK_SIZE = 64 * 1024
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+
+# Search
+SEARCH_CONFIG = "english"
+TAG_MAX_LENGTH = 30
+TAG_SEPARATOR = ","
+SEARCH_PAGE_SIZE = 20
+SEARCH_SNIPPET_WIDTH = 60
+SEARCH_SNIPPET_MATCHES = 3
+SEARCH_MIN_LENGTH = 2
+
+# Autocomplete and fuzzy matching
+TERM_MIN_LENGTH = 3
+TERM_MAX_LENGTH = 40
+TRIGRAM_SIMILARITY_THRESHOLD = 0.3
+CORRECTION_CANDIDATES = 10
+TERM_INDEX_TTL = 60
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_BUDGET_MS = 50
+
+# Cache
+NOTE_INDEX_CACHE_KEY = "mynotes:note-index:{}"
+NOTE_INDEX_MONTH_CACHE_KEY = "mynotes:note-index:{}:{}-{}"
+NOTE_INDEX_CACHE_TIMEOUT = 60 * 60
+NOTE_INDEX_VERSION = "note-index"
+NOTE_PAGE_CACHE_KEY = "mynotes:note-page:{}-{}-{}:{}:{}"
+NOTE_PAGE_CACHE_TIMEOUT = 24 * 60 * 60
+TAG_COUNTS_CACHE_KEY = "mynotes:tag-counts:{}"
+TAG_COUNTS_CACHE_TIMEOUT = 60 * 60
+CSRF_TOKEN_PLACEHOLDER = "mynotes-csrf-token-placeholder"
+
+# Jobs
+REINDEX_JOB = "reindex"
+TREE_REPAIR_JOB = "tree-repair"
+COMPACTION_JOB = "compaction"
+EXPORT_JOB = "export"
+JOB_KINDS = (REINDEX_JOB, TREE_REPAIR_JOB, COMPACTION_JOB, EXPORT_JOB)
+MAINTENANCE_JOB_KINDS = (REINDEX_JOB, TREE_REPAIR_JOB, COMPACTION_JOB)
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+EXPORT_DIRECTORY = "exports"
+# Required and optional arguments of each kind of job
+JOB_ARGUMENTS = {
+    EXPORT_JOB: (('output',), ('since', 'state_file')),
+}
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 30
+JOB_PROGRESS_INTERVAL = 500
+JOB_LIST_SIZE = 20
+BLOB_GRACE_PERIOD = 60 * 60
+
+# Instrumentation
+SLOW_QUERY_MS = 100
+REQUEST_STATS_WINDOW = 1000
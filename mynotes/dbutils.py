@@ -3,11 +3,34 @@ Description: Utilities around database models to perform CRUD operations followe
 """
 
 import datetime
+import difflib
+import itertools
+import json
+import os
+import time
+import uuid
 
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, FloatField, Q, Value
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+
+from . import blobstore
+from . import constants
+from . import jobs
 from . import models
+from . import references
+from . import search
+from . import storage
+from . import terms
 from . import utils
 
 
+class NoteVersionMismatch(Exception):
+    """Raised when a note is saved against a version other than its current version"""
+
+
 def get_settings():
     """Return settings from Settings table
 
@@ -26,24 +49,194 @@ def get_list_of_document_types():
     Returns:
         List of document types
     """
-    types = []
-    all = models.DocumentType.objects.all()
-    for type in all:
-        types.append(type.type)
-    return types
+    return references.get_document_types()
+
+
+def get_note_index():
+    """Get index of notes grouped by year and month, served from cache and built from db on a miss
+
+    Returns:
+        List of tuples containing year and list of tuples containing month and number of notes, latest first
+    """
+    key = constants.NOTE_INDEX_CACHE_KEY.format(get_note_index_version())
+    index = cache.get(key)
+    if index is None:
+        index = {}
+        counts = models.Document.objects.filter(date__isnull=False).annotate(
+            year=ExtractYear('date'), month=ExtractMonth('date')
+        ).order_by().values_list('year', 'month').annotate(count=Count('id'))
+        for year, month, count in counts:
+            index.setdefault(year, {})[month] = count
+        cache.set(key, index, constants.NOTE_INDEX_CACHE_TIMEOUT)
+    return [(year, sorted(index[year].items(), reverse=True)) for year in sorted(index, reverse=True)]
 
 
-def get_list_of_notes():
-    """Get list of notes from db
+def get_list_of_notes(year, month):
+    """Get list of notes of a month, served from cache and fetched from db on a miss
+
+    Args:
+        year (int): Year
+        month (int): Month
 
     Returns:
         List of notes
     """
-    list_of_notes = []
-    documents = models.Document.objects.filter(type__type='daily-notes')
-    for document in documents:
-        list_of_notes.append(document.name.replace('-', '/'))
-    return list_of_notes
+    key = constants.NOTE_INDEX_MONTH_CACHE_KEY.format(get_note_index_version(), year, month)
+    days = cache.get(key)
+    if days is None:
+        first, last = utils.get_month_range(year, month)
+        dates = models.Document.objects.filter(date__gte=first, date__lt=last).values_list('date', flat=True)
+        days = sorted(date.day for date in dates)
+        cache.set(key, days, constants.NOTE_INDEX_CACHE_TIMEOUT)
+    return [utils.get_formatted_date(year, month, day) for day in days]
+
+
+def invalidate_note_index():
+    """Invalidate cached index of notes, list of notes of every month and tag counts, along with cached pages and
+    fragments showing them. Version is kept in db, so that the cache of every process is invalidated whichever
+    process writes notes (e.g. import_notes or run_worker), and within a transaction it is renewed along with the
+    changes it stands for.
+    """
+    # Version is never reused, otherwise entries cached under a version renewed by a rolled back transaction would be
+    # served again
+    version = uuid.uuid4().hex
+    if not models.CacheVersion.objects.filter(name=constants.NOTE_INDEX_VERSION).update(version=version):
+        try:
+            with transaction.atomic():
+                models.CacheVersion.objects.create(name=constants.NOTE_INDEX_VERSION, version=version)
+        except IntegrityError:
+            models.CacheVersion.objects.filter(name=constants.NOTE_INDEX_VERSION).update(version=version)
+
+
+def get_note_index_version():
+    """Get version of index of notes, it changes whenever a note is created or tags of a note change. Cached index,
+    list of notes, tag counts and pages and fragments showing them are keyed by it, so that they are invalidated all
+    at once.
+
+    Returns:
+        Version string
+    """
+    version = models.CacheVersion.objects.filter(
+        name=constants.NOTE_INDEX_VERSION).values_list('version', flat=True).first()
+    return version or ''
+
+
+def get_note_page_key(year, month, day):
+    """Get cache key of rendered page of a note. Key changes whenever the note is saved, its tags or attachments
+    change, or index of notes changes, hence a cached page never has to be deleted.
+
+    Args:
+        year (int): Year
+        month (int): Month
+        day (int): Day
+
+    Returns:
+        Cache key
+    """
+    stamp = filter_notes_for_date(year, month, day).values_list('revision', 'modified').first()
+    note_version = '{}-{}'.format(stamp[0], stamp[1].timestamp()) if stamp else 'none'
+    return constants.NOTE_PAGE_CACHE_KEY.format(year, month, day, note_version, get_note_index_version())
+
+
+def get_cached_note_page(key):
+    """Get rendered page of a note from cache
+
+    Args:
+        key (str): Cache key returned by get_note_page_key
+
+    Returns:
+        Rendered page, None if not cached
+    """
+    return cache.get(key)
+
+
+def cache_note_page(key, page):
+    """Cache rendered page of a note, until its key changes
+
+    Args:
+        key (str): Cache key returned by get_note_page_key
+        page (str): Rendered page
+    """
+    cache.set(key, page, constants.NOTE_PAGE_CACHE_TIMEOUT)
+
+
+def get_tag_counts():
+    """Get number of documents of every tag in use, counted in a single aggregated query and cached until tags of any
+    note change
+
+    Returns:
+        List of tuples containing tag and number of documents, ordered by tag
+    """
+    key = constants.TAG_COUNTS_CACHE_KEY.format(get_note_index_version())
+    counts = cache.get(key)
+    if counts is None:
+        counts = list(models.Mapping.objects.values_list('tag__tag').annotate(
+            count=Count('document')
+        ).order_by('tag__tag'))
+        cache.set(key, counts, constants.TAG_COUNTS_CACHE_TIMEOUT)
+    return counts
+
+
+def get_tags_for_date(year, month, day):
+    """Get tags of the note
+
+    Args:
+        year (int): Year
+        month (int): Month
+        day (int): Day
+
+    Returns:
+        Sorted list of tags, empty if note does not exist
+    """
+    tags = models.Tag.objects.filter(mapping__document__in=filter_notes_for_date(year, month, day)).order_by('tag')
+    return list(tags.values_list('tag', flat=True))
+
+
+def set_tags_for_date(year, month, day, tags):
+    """Replace tags of the note
+
+    Args:
+        year (int): Year
+        month (int): Month
+        day (int): Day
+        tags (list): Tags
+
+    Raises:
+        models.Document.DoesNotExist: If note does not exist
+    """
+    with transaction.atomic():
+        # Note is locked so that concurrent updates of its tags do not add the same mapping twice
+        document = filter_notes_for_date(year, month, day).select_for_update().get()
+        _set_tags(document, tags)
+
+
+def _set_tags(document, tags):
+    """Replace tags of a document by adding and removing only changed mappings, missing tags are created. Document is
+    marked modified when its tags change, so that incremental exports pick the change up.
+
+    Args:
+        document (models.Document): Document object
+        tags (list): Tags
+
+    Returns:
+        True if tags of the document changed, otherwise False
+    """
+    tag_ids = dict(models.Tag.objects.filter(tag__in=tags).values_list('tag', 'pk'))
+    for tag in tags:
+        if tag not in tag_ids:
+            tag_ids[tag] = models.Tag.objects.get_or_create(tag=tag)[0].pk
+
+    mappings = dict(models.Mapping.objects.filter(document=document).values_list('tag', 'pk'))
+    removed = [pk for tag_id, pk in mappings.items() if tag_id not in tag_ids.values()]
+    added = [models.Mapping(document=document, tag_id=tag_id) for tag_id in tag_ids.values() if tag_id not in mappings]
+    if not removed and not added:
+        return False
+    models.Mapping.objects.filter(pk__in=removed).delete()
+    models.Mapping.objects.bulk_create(added)
+    document.modified = timezone.now()
+    models.Document.objects.filter(pk=document.pk).update(modified=document.modified)
+    invalidate_note_index()
+    return True
 
 
 def fetch_note_object_for_date(year, month, day):
@@ -56,10 +249,31 @@ def fetch_note_object_for_date(year, month, day):
 
     Returns:
         Model object for a note
+
+    Raises:
+        models.Document.DoesNotExist: If note does not exist or date is invalid
     """
-    document_name = utils.generate_notes_file_name(year, month, day)
-    document = models.Document.objects.get(name=document_name)
-    return document
+    if not utils.is_valid_date(year, month, day):
+        raise models.Document.DoesNotExist("Invalid date {}".format(utils.get_formatted_date(year, month, day)))
+    return filter_notes_for_date(year, month, day).select_related('data').get()
+
+
+def filter_notes_for_date(year, month, day):
+    """Filter daily note of a date, looked up through (type, date) index. Every lookup of a note by its date goes
+    through here, so that a note is found the same way whether it is read or written.
+
+    Args:
+        year (int): Year
+        month (int): Month
+        day (int): Day
+
+    Returns:
+        Queryset of the note's document, empty if date is invalid
+    """
+    if not utils.is_valid_date(year, month, day):
+        return models.Document.objects.none()
+    return models.Document.objects.filter(type=references.get_document_type(constants.DAILY_NOTES_DOCUMENT_TYPE),
+                                          date=datetime.date(year, month, day))
 
 
 def get_notes_for_date(year, month, day):
@@ -75,11 +289,49 @@ def get_notes_for_date(year, month, day):
     """
     try:
         notes = fetch_note_object_for_date(year, month, day)
-        return notes.data.data
+        return storage.read_content(notes.data)
     except models.Document.DoesNotExist:
-        return ["Notes not found for date {}.\n".format(utils.get_formatted_date(year, month, day)),
-                 "Please edit this document and save."
-                 ]
+        return "Notes not found for date {}.\nPlease edit this document and save.".format(
+            utils.get_formatted_date(year, month, day))
+
+
+def get_notes_range_for_date(year, month, day, start, end=None):
+    """Get part of note for a particular date
+
+    Args:
+        year (int): Year
+        month (int): Month
+        day (int): Day
+        start (int): Offset of first character
+        end (int): Offset after last character, None to read till end
+
+    Returns:
+        Part of note's content
+
+    Raises:
+        models.Document.DoesNotExist: If note does not exist
+        ValueError: If start or end is negative
+    """
+    document = fetch_note_object_for_date(year, month, day)
+    return storage.read_content_range(document.data, start, end)
+
+
+def stream_notes_for_date(year, month, day):
+    """Stream note for a particular date without loading it as a whole
+
+    Args:
+        year (int): Year
+        month (int): Month
+        day (int): Day
+
+    Returns:
+        Iterator over parts of note's content
+
+    Raises:
+        models.Document.DoesNotExist: If note does not exist
+    """
+    document = fetch_note_object_for_date(year, month, day)
+    return storage.stream_content(document.data)
 
 
 def get_access_and_modify_time_for_notes(year, month, day):
@@ -96,7 +348,7 @@ def get_access_and_modify_time_for_notes(year, month, day):
     try:
         document = fetch_note_object_for_date(year, month, day)
         return {
-                'size': len(document.data.data),
+                'size': storage.get_content_size(document.data),
                 'ctime': document.atime,
                 'mtime': document.mtime,
                 'format': document.data.type.type,
@@ -110,6 +362,125 @@ def get_access_and_modify_time_for_notes(year, month, day):
         }
 
 
+def get_note_version_for_date(year, month, day):
+    """Get version of the note
+
+    Args:
+        year (int): Year
+        month (int): Month
+        day (int): Day
+
+    Returns:
+        Version string, None if note does not exist
+    """
+    document = filter_notes_for_date(year, month, day).first()
+    return None if document is None else get_note_version(document)
+
+
+def get_note_details(document):
+    """Get content along with attributes of a note
+
+    Args:
+        document (models.Document): Document object of the note
+
+    Returns:
+        Dictionary containing note's date, content, version, size and modification time
+    """
+    return {
+        'date': document.date.isoformat() if document.date else None,
+        'content': storage.read_content(document.data),
+        'version': get_note_version(document),
+        'size': storage.get_content_size(document.data),
+        'modified': document.modified.isoformat(),
+    }
+
+
+def add_attachment_for_date(year, month, day, uploaded_file):
+    """Attach an uploaded file to the note. Content is stored in blob store, and data record of an identical
+    attachment is reused.
+
+    Args:
+        year (int): Year
+        month (int): Month
+        day (int): Day
+        uploaded_file (django.core.files.uploadedfile.UploadedFile): Uploaded file
+
+    Returns:
+        Model object for the attachment
+
+    Raises:
+        models.Document.DoesNotExist: If note does not exist
+    """
+    document = fetch_note_object_for_date(year, month, day)
+    digest, size = blobstore.store_blob(uploaded_file)
+    with transaction.atomic():
+        identical = models.Attachment.objects.filter(digest=digest).select_related('data').first()
+        if identical is not None:
+            data = identical.data
+        else:
+            data = models.Data.objects.create(type=references.get_data_type(constants.FILE_DATA_TYPE), data=digest,
+                                              flag=0, encrypt_key=references.get_encryption(
+                                                  constants.NO_ENCRYPTION_ALGORITHM),
+                                              mtime=datetime.datetime.now(), size=size)
+        attachment = models.Attachment.objects.create(
+            document=document, data=data, digest=digest, name=os.path.basename(uploaded_file.name)[:255],
+            content_type=uploaded_file.content_type or constants.DEFAULT_CONTENT_TYPE,
+        )
+        # Page of the note lists its attachments
+        models.Document.objects.filter(pk=document.pk).update(modified=timezone.now())
+    return attachment
+
+
+def get_attachments_for_date(year, month, day):
+    """Get attachments of the note
+
+    Args:
+        year (int): Year
+        month (int): Month
+        day (int): Day
+
+    Returns:
+        List of dictionaries containing id, name, content type and size of attachments, in order of attaching
+    """
+    attachments = models.Attachment.objects.filter(
+        document__in=filter_notes_for_date(year, month, day)).order_by('pk')
+    return [
+        {'id': pk, 'name': name, 'content_type': content_type, 'size': size}
+        for pk, name, content_type, size in attachments.values_list('pk', 'name', 'content_type', 'data__size')
+    ]
+
+
+def fetch_attachment_for_date(year, month, day, attachment_id):
+    """Fetch attachment of the note
+
+    Args:
+        year (int): Year
+        month (int): Month
+        day (int): Day
+        attachment_id (int): Id of the attachment
+
+    Returns:
+        Model object for the attachment
+
+    Raises:
+        models.Attachment.DoesNotExist: If note does not have such attachment
+    """
+    return models.Attachment.objects.select_related('data').get(
+        pk=attachment_id, document__in=filter_notes_for_date(year, month, day))
+
+
+def get_tree_path(path):
+    """Convert list of nodes to materialized path of the tree
+
+    Args:
+        path (list): List of nodes build up using absolute path
+
+    Returns:
+        Materialized path string
+    """
+    return constants.TREE_PATH_SEPARATOR.join(str(entity) for entity in path)
+
+
 def create_tree(path, document=None):
     """Create desired as per path and save document as leaf node
 
@@ -117,15 +488,9 @@ def create_tree(path, document=None):
         path (list): List of nodes build up using absolute path
         document (models.Document): Document object, if leaf node is not a directory
     """
-    if path[0] != "root":
+    if path[0] != constants.ROOT_DIRECTORY:
         raise Exception("Invalid path '{}' of the document to be saved in the tree".format(path))
 
-    # if path[1] element itself is new, it's parent wil be set as "root" directory
-    try:
-        entity_object = models.Tree.objects.get(entity="root")
-    except:
-        raise Exception("Entry '{}' not found in the tree! Please check if setup is executed.".format('root'))
-
     if not document:
         # If document is not being saved at a leaf node of the path, it is assumed that leaf is also a directory
         directory_path = path[:]
@@ -133,84 +498,1007 @@ def create_tree(path, document=None):
         # If document is to be saved at a leaf node, it is assumed that path till second last entries are directory
         directory_path = path[:-1]
 
-    # Create required directory hierarchy
-    for entity in directory_path:
+    # Fetch all the existing directories of the hierarchy below root in one go, root itself is cached
+    directory_paths = [get_tree_path(directory_path[:level + 1]) for level in range(len(directory_path))]
+    existing = {directory_paths[0]: references.get_root_directory()}
+    if len(directory_paths) > 1:
+        existing.update(
+            (node.path, node) for node in models.Tree.objects.filter(path__in=directory_paths[1:], document=None)
+        )
+
+    # Create missing directories of the hierarchy
+    entity_object = None
+    for entity, directory in zip(directory_path, directory_paths):
         parent = entity_object
-        try:
-            entity_object = models.Tree.objects.get(entity=entity, parent=parent)
-        except models.Tree.DoesNotExist:
-            entity_object = models.Tree.objects.create(entity=entity, document=None, parent=parent)
-            entity_object.save()
+        entity_object = existing.get(directory)
+        if entity_object is None:
             try:
-                entity_object = models.Tree.objects.get(entity=entity, parent=parent)
+                entity_object = _create_directory(entity, parent, directory)
             except Exception as e:
                 raise Exception("Failed to create node '{}' in tree. Reason - {}".format(entity, e))
 
     if document:
         # Save document as a leaf node in the tree
         try:
-            entity_object = models.Tree.objects.create(entity=path[-1], document=document, parent=entity_object)
-            entity_object.save()
+            models.Tree.objects.create(entity=path[-1], document=document, parent=entity_object,
+                                       path=get_tree_path(path))
         except Exception as e:
             raise Exception("Failed to save document. Reason - {}".format(e))
 
 
-def save_note(year, month, day, notes):
-    """Create new note or update previously saved note
+def get_tree_node(path):
+    """Get node of the tree at a path
+
+    Args:
+        path (list): List of nodes build up using absolute path
+
+    Returns:
+        Model object for a tree node
+    """
+    return models.Tree.objects.get(path=get_tree_path(path))
+
+
+def get_tree_ancestors(path):
+    """Get all the ancestors of a node in the tree
+
+    Args:
+        path (list): List of nodes build up using absolute path
+
+    Returns:
+        List of model objects for tree nodes, starting from root
+    """
+    ancestor_paths = [get_tree_path(path[:level]) for level in range(1, len(path))]
+    ancestors = models.Tree.objects.filter(path__in=ancestor_paths, document=None)
+    return sorted(ancestors, key=lambda node: len(node.path))
+
+
+def is_tree_ancestor(ancestor_path, path):
+    """Check if a node in the tree is an ancestor of another node
+
+    Args:
+        ancestor_path (list): List of nodes build up using absolute path of the ancestor
+        path (list): List of nodes build up using absolute path of the descendant
+
+    Returns:
+        True if node exists in the tree under the ancestor, False otherwise
+    """
+    return models.Tree.objects.filter(
+        search.get_prefix_condition('path', get_tree_path(ancestor_path) + constants.TREE_PATH_SEPARATOR),
+        path=get_tree_path(path),
+    ).exists()
+
+
+def get_tree_subtree(path):
+    """Get all the nodes under a node in the tree
+
+    Args:
+        path (list): List of nodes build up using absolute path
+
+    Returns:
+        Queryset of model objects for tree nodes ordered by path
+    """
+    prefix = get_tree_path(path) + constants.TREE_PATH_SEPARATOR
+    return models.Tree.objects.filter(
+        search.get_prefix_condition('path', prefix)
+    ).select_related('document').order_by('path')
+
+
+# Nodes under a node up to a depth, walked through parent links in a single recursive query. Root is its own parent,
+# hence self links are not followed. Document of every node is joined along with a flag telling whether node has
+# children, so that nodes can be expanded lazily.
+TREE_LISTING_QUERY = """
+with recursive subtree (id, entity, parent_id, document_id, path, depth) as (
+    select id, entity, parent_id, document_id, path, 0 from mynotes_tree where path = %s
+    union all
+    select tree.id, tree.entity, tree.parent_id, tree.document_id, tree.path, subtree.depth + 1
+    from mynotes_tree tree inner join subtree on tree.parent_id = subtree.id
+    where tree.id <> tree.parent_id and subtree.depth < %s
+)
+select subtree.id, subtree.entity, subtree.parent_id, subtree.path, subtree.depth,
+    exists (select 1 from mynotes_tree child where child.parent_id = subtree.id and child.id <> subtree.id),
+    document.name, documenttype.type, document.date, document.modified, data.size
+from subtree
+left outer join mynotes_document document on document.id = subtree.document_id
+left outer join mynotes_documenttype documenttype on documenttype.id = document.type_id
+left outer join mynotes_data data on data.id = document.data_id
+order by subtree.depth, subtree.entity;
+"""
+
+
+def get_tree_listing(path, depth=1):
+    """Get a node of the tree along with nodes under it up to a depth, in a single query
+
+    Args:
+        path (list): List of nodes build up using absolute path
+        depth (int): Number of levels to be listed under the node, None for the whole subtree
+
+    Returns:
+        Dictionary containing node's name, path, document, whether it has children and children listed so far
+        (nested the same way), None if node does not exist
+    """
+    depth = constants.TREE_MAX_DEPTH if depth is None else min(depth, constants.TREE_MAX_DEPTH)
+    with connection.cursor() as cursor:
+        cursor.execute(TREE_LISTING_QUERY, [get_tree_path(path), depth])
+        rows = cursor.fetchall()
+
+    nodes = {}
+    listing = None
+    for node_id, entity, parent_id, node_path, node_depth, has_children, name, type, date, modified, size in rows:
+        node = {
+            'name': entity,
+            'path': node_path,
+            'has_children': bool(has_children),
+            'document': None if name is None else {
+                'name': name,
+                'type': type,
+                'date': _format_timestamp(date),
+                'modified': _format_timestamp(modified),
+                'size': size,
+            },
+        }
+        if node_depth < depth and has_children:
+            node['children'] = []
+        nodes[node_id] = node
+        # Rows are ordered by depth, hence parent is always seen before its children
+        if node_depth == 0:
+            listing = node
+        else:
+            nodes[parent_id]['children'].append(node)
+    return listing
+
+
+def _format_timestamp(value):
+    """Format date or time fetched by a raw query, backends without native types return them as strings
+
+    Args:
+        value: Date, datetime, string or None
+
+    Returns:
+        ISO formatted string, None if value is None
+    """
+    if value is None or isinstance(value, str):
+        return value
+    return value.isoformat()
+
+
+def rebuild_tree_paths(progress=None):
+    """Recompute materialized path of all the nodes in the tree from their parent links
+
+    Args:
+        progress (callable): Called with number of nodes checked so far and total number of nodes
+
+    Returns:
+        Number of nodes updated
+    """
+    nodes = {node_id: (entity, parent_id, path)
+             for node_id, entity, parent_id, path in models.Tree.objects.values_list('id', 'entity', 'parent', 'path')}
+    paths = {}
+
+    def resolve(node_id):
+        if node_id not in paths:
+            entity, parent_id, _ = nodes[node_id]
+            if parent_id == node_id:
+                paths[node_id] = entity
+            else:
+                paths[node_id] = resolve(parent_id) + constants.TREE_PATH_SEPARATOR + entity
+        return paths[node_id]
+
+    # Every node is fixed on its own, outside a transaction, so that progress is visible while nodes are checked
+    updated = 0
+    for checked, (node_id, (_, _, path)) in enumerate(nodes.items()):
+        if progress and checked % constants.JOB_PROGRESS_INTERVAL == 0:
+            progress(checked, len(nodes))
+        if resolve(node_id) != path:
+            try:
+                models.Tree.objects.filter(id=node_id).update(path=paths[node_id])
+            except IntegrityError as e:
+                raise Exception("Path '{}' of node {} is taken by another node, execute merge_duplicate_notes first. "
+                                "Reason - {}".format(paths[node_id], node_id, e))
+            updated += 1
+    return updated
+
+
+def get_note_version(document):
+    """Get version of a note, it changes whenever content of the note changes
+
+    Args:
+        document (models.Document): Document object of the note
+
+    Returns:
+        Version string
+    """
+    return "{}-{}".format(document.pk, document.revision)
+
+
+def save_note(year, month, day, notes, version=None, tags=None, autosave=False):
+    """Create new note or update previously saved note, in a single transaction. Document is locked while it is
+    updated, so that concurrent saves of the same note are applied one after another.
 
     Args:
         year (int): Year
         month (int): Month
         day (int): Day
+        notes (str): Note's content
+        version (str): Version of the note the content is based on, '*' for any version of an existing note, None to
+            save unconditionally
+        tags (list): Tags of the note, None to leave tags unchanged
+        autosave (bool): Flag to save the note as an autosave, which may amend the latest revision instead of
+            recording a new one
 
     Returns:
-        None
+        Version of the saved note
+
+    Raises:
+        NoteVersionMismatch: If version is given and note is not at that version
     """
     document_name = utils.generate_notes_file_name(year, month, day)
 
-    try:
-        document = fetch_note_object_for_date(year, month, day)
-        data = document.data
-        data.data = notes
-        data.mtime = document.mtime = datetime.datetime.now()
-        data.save()
-        document.save()
-    except:
-        # save data
-        datatype = models.DataType.objects.get(type='text')
-        encrypt_key = models.Encryption.objects.get(algo='')
+    with transaction.atomic():
+        documents = filter_notes_for_date(year, month, day).select_for_update().select_related('data')
+        document = documents.first()
+        if version is not None and (document is None or version not in ('*', get_note_version(document))):
+            raise NoteVersionMismatch("Note '{}' is not at version '{}'".format(document_name, version))
+        if document is None:
+            try:
+                with transaction.atomic():
+                    document = _create_note(year, month, day, notes)
+                    if tags is not None:
+                        _set_tags(document, tags)
+                return get_note_version(document)
+            except IntegrityError:
+                # Note is created by a concurrent save in the meantime, update it instead
+                document = documents.get()
+        _update_note(document, notes, autosave)
+        if tags is not None:
+            _set_tags(document, tags)
+        return get_note_version(document)
+
+
+def patch_note(year, month, day, operations, version):
+    """Apply edit operations to a note, so that an edit is sent as changed text only instead of whole content. Edits
+are autosaved, hence revisions of an editing session are coalesced.
+
+    Args:
+        year (int): Year
+        month (int): Month
+        day (int): Day
+        operations (list): Edit operations, as accepted by utils.apply_edit_operations
+        version (str): Version of the note the operations are based on
+
+    Returns:
+        Version of the saved note
+
+    Raises:
+        models.Document.DoesNotExist: If note does not exist
+        NoteVersionMismatch: If note is not at that version
+        ValueError: If any operation is invalid
+    """
+    with transaction.atomic():
+        document = filter_notes_for_date(year, month, day).select_for_update().select_related('data').get()
+        if version != get_note_version(document):
+            raise NoteVersionMismatch("Note '{}' is not at version '{}'".format(document.name, version))
+        notes = utils.apply_edit_operations(storage.read_content(document.data), operations)
+        return save_note(year, month, day, notes, version=version, autosave=True)
+
+
+def _create_note(year, month, day, notes):
+    """Create new note
+
+    Args:
+        year (int): Year
+        month (int): Month
+        day (int): Day
+        notes (str): Note's content
+
+    Returns:
+        Model object for the note
+
+    Raises:
+        IntegrityError: If note for the date already exists
+    """
+    # save data
+    ctime = datetime.datetime.now()
+    data = models.Data(type=references.get_data_type(constants.TEXT_DATA_TYPE), flag=0,
+                       encrypt_key=references.get_encryption(constants.NO_ENCRYPTION_ALGORITHM), mtime=ctime,
+                       search_vector=search.get_search_vector(notes))
+    storage.write_content(data, notes)
+    search.sync_index(data, notes)
+    terms.update_terms('', notes)
+
+    # save document, its content is recorded as first revision
+    document = models.Document.objects.create(name=utils.generate_notes_file_name(year, month, day),
+                                              type=references.get_document_type(constants.DAILY_NOTES_DOCUMENT_TYPE),
+                                              data=data, date=datetime.date(year, month, day), ctime=ctime,
+                                              atime=ctime, mtime=ctime, revision=1)
+    _create_snapshot(document, 1, notes)
+
+    # Create tree and save it as a leaf node
+    path = [constants.ROOT_DIRECTORY, constants.DAILY_NOTES_DIRECTORY, str(year), str(month), str(day)]
+    create_tree(path, document)
+    invalidate_note_index()
+    return document
+
+
+def _update_note(document, notes, autosave=False):
+    """Update previously saved note
+
+    Args:
+        document (models.Document): Document object of the note, locked for update
+        notes (str): Note's content
+        autosave (bool): Flag to record the save as an autosave
+    """
+    data = document.data
+    previous = storage.read_content(data)
+    data.mtime = document.mtime = datetime.datetime.now()
+    data.search_vector = search.get_search_vector(notes)
+    document.modified = timezone.now()
+    storage.write_content(data, notes, previous)
+    search.sync_index(data, notes)
+    terms.update_terms(previous, notes)
+    record_revision(document, previous, notes, autosave)
+    document.save(update_fields=['mtime', 'modified', 'revision'])
+
+
+def record_revision(document, previous, content, autosave=False):
+    """Record a save of document as revision. Revision stores delta against previous revision, or full snapshot of
+    content every constants.REVISION_SNAPSHOT_INTERVAL revisions. An autosave amends the latest revision instead, if
+    that was recorded by an autosave within constants.REVISION_AUTOSAVE_WINDOW seconds, so that an editing session
+    does not record a revision for every few keystrokes. Revision counter of the document is advanced either way, it
+    has to be saved by the caller.
+
+    Args:
+        document (models.Document): Document object which is saved
+        previous (str): Content before save, None if document is newly created
+        content (str): Content after save
+        autosave (bool): Flag to record the save as an autosave
+
+    Returns:
+        Model object for a revision, None if content is unchanged
+    """
+    if previous == content:
+        return None
+
+    document.revision += 1
+    latest = document.revisions.defer('content').order_by('-number').first()
+    if latest is None and previous is not None:
+        # Document was saved before revisions were recorded, keep its previous content as first revision
+        latest = _create_snapshot(document, 1, previous)
+
+    if autosave and latest.autosave and timezone.now() - latest.ctime < datetime.timedelta(
+            seconds=constants.REVISION_AUTOSAVE_WINDOW):
+        if not latest.snapshot:
+            previous = _reconstruct_revisions(document, latest.number - 1, latest.number - 1)[latest.number - 1]
+        latest.content = storage.compress(content if latest.snapshot else json.dumps(
+            utils.generate_delta(previous, content)))
+        latest.size = len(content)
+        latest.save(update_fields=['content', 'size'])
+        return latest
+
+    number = latest.number + 1 if latest else 1
+    snapshot = number == _get_snapshot_number(number)
+    payload = content if snapshot else json.dumps(utils.generate_delta(previous, content))
+    return models.Revision.objects.create(document=document, number=number, snapshot=snapshot, autosave=autosave,
+                                          content=storage.compress(payload), size=len(content))
+
+
+def _create_snapshot(document, number, content):
+    """Record full content of document as a snapshot revision
+
+    Args:
+        document (models.Document): Document object
+        number (int): Revision number
+        content (str): Content of the document
+
+    Returns:
+        Model object for a revision
+    """
+    return models.Revision.objects.create(document=document, number=number, snapshot=True,
+                                          content=storage.compress(content), size=len(content))
+
+
+def _get_snapshot_number(number):
+    """Get number of the snapshot revision from which a revision can be reconstructed
+
+    Args:
+        number (int): Revision number
+
+    Returns:
+        Revision number of the snapshot
+    """
+    return (number - 1) // constants.REVISION_SNAPSHOT_INTERVAL * constants.REVISION_SNAPSHOT_INTERVAL + 1
+
+
+def _reconstruct_revisions(document, first, last):
+    """Reconstruct content of a range of revisions, replaying deltas from the nearest snapshot in one query
+
+    Args:
+        document (models.Document): Document object
+        first (int): First revision number to be reconstructed
+        last (int): Last revision number to be reconstructed
+
+    Returns:
+        Dictionary of content by revision number
+    """
+    revisions = models.Revision.objects.filter(document=document, number__gte=_get_snapshot_number(first),
+                                               number__lte=last)
+    contents = {}
+    content = ''
+    for revision in revisions:
+        payload = storage.decompress(revision.content)
+        content = payload if revision.snapshot else utils.apply_delta(content, json.loads(payload))
+        if revision.number >= first:
+            contents[revision.number] = content
+    return contents
+
+
+def get_revisions_for_date(year, month, day):
+    """Get list of revisions of note for a particular date
+
+    Args:
+        year (int): Year
+        month (int): Month
+        day (int): Day
+
+    Returns:
+        List of model objects for revisions, latest first, without their content
+
+    Raises:
+        models.Document.DoesNotExist: If note does not exist
+    """
+    document = fetch_note_object_for_date(year, month, day)
+    return list(document.revisions.defer('content').order_by('-number'))
+
+
+def get_revision_diff_for_date(year, month, day, number):
+    """Get content of a revision of note for a particular date along with its diff against previous revision
+
+    Args:
+        year (int): Year
+        month (int): Month
+        day (int): Day
+        number (int): Revision number
+
+    Returns:
+        Tuple of revision's content and list of lines of unified diff
+
+    Raises:
+        models.Document.DoesNotExist: If note does not exist
+        models.Revision.DoesNotExist: If revision does not exist
+    """
+    document = fetch_note_object_for_date(year, month, day)
+    contents = _reconstruct_revisions(document, max(number - 1, 1), number)
+    if number not in contents:
+        raise models.Revision.DoesNotExist("Revision {} not found for note '{}'".format(number, document.name))
+    previous = contents.get(number - 1, '')
+    diff = difflib.unified_diff(previous.splitlines(keepends=True), contents[number].splitlines(keepends=True),
+                                fromfile='revision {}'.format(number - 1), tofile='revision {}'.format(number))
+    # Last line of content may not end with a newline
+    return contents[number], [line if line.endswith('\n') else line + '\n' for line in diff]
+
+
+def backfill_document_dates():
+    """Set date of daily notes saved before documents recorded their date, parsing it from document's name
+
+    Returns:
+        Number of documents updated
+    """
+    updated = 0
+    documents = models.Document.objects.filter(
+        date__isnull=True, type__type=constants.DAILY_NOTES_DOCUMENT_TYPE
+    ).values_list('id', 'name')
+    with transaction.atomic():
+        for document_id, name in documents:
+            try:
+                date = datetime.date(*(int(part) for part in name.split('-')))
+            except (TypeError, ValueError):
+                continue
+            models.Document.objects.filter(id=document_id).update(date=date)
+            updated += 1
+    return updated
+
+
+def import_notes(notes, directories):
+    """Bulk create daily notes in a single transaction, skipping dates for which a note already exists
+
+    Args:
+        notes (list): List of tuples containing year, month, day and note's content
+        directories (dict): Cache of directory nodes of the tree by their path, shared across calls
+
+    Returns:
+        Number of notes created
+    """
+    notes_by_name = {utils.generate_notes_file_name(year, month, day): (year, month, day, content)
+                     for year, month, day, content in notes}
+    existing = set(models.Document.objects.filter(name__in=notes_by_name).values_list('name', flat=True))
+    notes = [note for name, note in notes_by_name.items() if name not in existing]
+    if not notes:
+        return 0
+
+    with transaction.atomic():
+        # save data along with chunks of long content
+        datatype = references.get_data_type(constants.TEXT_DATA_TYPE)
+        encrypt_key = references.get_encryption(constants.NO_ENCRYPTION_ALGORITHM)
+        document_type = references.get_document_type(constants.DAILY_NOTES_DOCUMENT_TYPE)
         ctime = datetime.datetime.now()
-        data = models.Data.objects.create(type=datatype, data=notes, flag=0, encrypt_key=encrypt_key, mtime=ctime)
-        data.save()
+        data_list = []
+        chunks = []
+        for _, _, _, content in notes:
+            data = models.Data(type=datatype, flag=0, encrypt_key=encrypt_key, mtime=ctime)
+            for chunk in storage.prepare_content(data, content):
+                chunks.append((data, chunk))
+            data_list.append(data)
+        _bulk_create(models.Data, data_list)
+        for data, chunk in chunks:
+            chunk.data = data
+        models.Chunk.objects.bulk_create([chunk for _, chunk in chunks])
+
+        # save documents
+        documents = [
+            models.Document(name=utils.generate_notes_file_name(year, month, day), type=document_type,
+                            data=data, date=datetime.date(year, month, day), ctime=ctime, atime=ctime, mtime=ctime)
+            for (year, month, day, _), data in zip(notes, data_list)
+        ]
+        _bulk_create(models.Document, documents)
 
-        # save document
-        document_type = models.DocumentType.objects.get(type='daily-notes')
-        document = models.Document.objects.create(name=document_name, type=document_type, data=data, ctime=ctime,
-                                                  atime=ctime, mtime=ctime)
-        document.save()
+        # save documents as leaf nodes in the tree
+        leaves = []
+        for (year, month, day, _), document in zip(notes, documents):
+            path = [constants.ROOT_DIRECTORY, constants.DAILY_NOTES_DIRECTORY, str(year), str(month), str(day)]
+            parent = _get_or_create_directory(path[:-1], directories)
+            leaves.append(models.Tree(entity=path[-1], document=document, parent=parent, path=get_tree_path(path)))
+        models.Tree.objects.bulk_create(leaves)
 
-        # Create tree and save it as a leaf node
-        path = ["root", "daily-notes", str(year), str(month), str(day)]
-        create_tree(path, document)
+        search.index_contents(data_list, [content for _, _, _, content in notes])
+        terms.add_terms([content for _, _, _, content in notes])
+        invalidate_note_index()
+    return len(notes)
 
 
-def search_data_in_documents(search_str):
-    """Search data in all the documents
+def _get_or_create_directory(path, directories):
+    """Get directory node of the tree at a path, creating missing directories of the hierarchy
 
     Args:
-        search_str (str): String to be search in all the documents
+        path (list): List of nodes build up using absolute path
+        directories (dict): Cache of directory nodes of the tree by their path
 
     Returns:
-        List of tuples containing document object and content
+        Model object for a tree node
     """
-    list_of_documents = []
-    data_list = models.Data.objects.filter(data__icontains=search_str)
-    for data in data_list:
-        try:
-            document = models.Document.objects.get(data=data)
-        except models.Document.DoesNotExist:
-            continue
-        list_of_documents.append(
-            (document.name.replace('-', '/'), utils.format_certain_string_in_content(data.data, search_str))
-        )
-    return list_of_documents
+    directory = get_tree_path(path)
+    if len(path) == 1:
+        return references.get_root_directory()
+    if directory not in directories:
+        node = models.Tree.objects.filter(path=directory, document=None).first()
+        if node is None:
+            parent = _get_or_create_directory(path[:-1], directories)
+            node = _create_directory(path[-1], parent, directory)
+        directories[directory] = node
+    return directories[directory]
+
+
+def _create_directory(entity, parent, path):
+    """Create directory node of the tree, or get the one created by a concurrent save in the meantime
+
+    Args:
+        entity (str): Name of the directory
+        parent (models.Tree): Parent node
+        path (str): Materialized path of the directory
+
+    Returns:
+        Model object for a tree node
+    """
+    try:
+        with transaction.atomic():
+            return models.Tree.objects.create(entity=entity, document=None, parent=parent, path=path)
+    except IntegrityError:
+        # Paths are unique, the other save has committed the directory by the time insert fails
+        return models.Tree.objects.get(path=path, document=None)
+
+
+def _bulk_create(model, objects):
+    """Bulk create model objects, making sure primary keys are set on them
+
+    Args:
+        model (class): Model class
+        objects (list): List of unsaved model objects
+    """
+    if connection.features.can_return_ids_from_bulk_insert:
+        model.objects.bulk_create(objects)
+    else:
+        for obj in objects:
+            obj.save()
+
+
+def count_export_documents(modified_since=None):
+    """Count documents to be exported
+
+    Args:
+        modified_since (datetime.datetime): Count only documents modified after this time, None to count all
+
+    Returns:
+        Number of documents
+    """
+    documents = models.Document.objects.all()
+    if modified_since:
+        documents = documents.filter(modified__gt=modified_since)
+    return documents.count()
+
+
+def export_documents(modified_since=None, chunk_size=500):
+    """Iterate over all the documents to be exported, using server-side cursor so that memory stays flat
+
+    Args:
+        modified_since (datetime.datetime): Export only documents modified after this time, None to export all
+        chunk_size (int): Number of documents fetched from db at a time
+
+    Yields:
+        Tuple of dictionary containing document's attributes and iterator over document's content
+    """
+    documents = models.Document.objects.select_related('type', 'data__type').order_by('pk')
+    if modified_since:
+        documents = documents.filter(modified__gt=modified_since)
+    documents = documents.iterator(chunk_size=chunk_size)
+
+    while True:
+        batch = list(itertools.islice(documents, chunk_size))
+        if not batch:
+            break
+
+        # Tree paths and tags of the whole batch are fetched in one query each
+        ids = [document.pk for document in batch]
+        paths = dict(models.Tree.objects.filter(document__in=ids).values_list('document', 'path'))
+        tags = {}
+        for document_id, tag in models.Mapping.objects.filter(document__in=ids).values_list('document', 'tag__tag'):
+            tags.setdefault(document_id, []).append(tag)
+
+        for document in batch:
+            attributes = {
+                'name': document.name,
+                'type': document.type.type,
+                'format': document.data.type.type,
+                'path': paths.get(document.pk),
+                'tags': sorted(tags.get(document.pk, [])),
+                'size': storage.get_content_size(document.data),
+                'date': document.date.isoformat() if document.date else None,
+                'modified': document.modified.isoformat(),
+            }
+            yield attributes, storage.stream_content(document.data)
+
+
+def _filter_documents(documents, document_type=None, date_from=None, date_to=None, path=None):
+    """Filter documents by type, date range and tree path
+
+    Args:
+        documents (QuerySet): Documents to be filtered
+        document_type (str): Type of documents, None for all
+        date_from (datetime.date): Earliest date of documents, None for no lower bound
+        date_to (datetime.date): Latest date of documents, None for no upper bound
+        path (list): List of nodes build up using absolute path, None for the whole tree
+
+    Returns:
+        Filtered queryset of documents
+
+    Raises:
+        models.DocumentType.DoesNotExist: If document type does not exist
+    """
+    if document_type:
+        # Type is compared by its cached id, (type, date) index then covers type and date range together
+        documents = documents.filter(type=references.get_document_type(document_type))
+    if date_from:
+        documents = documents.filter(date__gte=date_from)
+    if date_to:
+        documents = documents.filter(date__lte=date_to)
+    if path:
+        prefix = get_tree_path(path)
+        nodes = models.Tree.objects.filter(
+            Q(path=prefix) | search.get_prefix_condition('path', prefix + constants.TREE_PATH_SEPARATOR),
+            document__isnull=False)
+        documents = documents.filter(pk__in=nodes.values('document'))
+    return documents
+
+
+def rebuild_search_index(progress=None):
+    """Rebuild full-text search index of all the notes
+
+    Args:
+        progress (callable): Called with number of data records indexed so far and total number of data records
+
+    Returns:
+        Number of data records indexed
+    """
+    return search.rebuild_index(progress)
+
+
+def compact_storage(progress=None):
+    """Remove data records no longer referred to by any document or attachment along with their chunks and search
+    index, blobs no longer referred to by any attachment and terms no longer found in any note. Recently stored blobs
+    are kept, as attachment referring to them may not have been committed yet.
+
+    Args:
+        progress (callable): Called with number of steps done so far and total number of steps
+
+    Returns:
+        Tuple of number of data records, blobs and terms removed
+    """
+    if progress:
+        progress(0, 2)
+    with transaction.atomic():
+        orphans = models.Data.objects.filter(document=None, attachment=None)
+        data_count = orphans.count()
+        orphans.delete()
+        search.prune_index()
+
+    if progress:
+        progress(1, 2)
+    digests = set(models.Attachment.objects.values_list('digest', flat=True).distinct())
+    blob_count = 0
+    for digest in blobstore.list_blobs(min_age=constants.BLOB_GRACE_PERIOD):
+        if digest not in digests:
+            blobstore.delete_blob(digest)
+            blob_count += 1
+    return data_count, blob_count, terms.prune_terms()
+
+
+def rebuild_terms(progress=None):
+    """Recount terms of all the notes for autocomplete and fuzzy search
+
+    Args:
+        progress (callable): Called with number of notes counted so far and total number of notes
+
+    Returns:
+        Number of distinct terms
+    """
+    return terms.rebuild_terms(progress)
+
+
+def get_autocomplete_suggestions(prefix, limit=constants.AUTOCOMPLETE_LIMIT,
+                                 budget_ms=constants.AUTOCOMPLETE_BUDGET_MS):
+    """Suggest terms and daily notes completing a prefix, within a latency budget so that it can be queried as user
+    types
+
+    Args:
+        prefix (str): Prefix typed so far, a term or name of a note
+        limit (int): Maximum number of suggestions of each kind
+        budget_ms (int): Milliseconds within which suggestions are needed, matching stops once budget is spent
+
+    Returns:
+        Dictionary containing list of tuples of term and its count, list of tuples of name and date of notes, and
+        flag which is False if suggestions are partial because budget was spent
+    """
+    deadline = time.monotonic() + budget_ms / 1000
+    suggestions, complete = terms.suggest_terms(prefix, limit, deadline)
+    notes = []
+    # Names of daily notes are dates, hence looked up only for prefixes which can start a date
+    if complete and prefix[:1].isdigit():
+        notes, complete = search.fetch_within_budget(models.Document.objects.filter(
+            search.get_prefix_condition('name', prefix),
+            type=references.get_document_type(constants.DAILY_NOTES_DOCUMENT_TYPE), date__isnull=False
+        ).order_by('-date').values_list('name', 'date')[:limit], deadline)
+    return {'terms': suggestions, 'notes': notes, 'complete': complete}
+
+
+def get_search_correction(search_str):
+    """Correct words of search string not found in any note to the most similar term, for typo tolerant search
+
+    Args:
+        search_str (str): Search string
+
+    Returns:
+        Corrected search string, None if none of the words is corrected
+    """
+    words = search_str.split()
+    corrected = terms.correct_words(words)
+    return ' '.join(corrected) if corrected != words else None
+
+
+def enqueue_job(kind, arguments=None, max_attempts=constants.JOB_MAX_ATTEMPTS):
+    """Queue a job to be executed in background by run_worker
+
+    Args:
+        kind (str): Kind of job, one of constants.JOB_KINDS
+        arguments (dict): Arguments of the job
+        max_attempts (int): Number of times job is attempted before it is marked failed
+
+    Returns:
+        Model object for the job
+
+    Raises:
+        ValueError: If kind of job is unknown or its arguments are invalid
+    """
+    arguments = arguments or {}
+    jobs.validate_arguments(kind, arguments)
+    return models.Job.objects.create(kind=kind, arguments=json.dumps(arguments), max_attempts=max_attempts)
+
+
+def get_job_details(job):
+    """Get attributes of a job
+
+    Args:
+        job (models.Job): Job object
+
+    Returns:
+        Dictionary containing job's id, kind, arguments, state, progress, attempts, result and timestamps
+    """
+    return {
+        'id': job.pk,
+        'kind': job.kind,
+        'arguments': json.loads(job.arguments),
+        'state': job.state,
+        'progress': job.progress,
+        'total': job.total,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'cancel_requested': job.cancel_requested,
+        'result': job.result,
+        'created': job.ctime.isoformat(),
+        'started': job.started.isoformat() if job.started else None,
+        'finished': job.finished.isoformat() if job.finished else None,
+    }
+
+
+def get_recent_jobs(limit=constants.JOB_LIST_SIZE):
+    """Get most recently queued jobs
+
+    Args:
+        limit (int): Maximum number of jobs
+
+    Returns:
+        List of dictionaries containing attributes of jobs, latest first
+    """
+    return [get_job_details(job) for job in models.Job.objects.order_by('-pk')[:limit]]
+
+
+def cancel_job(job_id):
+    """Cancel a job. Queued job is cancelled right away, whereas running job is cancelled when it reports progress next
+
+    Args:
+        job_id (int): Id of the job
+
+    Returns:
+        True if job is cancelled or its cancellation is requested, False if job has already finished
+
+    Raises:
+        models.Job.DoesNotExist: If job does not exist
+    """
+    # State transitions are conditional updates rather than locked reads, SQLite can not upgrade a read transaction
+    # to a write while another connection is writing
+    job = models.Job.objects.filter(pk=models.Job.objects.get(pk=job_id).pk)
+    if job.filter(state=constants.JOB_QUEUED).update(state=constants.JOB_CANCELLED, finished=timezone.now()):
+        return True
+    return job.filter(state=constants.JOB_RUNNING).update(cancel_requested=True) > 0
+
+
+def claim_jobs(count):
+    """Mark queued jobs due for execution as running, oldest first. Jobs being claimed concurrently, by a cancellation
+    or by another worker, are skipped.
+
+    Args:
+        count (int): Maximum number of jobs to claim
+
+    Returns:
+        List of model objects for claimed jobs
+    """
+    candidates = models.Job.objects.filter(
+        state=constants.JOB_QUEUED, run_after__lte=timezone.now()
+    ).order_by('run_after', 'pk').values_list('pk', flat=True)[:count]
+    claimed = [
+        job_id for job_id in candidates
+        if models.Job.objects.filter(pk=job_id, state=constants.JOB_QUEUED).update(
+            state=constants.JOB_RUNNING, attempts=F('attempts') + 1, started=timezone.now())
+    ]
+    return list(models.Job.objects.filter(pk__in=claimed).order_by('run_after', 'pk'))
+
+
+def requeue_running_jobs():
+    """Queue again the jobs left running by a worker which stopped abruptly
+
+    Returns:
+        Number of jobs queued again
+    """
+    return models.Job.objects.filter(state=constants.JOB_RUNNING).update(state=constants.JOB_QUEUED)
+
+
+def update_job_progress(job_id, done, total):
+    """Record progress of a running job
+
+    Args:
+        job_id (int): Id of the job
+        done (int): Amount of work done so far
+        total (int): Total amount of work
+
+    Returns:
+        True if cancellation of the job is requested, otherwise False
+    """
+    job = models.Job.objects.filter(pk=job_id)
+    job.update(progress=done, total=total)
+    return job.values_list('cancel_requested', flat=True).get()
+
+
+def finish_job(job_id, state, result):
+    """Record outcome of a job
+
+    Args:
+        job_id (int): Id of the job
+        state (str): Final state of the job
+        result (str): Result or reason of the outcome
+    """
+    updates = {'state': state, 'result': result, 'finished': timezone.now()}
+    if state == constants.JOB_SUCCEEDED:
+        updates['progress'] = F('total')
+    models.Job.objects.filter(pk=job_id).update(**updates)
+
+
+def fail_job(job_id, error):
+    """Record failure of an attempt of a job. Job is queued again with an exponential backoff until it runs out of
+    attempts.
+
+    Args:
+        job_id (int): Id of the job
+        error (str): Reason of the failure
+
+    Returns:
+        str: State of the job, queued if it is going to be retried
+    """
+    job = models.Job.objects.get(pk=job_id)
+    if job.attempts < job.max_attempts:
+        updates = {'state': constants.JOB_QUEUED, 'run_after': timezone.now() + datetime.timedelta(
+            seconds=constants.JOB_RETRY_DELAY * 2 ** (job.attempts - 1))}
+    else:
+        updates = {'state': constants.JOB_FAILED, 'finished': timezone.now()}
+    # Cancellation requested while the attempt was running takes precedence over retrying
+    if not models.Job.objects.filter(pk=job_id, cancel_requested=False).update(result=error, **updates):
+        updates = {'state': constants.JOB_CANCELLED, 'finished': timezone.now()}
+        models.Job.objects.filter(pk=job_id).update(result=error, **updates)
+    return updates['state']
+
+
+def search_data_in_documents(search_str, cursor=None, limit=constants.SEARCH_PAGE_SIZE, tags=None,
+                             document_type=None, date_from=None, date_to=None, path=None):
+    """Search data in the documents, one page at a time. Filters are applied in the same query as the search, so that
+    only the matching slice of documents is scanned.
+
+    Args:
+        search_str (str): String to be search in all the documents, empty to list all the documents with tags
+        cursor (str): Cursor returned along with previous page, None for first page
+        limit (int): Maximum number of results in a page, most relevant first
+        tags (list): Tags all of which a document must have
+        document_type (str): Type of documents to be searched, e.g. constants.DAILY_NOTES_DOCUMENT_TYPE, None for all
+        date_from (datetime.date): Earliest date of documents to be searched, None for no lower bound
+        date_to (datetime.date): Latest date of documents to be searched, None for no upper bound
+        path (list): List of nodes build up using absolute path, only documents under it are searched
+
+    Returns:
+        Tuple of list of tuples containing document name and content, and cursor of next page (None for last page)
+
+    Raises:
+        models.DocumentType.DoesNotExist: If document type does not exist
+    """
+    documents = models.Document.objects.select_related('data')
+    documents = _filter_documents(documents, document_type, date_from, date_to, path)
+    if search_str:
+        documents = search.filter_documents(documents, search_str)
+    else:
+        documents = documents.annotate(rank=Value(0.0, output_field=FloatField()))
+    for tag in tags or []:
+        # Each tag is looked up through index of Mapping.tag
+        documents = documents.filter(pk__in=models.Mapping.objects.filter(tag__tag=tag).values('document'))
+    documents = documents.order_by('-rank', '-pk')
+    if cursor:
+        rank, pk = utils.decode_search_cursor(cursor)
+        documents = documents.filter(Q(rank__lt=rank) | Q(rank=rank, pk__lt=pk))
+
+    # Fetch one extra row to find out whether next page exists
+    page = list(documents[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = utils.encode_search_cursor(page[-1].rank, page[-1].pk)
+
+    # Chunks of long content are streamed only until enough matches are found for the snippets
+    pattern = utils.compile_search_pattern(search_str)
+    list_of_documents = [
+        (document.name.replace('-', '/'),
+         utils.get_highlighted_snippets(storage.stream_content(document.data), pattern))
+        for document in page
+    ]
+    return list_of_documents, next_cursor
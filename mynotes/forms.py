@@ -4,16 +4,59 @@ Description: Forms are defined in this module
 
 from django import forms
 
-from . import dbutils
+from . import constants, dbutils, utils
+
+
+def get_document_type_choices():
+    """Get choices of document types, evaluated lazily whenever a form is rendered or validated
+
+    Returns:
+        List of tuples containing document type and its label, first choice being any document type
+    """
+    return [('', 'All types')] + [(type, type) for type in dbutils.get_list_of_document_types()]
+
+
+def get_tag_choices():
+    """Get choices of tags in use, evaluated lazily whenever a form is rendered or validated
+
+    Returns:
+        List of tuples containing tag and its label, first choice being any tag
+    """
+    return [('', 'All tags')] + [(tag, tag) for tag, _ in dbutils.get_tag_counts()]
 
 
 class NoteForm(forms.Form):
     content = forms.CharField(widget=forms.Textarea)
+    tags = forms.CharField(max_length=255, required=False)
+
+    def clean_tags(self):
+        try:
+            return utils.parse_tags(self.cleaned_data['tags'])
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+
+
+class AttachmentForm(forms.Form):
+    file = forms.FileField()
 
 
 class SearchForm(forms.Form):
-    types = dbutils.get_list_of_document_types()
-    document_type = [(type, type) for type in types]
+    type = forms.ChoiceField(choices=get_document_type_choices, required=False)
+    tag = forms.ChoiceField(choices=get_tag_choices, required=False)
+    search_str = forms.CharField(min_length=constants.SEARCH_MIN_LENGTH, max_length=50, strip=True, required=False)
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    path = forms.CharField(max_length=255, strip=True, required=False)
+
+    def clean_path(self):
+        path = self.cleaned_data['path'].strip(constants.TREE_PATH_SEPARATOR)
+        return path.split(constants.TREE_PATH_SEPARATOR) if path else None
 
-    type = forms.ChoiceField(choices=document_type)
-    search_str = forms.CharField(min_length=5, max_length=50, strip=True)
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('search_str') and not cleaned_data.get('tag'):
+            raise forms.ValidationError("Either search string or tag is required")
+        date_from, date_to = cleaned_data.get('date_from'), cleaned_data.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError("Start date must not be after end date")
+        return cleaned_data
@@ -0,0 +1,171 @@
+"""
+Description: Request-level instrumentation. Middleware records number of SQL queries, time spent in db, in rendering
+templates and in the view for every request, reports them in Server-Timing header and structured log lines, and
+keeps rolling per-view latency percentiles. Queries slower than a threshold are logged along with the function of
+dbutils which issued them.
+"""
+
+import collections
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import connection
+from django.template.backends.django import DjangoTemplates
+
+from . import constants, utils
+
+logger = logging.getLogger('mynotes.requests')
+
+_local = threading.local()
+_stats = collections.defaultdict(lambda: collections.deque(maxlen=constants.REQUEST_STATS_WINDOW))
+
+DBUTILS_FILE = os.path.join('mynotes', 'dbutils.py')
+PACKAGE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+class RequestStats:
+    """Measurements of a request being served"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.slow_queries = []
+
+    def record_query(self, execute, sql, params, many, context):
+        """Database execute wrapper timing every query of the request
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += duration
+            if duration * 1000 >= getattr(settings, 'MYNOTES_SLOW_QUERY_MS', constants.SLOW_QUERY_MS):
+                self.slow_queries.append({
+                    'sql': sql,
+                    'duration_ms': round(duration * 1000, 3),
+                    'caller': get_caller(),
+                })
+
+
+def get_caller():
+    """Get function of dbutils, or else of any other module of this app, which issued the query being executed
+
+    Returns:
+        Caller in form of "module.py:function:line", 'unknown' if query is not issued by this app
+    """
+    caller = None
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.endswith(DBUTILS_FILE):
+            return "dbutils.py:{}:{}".format(frame.name, frame.lineno)
+        if caller is None and frame.filename.startswith(PACKAGE_DIRECTORY) and frame.filename != __file__:
+            caller = "{}:{}:{}".format(os.path.basename(frame.filename), frame.name, frame.lineno)
+    return caller or 'unknown'
+
+
+def get_current_stats():
+    """Get measurements of request being served by current thread
+
+    Returns:
+        RequestStats object, None if no request is being served
+    """
+    return getattr(_local, 'stats', None)
+
+
+def get_view_percentiles():
+    """Get latency percentiles of recent requests of every view
+
+    Returns:
+        Dictionary of view name to its number of requests, latency percentiles (in milliseconds) and average number of
+        queries, over the rolling window of recent requests
+    """
+    percentiles = {}
+    for view, samples in list(_stats.items()):
+        samples = list(samples)
+        durations = sorted(duration for duration, _ in samples)
+        percentiles[view] = {
+            'requests': len(samples),
+            'p50_ms': round(utils.get_percentile(durations, 50), 3),
+            'p95_ms': round(utils.get_percentile(durations, 95), 3),
+            'p99_ms': round(utils.get_percentile(durations, 99), 3),
+            'avg_queries': round(sum(queries for _, queries in samples) / len(samples), 2),
+        }
+    return percentiles
+
+
+class RequestStatsMiddleware:
+    """Middleware instrumenting every request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = _local.stats = RequestStats()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(stats.record_query):
+                response = self.get_response(request)
+        finally:
+            _local.stats = None
+        total = (time.perf_counter() - start) * 1000
+        db_time = stats.db_time * 1000
+        template_time = stats.template_time * 1000
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        _stats[view].append((total, stats.queries))
+
+        response['Server-Timing'] = ', '.join([
+            'db;dur={:.3f};desc="{} queries"'.format(db_time, stats.queries),
+            'tpl;dur={:.3f}'.format(template_time),
+            'view;dur={:.3f}'.format(total),
+        ])
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'queries': stats.queries,
+            'db_ms': round(db_time, 3),
+            'template_ms': round(template_time, 3),
+            'view_ms': round(total, 3),
+        }))
+        for query in stats.slow_queries:
+            logger.warning(json.dumps(dict(query, view=view, path=request.path)))
+        return response
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """Django template backend recording time spent in rendering templates"""
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name))
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super().from_string(template_code))
+
+
+class InstrumentedTemplate:
+    """Template wrapper recording its render time in measurements of current request"""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats = get_current_stats()
+            if stats is not None:
+                stats.template_time += time.perf_counter() - start
@@ -0,0 +1,152 @@
+"""
+Description: Background jobs executed by run_worker on a pool of processes. A job reports its progress as it runs,
+which is also when a requested cancellation takes effect. Worker processes are started afresh rather than forked, so
+that database connections of the parent process are never shared.
+"""
+
+import io
+import json
+import os
+import traceback
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from . import constants
+
+# This module is imported by worker processes before Django is set up, hence models are imported only when needed
+
+
+class JobCancelled(Exception):
+    """Raised within a job when its cancellation is requested"""
+
+
+def initialize_worker():
+    """Set up Django in a new worker process
+    """
+    import django
+    django.setup()
+
+
+def validate_arguments(kind, arguments):
+    """Check that a job is given all of its required arguments and nothing else, so that a job which can never
+    succeed is rejected before it is queued
+
+    Args:
+        kind (str): Kind of job, one of constants.JOB_KINDS
+        arguments (dict): Arguments of the job
+
+    Raises:
+        ValueError: If kind of job is unknown or any argument is missing, unknown or invalid
+    """
+    if kind not in constants.JOB_KINDS:
+        raise ValueError("Unknown kind of job '{}'".format(kind))
+    required, optional = constants.JOB_ARGUMENTS.get(kind, ((), ()))
+    missing = [name for name in required if name not in arguments]
+    if missing:
+        raise ValueError("Missing arguments {} of job '{}'".format(', '.join(missing), kind))
+    unknown = [name for name in arguments if name not in required + optional]
+    if unknown:
+        raise ValueError("Unknown arguments {} of job '{}'".format(', '.join(sorted(unknown)), kind))
+    for name, value in arguments.items():
+        if not isinstance(value, str):
+            raise ValueError("Argument {} of job '{}' must be a string".format(name, kind))
+    if kind == constants.EXPORT_JOB:
+        get_export_path(arguments['output'])
+        if 'state_file' in arguments:
+            get_export_path(arguments['state_file'])
+        if 'since' in arguments and parse_datetime(arguments['since']) is None:
+            raise ValueError("Invalid date-time '{}'".format(arguments['since']))
+
+
+def get_export_path(path):
+    """Resolve path of a file written by export job under export root, settings.MYNOTES_EXPORT_ROOT
+
+    Args:
+        path (str): Path relative to export root
+
+    Returns:
+        Absolute path
+
+    Raises:
+        ValueError: If path is outside export root
+    """
+    root = os.path.realpath(getattr(settings, 'MYNOTES_EXPORT_ROOT',
+                                    os.path.join(settings.BASE_DIR, constants.EXPORT_DIRECTORY)))
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root or resolved == root:
+        raise ValueError("Path '{}' is outside export directory".format(path))
+    return resolved
+
+
+def execute_job(job_id):
+    """Execute a claimed job and record its outcome, failed attempt is queued again until job runs out of attempts
+
+    Args:
+        job_id (int): Id of the job
+
+    Returns:
+        str: State of the job after this attempt
+    """
+    from . import dbutils, models
+
+    job = models.Job.objects.get(pk=job_id)
+
+    def progress(done, total):
+        if dbutils.update_job_progress(job_id, done, total):
+            raise JobCancelled()
+
+    try:
+        result = JOB_HANDLERS[job.kind](json.loads(job.arguments), progress)
+    except JobCancelled:
+        dbutils.finish_job(job_id, constants.JOB_CANCELLED, "Cancelled while running")
+        return constants.JOB_CANCELLED
+    except Exception:
+        return dbutils.fail_job(job_id, traceback.format_exc())
+    dbutils.finish_job(job_id, constants.JOB_SUCCEEDED, result)
+    return constants.JOB_SUCCEEDED
+
+
+def reindex(arguments, progress):
+    """Rebuild full-text search index and terms of all the notes
+    """
+    from . import dbutils
+    count = dbutils.rebuild_search_index(progress)
+    return "Indexed {} notes and {} terms".format(count, dbutils.rebuild_terms(progress))
+
+
+def repair_tree(arguments, progress):
+    """Recompute materialized path of all the nodes in the tree
+    """
+    from . import dbutils
+    return "Updated {} tree nodes".format(dbutils.rebuild_tree_paths(progress))
+
+
+def compact(arguments, progress):
+    """Remove data records, blobs and terms no longer referred to
+    """
+    from . import dbutils
+    return "Removed {} data records, {} blobs and {} terms".format(*dbutils.compact_storage(progress))
+
+
+def export(arguments, progress):
+    """Export notes to an archive, arguments are 'output' path of archive and optionally 'since' (ISO date-time) or
+    'state_file', as accepted by export_notes. Paths are relative to export root.
+    """
+    from django.core.management import call_command
+
+    output_path = get_export_path(arguments['output'])
+    state_file = get_export_path(arguments['state_file']) if 'state_file' in arguments else None
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    output = io.StringIO()
+    call_command('export_notes', output_path, since=arguments.get('since'), state_file=state_file,
+                 progress=progress, stdout=output)
+    return output.getvalue().strip().splitlines()[-1]
+
+
+JOB_HANDLERS = {
+    constants.REINDEX_JOB: reindex,
+    constants.TREE_REPAIR_JOB: repair_tree,
+    constants.COMPACTION_JOB: compact,
+    constants.EXPORT_JOB: export,
+}
@@ -0,0 +1,19 @@
+"""
+Description: This script will set date of daily notes saved before documents recorded their date.
+To run this script execute, python manage.py backfill_note_dates
+"""
+
+from django.core.management.base import BaseCommand
+
+from mynotes import dbutils
+
+
+class Command(BaseCommand):
+    help = 'Sets date of daily notes saved before documents recorded their date'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS("Backfilling MyNotes document dates"))
+
+        count = dbutils.backfill_document_dates()
+
+        self.stdout.write(self.style.SUCCESS("Successfully updated {} documents".format(count)))
@@ -0,0 +1,169 @@
+"""
+Description: This script will benchmark database utilities and views against the current database (seed it first
+using seed_notes), and report latency distribution and number of queries of each benchmark as JSON. Report can be
+compared against a baseline report to catch regressions. Notes written while benchmarking are rolled back.
+To run this script execute, python manage.py benchmark --output report.json --baseline baseline.json
+"""
+
+import json
+import random
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from mynotes import constants
+from mynotes import dbutils
+from mynotes import models
+from mynotes import utils
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks database utilities and views, and reports latency distributions and query counts as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Number of timed runs of every benchmark')
+        parser.add_argument('--search', default='meeting', help='String to be searched by search benchmarks')
+        parser.add_argument('--cold', action='store_true', help='Clear cache before every run')
+        parser.add_argument('--seed', type=int, default=0, help='Seed used to pick dates of notes')
+        parser.add_argument('--skip', nargs='*', default=[], help='Names of benchmarks to be skipped')
+        parser.add_argument('--output', help='File to write report to, report is written to stdout by default')
+        parser.add_argument('--baseline', help='Report to compare against, fails on regression')
+        parser.add_argument('--tolerance', type=float, default=20,
+                            help='Allowed increase of p95 latency over baseline in percent')
+
+    def handle(self, *args, **options):
+        dates = list(models.Document.objects.exclude(date=None).values_list('date', flat=True))
+        if not dates:
+            raise CommandError("No notes found, seed the database first using seed_notes")
+        generator = random.Random(options['seed'])
+        self.iterations = options['iterations']
+        self.cold = options['cold']
+        self.stderr.write(self.style.SUCCESS("Benchmarking MyNotes on {} notes".format(len(dates))))
+
+        factory = RequestFactory()
+        search_str = options['search']
+        benchmarks = [
+            ('save_note', lambda date: dbutils.save_note(
+                date.year, date.month, date.day, "{}\n{}".format(
+                    dbutils.get_notes_for_date(date.year, date.month, date.day), search_str))),
+            ('get_notes_for_date', lambda date: dbutils.get_notes_for_date(date.year, date.month, date.day)),
+            ('get_list_of_notes', lambda date: dbutils.get_list_of_notes(date.year, date.month)),
+            ('search_data_in_documents', lambda date: dbutils.search_data_in_documents(search_str)),
+            ('search_data_in_month', lambda date: dbutils.search_data_in_documents(
+                search_str, document_type=constants.DAILY_NOTES_DOCUMENT_TYPE, date_from=date.replace(day=1),
+                date_to=date)),
+            ('get_autocomplete_suggestions', lambda date: dbutils.get_autocomplete_suggestions(search_str[:3])),
+            ('notes_view', lambda date: self.request(factory.get(reverse('note', args=(
+                date.year, date.month, date.day))))),
+            ('search_view', lambda date: self.request(factory.get(reverse('search'), {
+                'type': dbutils.get_list_of_document_types()[0], 'search_str': search_str}))),
+            ('settings_view', lambda date: self.request(factory.get(reverse('settings')))),
+        ]
+
+        report = {}
+        with transaction.atomic():
+            for name, benchmark in benchmarks:
+                if name in options['skip']:
+                    continue
+                picked = [generator.choice(dates) for _ in range(self.iterations + 1)]
+                report[name] = self.run(benchmark, picked)
+                self.stderr.write("{}: p50 {:.3f}ms, p95 {:.3f}ms, {} queries".format(
+                    name, report[name]['p50_ms'], report[name]['p95_ms'], report[name]['queries_max']))
+            transaction.set_rollback(True)
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if options['baseline']:
+            self.compare(report, options['baseline'], options['tolerance'])
+
+    def run(self, benchmark, dates):
+        """Run a benchmark once for warm-up and then once for every remaining date
+
+        Args:
+            benchmark (callable): Benchmark to be run, receives date of a note
+            dates (list): Dates of notes, one per run
+
+        Returns:
+            Dictionary containing latency distribution (in milliseconds) and number of queries
+        """
+        benchmark(dates[0])
+        durations = []
+        queries = []
+        for date in dates[1:]:
+            if self.cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                benchmark(date)
+                durations.append((time.perf_counter() - start) * 1000)
+            queries.append(len(context.captured_queries))
+        durations.sort()
+        return {
+            'iterations': len(durations),
+            'min_ms': round(durations[0], 3),
+            'mean_ms': round(sum(durations) / len(durations), 3),
+            'p50_ms': round(utils.get_percentile(durations, 50), 3),
+            'p95_ms': round(utils.get_percentile(durations, 95), 3),
+            'p99_ms': round(utils.get_percentile(durations, 99), 3),
+            'max_ms': round(durations[-1], 3),
+            'queries_mean': round(sum(queries) / len(queries), 2),
+            'queries_max': max(queries),
+        }
+
+    @staticmethod
+    def request(request):
+        """Serve a request by directly calling the view resolved for its path, bypassing middlewares
+
+        Args:
+            request (HttpRequest): Request
+
+        Returns:
+            Response of the view
+        """
+        match = resolve(request.path)
+        response = match.func(request, *match.args, **match.kwargs)
+        if response.status_code != 200:
+            raise CommandError("Request to '{}' failed with status {}".format(request.path, response.status_code))
+        return response
+
+    def compare(self, report, baseline, tolerance):
+        """Compare report against a baseline report
+
+        Args:
+            report (dict): Report of this run
+            baseline (str): Path of baseline report
+            tolerance (float): Allowed increase of p95 latency in percent
+
+        Raises:
+            CommandError: If any benchmark got slower beyond tolerance or issued more queries than baseline
+        """
+        try:
+            with open(baseline) as baseline_file:
+                baseline = json.load(baseline_file)
+        except (OSError, ValueError) as e:
+            raise CommandError("Failed to read baseline. Reason - {}".format(e))
+
+        regressions = []
+        for name, result in sorted(report.items()):
+            if name not in baseline:
+                continue
+            expected = baseline[name]
+            if result['p95_ms'] > expected['p95_ms'] * (1 + tolerance / 100):
+                regressions.append("{}: p95 {:.3f}ms, baseline {:.3f}ms".format(
+                    name, result['p95_ms'], expected['p95_ms']))
+            if result['queries_max'] > expected['queries_max']:
+                regressions.append("{}: {} queries, baseline {} queries".format(
+                    name, result['queries_max'], expected['queries_max']))
+        if regressions:
+            raise CommandError("Regressions found against baseline\n{}".format('\n'.join(regressions)))
+        self.stderr.write(self.style.SUCCESS("No regressions found against baseline"))
@@ -0,0 +1,157 @@
+"""
+Description: This script will export all the notes along with their tree path and tags to a JSONL or tar archive.
+Documents are streamed from the database and written incrementally, so that memory stays flat whatever the database
+size. With --state-file only documents modified since previous run are exported.
+To run this script execute, python manage.py export_notes <output.jsonl|output.tar|output.tar.gz>
+"""
+
+import json
+import os
+import tarfile
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from mynotes import constants
+from mynotes import dbutils
+
+# Content of a note is spooled to a temporary file once it grows beyond this size
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = 'Exports all the notes along with their tree path and tags to a JSONL or tar archive'
+    # Callable reporting number of documents exported so far and total, passed by export job through call_command
+    stealth_options = ('progress',)
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Archive path, format is chosen by extension (.jsonl, .tar, .tar.gz)')
+        parser.add_argument('--since', help='Export only documents modified after this ISO date-time')
+        parser.add_argument('--state-file',
+                            help='File to remember time of previous run, only documents modified since then are '
+                                 'exported')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Number of documents fetched from database at a time')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        since = self.get_modified_since(options['since'], options['state_file'])
+        started = timezone.now()
+
+        if output.endswith('.jsonl'):
+            writer = self.write_jsonl
+        elif output.endswith(('.tar', '.tar.gz', '.tgz')):
+            writer = self.write_tar
+        else:
+            raise CommandError("Unsupported archive format '{}', use .jsonl, .tar or .tar.gz".format(output))
+
+        if since:
+            self.stdout.write(self.style.SUCCESS("Exporting notes modified since {} to '{}'".format(since, output)))
+        else:
+            self.stdout.write(self.style.SUCCESS("Exporting all the notes to '{}'".format(output)))
+
+        start = time.time()
+        documents = dbutils.export_documents(modified_since=since, chunk_size=options['chunk_size'])
+        if options.get('progress'):
+            documents = self.track_progress(documents, options['progress'], dbutils.count_export_documents(since))
+        try:
+            count = writer(output, documents)
+        except Exception:
+            # Archive of a failed or cancelled export is incomplete, it is not left behind
+            if os.path.exists(output):
+                os.remove(output)
+            raise
+
+        if options['state_file']:
+            with open(options['state_file'], 'w') as state_file:
+                state_file.write(started.isoformat())
+        self.stdout.write(self.style.SUCCESS(
+            "Successfully exported {} notes in {:.1f}s".format(count, time.time() - start)))
+
+    def track_progress(self, documents, progress, total):
+        """Report progress of export as documents are written
+
+        Args:
+            documents (iterator): Tuples of document's attributes and iterator over its content
+            progress (callable): Called with number of documents exported so far and total number of documents
+            total (int): Total number of documents
+
+        Yields:
+            Same tuples as documents
+        """
+        for count, document in enumerate(documents):
+            if count % constants.JOB_PROGRESS_INTERVAL == 0:
+                progress(count, total)
+            yield document
+        progress(total, total)
+
+    def get_modified_since(self, since, state_file):
+        """Get time after which modified documents are to be exported
+
+        Args:
+            since (str): ISO date-time given on command line
+            state_file (str): Path of file containing time of previous run
+
+        Returns:
+            Aware datetime, None to export all documents
+        """
+        if not since and state_file and os.path.exists(state_file):
+            with open(state_file) as state:
+                since = state.read().strip()
+        if not since:
+            return None
+        modified_since = parse_datetime(since)
+        if modified_since is None:
+            raise CommandError("Invalid date-time '{}'".format(since))
+        if timezone.is_naive(modified_since):
+            modified_since = timezone.make_aware(modified_since)
+        return modified_since
+
+    def write_jsonl(self, output, documents):
+        """Write documents to JSONL archive, one document per line
+
+        Args:
+            output (str): Archive path
+            documents (iterator): Tuples of document's attributes and iterator over its content
+
+        Returns:
+            Number of documents written
+        """
+        count = 0
+        with open(output, 'w', encoding='utf-8') as archive:
+            for attributes, content in documents:
+                attributes['content'] = ''.join(content)
+                archive.write(json.dumps(attributes) + '\n')
+                count += 1
+        return count
+
+    def write_tar(self, output, documents):
+        """Write documents to tar archive, one file per document at its tree path. Attributes of document are recorded
+        in PAX headers of the file.
+
+        Args:
+            output (str): Archive path
+            documents (iterator): Tuples of document's attributes and iterator over its content
+
+        Returns:
+            Number of documents written
+        """
+        count = 0
+        mode = 'w:gz' if output.endswith(('.gz', '.tgz')) else 'w'
+        with tarfile.open(output, mode, format=tarfile.PAX_FORMAT) as archive:
+            for attributes, content in documents:
+                with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as spool:
+                    for part in content:
+                        spool.write(part.encode('utf-8'))
+                    info = tarfile.TarInfo('{}.txt'.format(attributes['path'] or attributes['name']))
+                    info.size = spool.tell()
+                    info.mtime = parse_datetime(attributes['modified']).timestamp()
+                    info.pax_headers = {'MYNOTES.{}'.format(key): json.dumps(value)
+                                        for key, value in attributes.items()}
+                    spool.seek(0)
+                    archive.addfile(info, spool)
+                count += 1
+        return count
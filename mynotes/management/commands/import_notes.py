@@ -0,0 +1,109 @@
+"""
+Description: This script will import existing note archive into the database. Archive can either be a directory tree
+of dated text/markdown files (e.g. 2018/11/25.md or 2018-11-25.txt) or a JSONL file with one note per line
+(e.g. {"date": "2018-11-25", "content": "..."}).
+To run this script execute, python manage.py import_notes <path>
+"""
+
+import itertools
+import json
+import os
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mynotes import dbutils
+from mynotes import utils
+
+NOTE_FILE_EXTENSIONS = ('.txt', '.md', '.markdown')
+NOTE_DATE_PATTERN = re.compile(r'(\d{4})\D(\d{1,2})\D(\d{1,2})$')
+
+
+class Command(BaseCommand):
+    help = 'Imports existing note archive (directory of dated text/markdown files or JSONL file) into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Directory of dated text/markdown files or JSONL file')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of notes to be saved in a single transaction')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        batch_size = options['batch_size']
+        if os.path.isdir(path):
+            notes = self.read_directory(path)
+        elif os.path.isfile(path):
+            notes = self.read_jsonl(path)
+        else:
+            raise CommandError("Archive '{}' not found".format(path))
+
+        self.stdout.write(self.style.SUCCESS("Importing notes from '{}'".format(path)))
+
+        # Directory nodes of the tree are looked up once and reused by every batch
+        directories = {}
+
+        start = time.time()
+        read = created = 0
+        while True:
+            batch = list(itertools.islice(notes, batch_size))
+            if not batch:
+                break
+            read += len(batch)
+            created += dbutils.import_notes(batch, directories)
+            elapsed = time.time() - start
+            self.stdout.write("Read {} notes, imported {} notes ({:.1f} notes/s)".format(
+                read, created, read / elapsed if elapsed else 0))
+
+        self.stdout.write(self.style.SUCCESS(
+            "Successfully imported {} notes, skipped {} already existing notes in {:.1f}s".format(
+                created, read - created, time.time() - start)))
+
+    def read_directory(self, path):
+        """Read notes from a directory tree of dated files
+
+        Args:
+            path (str): Directory path
+
+        Yields:
+            Tuple of year, month, day and note's content
+        """
+        for directory, _, files in os.walk(path):
+            for file_name in sorted(files):
+                name, extension = os.path.splitext(file_name)
+                if extension.lower() not in NOTE_FILE_EXTENSIONS:
+                    continue
+                file_path = os.path.join(directory, file_name)
+                match = NOTE_DATE_PATTERN.search(os.path.join(os.path.relpath(directory, path), name))
+                if not match:
+                    self.stderr.write("Skipping '{}', date not found in its path".format(file_path))
+                    continue
+                year, month, day = (int(part) for part in match.groups())
+                if not utils.is_valid_date(year, month, day):
+                    self.stderr.write("Skipping '{}', {}-{}-{} is not a valid date".format(file_path, year, month, day))
+                    continue
+                with open(file_path, encoding='utf-8') as note_file:
+                    content = note_file.read()
+                yield year, month, day, content
+
+    def read_jsonl(self, path):
+        """Read notes from a JSONL file
+
+        Args:
+            path (str): File path
+
+        Yields:
+            Tuple of year, month, day and note's content
+        """
+        with open(path, encoding='utf-8') as jsonl_file:
+            for line_number, line in enumerate(jsonl_file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    note = json.loads(line)
+                    year, month, day = (int(part) for part in note.get('date', note.get('name')).split('-'))
+                    if not utils.is_valid_date(year, month, day):
+                        raise ValueError("{}-{}-{} is not a valid date".format(year, month, day))
+                    yield year, month, day, note['content']
+                except (AttributeError, KeyError, TypeError, ValueError) as e:
+                    self.stderr.write("Skipping line {} of '{}'. Reason - {}".format(line_number, path, e))
@@ -0,0 +1,108 @@
+"""
+Description: This script will remove duplicate documents having the same name, keeping the most recently created one,
+merge duplicate directories of the tree having the same name under the same parent into the oldest one, and remove
+duplicate mappings of a tag to a document. Such duplicates could be created by concurrent saves before document names,
+tree paths and mappings were made unique, hence this script has to be executed before migrating the database to unique
+document names, tree paths and mappings. Only columns present before that migration are used, so it works on either
+side of it.
+To run this script execute, python manage.py merge_duplicate_notes
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+
+class Command(BaseCommand):
+    help = 'Removes duplicate documents having the same name, keeping the most recently created one'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS("Merging duplicate MyNotes documents"))
+
+        tables = connection.introspection.table_names()
+        removed = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("select name from mynotes_document group by name having count(*) > 1;")
+            for name, in cursor.fetchall():
+                cursor.execute("select id, data_id from mynotes_document where name = %s order by id desc;", [name])
+                (kept, _), *duplicates = cursor.fetchall()
+                document_ids = [document_id for document_id, _ in duplicates]
+                data_ids = [data_id for _, data_id in duplicates]
+
+                # Attachments are files uploaded by user, hence moved to the document kept instead of being removed
+                if 'mynotes_attachment' in tables:
+                    cursor.execute("update mynotes_attachment set document_id = %s where document_id in ({});".format(
+                        ', '.join(['%s'] * len(document_ids))), [kept] + document_ids)
+
+                # Other rows referring to duplicate documents and their data are removed first
+                for table in ('mynotes_tree', 'mynotes_mapping', 'mynotes_revision'):
+                    if table in tables:
+                        self.delete(cursor, table, 'document_id', document_ids)
+                self.delete(cursor, 'mynotes_document', 'id', document_ids)
+                if 'mynotes_chunk' in tables:
+                    self.delete(cursor, 'mynotes_chunk', 'data_id', data_ids)
+                self.delete(cursor, 'mynotes_data', 'id', data_ids)
+
+                self.stdout.write("Removed {} duplicates of document '{}'".format(len(duplicates), name))
+                removed += len(duplicates)
+
+            merged = self.merge_directories(cursor) if 'mynotes_tree' in tables else 0
+            mappings = self.remove_duplicate_mappings(cursor) if 'mynotes_mapping' in tables else 0
+
+        self.stdout.write(self.style.SUCCESS(
+            "Successfully removed {} duplicate documents, {} duplicate directories and {} duplicate mappings".format(
+                removed, merged, mappings)))
+
+    def merge_directories(self, cursor):
+        """Merge duplicate directories of the tree, i.e. directories having the same name under the same parent, into
+        the oldest one, moving their children under it. Merging directories can make their children duplicates in turn,
+        hence merging is repeated until no duplicates are left.
+
+        Args:
+            cursor: Database cursor
+
+        Returns:
+            Number of directories removed
+        """
+        merged = 0
+        while True:
+            cursor.execute("select parent_id, entity from mynotes_tree where document_id is null and id <> parent_id "
+                           "group by parent_id, entity having count(*) > 1;")
+            duplicated = cursor.fetchall()
+            if not duplicated:
+                return merged
+            for parent_id, entity in duplicated:
+                cursor.execute("select id from mynotes_tree where parent_id = %s and entity = %s "
+                               "and document_id is null and id <> parent_id order by id;", [parent_id, entity])
+                kept, *duplicates = [node_id for node_id, in cursor.fetchall()]
+                cursor.execute("update mynotes_tree set parent_id = %s where parent_id in ({});".format(
+                    ', '.join(['%s'] * len(duplicates))), [kept] + duplicates)
+                self.delete(cursor, 'mynotes_tree', 'id', duplicates)
+                self.stdout.write("Merged {} duplicates of directory '{}'".format(len(duplicates), entity))
+                merged += len(duplicates)
+
+    def remove_duplicate_mappings(self, cursor):
+        """Remove duplicate mappings of a tag to a document, keeping the oldest one
+
+        Args:
+            cursor: Database cursor
+
+        Returns:
+            Number of mappings removed
+        """
+        cursor.execute("delete from mynotes_mapping where id not in "
+                       "(select min(id) from mynotes_mapping group by document_id, tag_id);")
+        if cursor.rowcount:
+            self.stdout.write("Removed {} duplicate mappings".format(cursor.rowcount))
+        return cursor.rowcount
+
+    def delete(self, cursor, table, column, ids):
+        """Delete rows of a table
+
+        Args:
+            cursor: Database cursor
+            table (str): Table name
+            column (str): Column to be matched
+            ids (list): Values of column for rows to be deleted
+        """
+        cmd = "delete from {} where {} in ({});".format(table, column, ', '.join(['%s'] * len(ids)))
+        cursor.execute(cmd, ids)
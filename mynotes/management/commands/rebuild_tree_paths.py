@@ -0,0 +1,19 @@
+"""
+Description: This script will recompute materialized path of all the nodes in the tree.
+To run this script execute, python manage.py rebuild_tree_paths
+"""
+
+from django.core.management.base import BaseCommand
+
+from mynotes import dbutils
+
+
+class Command(BaseCommand):
+    help = 'Recomputes materialized path of all the nodes in the tree'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS("Rebuilding MyNotes tree paths"))
+
+        count = dbutils.rebuild_tree_paths()
+
+        self.stdout.write(self.style.SUCCESS("Successfully updated {} tree nodes".format(count)))
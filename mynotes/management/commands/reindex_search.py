@@ -0,0 +1,20 @@
+"""
+Description: This script will rebuild full-text search index and autocomplete terms of all the notes.
+To run this script execute, python manage.py reindex_search
+"""
+
+from django.core.management.base import BaseCommand
+
+from mynotes import dbutils
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds full-text search index and autocomplete terms of all the notes'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS("Rebuilding MyNotes search index"))
+
+        count = dbutils.rebuild_search_index()
+        term_count = dbutils.rebuild_terms()
+
+        self.stdout.write(self.style.SUCCESS("Successfully indexed {} notes and {} terms".format(count, term_count)))
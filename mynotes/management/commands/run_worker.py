@@ -0,0 +1,68 @@
+"""
+Description: This script will execute queued background jobs (search reindexing, tree repair, storage compaction and
+export) on a pool of processes, until it is stopped. Jobs left running by a previous run are queued again, hence only
+one worker is to be run per database.
+To run this script execute, python manage.py run_worker --processes 2
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mynotes import dbutils
+from mynotes import jobs
+
+
+class Command(BaseCommand):
+    help = 'Executes queued background jobs on a pool of processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Number of jobs executed at a time')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait before checking for new jobs')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due for execution')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        if processes < 1:
+            raise CommandError("Number of processes must be positive")
+
+        self.stdout.write(self.style.SUCCESS("Starting MyNotes worker with {} processes".format(processes)))
+        requeued = dbutils.requeue_running_jobs()
+        if requeued:
+            self.stdout.write("Queued again {} jobs left running by previous worker".format(requeued))
+
+        executed = 0
+        running = {}
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                                 initializer=jobs.initialize_worker) as executor:
+            while True:
+                for future in [future for future in running if future.done()]:
+                    job_id = running.pop(future)
+                    executed += 1
+                    # Outcome is recorded by the job itself, unless its process died
+                    error = future.exception()
+                    if error is None:
+                        self.stdout.write("Job {} {}".format(job_id, future.result()))
+                        continue
+                    dbutils.fail_job(job_id, "Worker process failed. Reason - {}".format(error))
+                    if isinstance(error, BrokenProcessPool):
+                        raise CommandError("Worker process died while executing job {}, restart the worker".format(
+                            job_id))
+
+                claimed = dbutils.claim_jobs(processes - len(running)) if len(running) < processes else []
+                for job in claimed:
+                    running[executor.submit(jobs.execute_job, job.pk)] = job.pk
+                    self.stdout.write("Started job {} ({}), attempt {}".format(job.pk, job.kind, job.attempts))
+
+                if options['once'] and not running and not claimed:
+                    break
+                time.sleep(options['poll_interval'])
+
+        self.stdout.write(self.style.SUCCESS("Successfully executed {} jobs".format(executed)))
@@ -0,0 +1,160 @@
+"""
+Description: This script will seed the database with synthetic daily notes, tags and tree hierarchy, to be used as a
+dataset for benchmarking. Seeding is deterministic for a given seed.
+To run this script execute, python manage.py seed_notes --years 5 --size 2000 --tags 20 --depth 4
+"""
+
+import datetime
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from mynotes import constants
+from mynotes import dbutils
+from mynotes import models
+from mynotes import utils
+
+# Words of synthetic notes, searching for any of these finds matches across the dataset
+VOCABULARY = (
+    'meeting', 'project', 'review', 'deadline', 'python', 'django', 'database', 'release', 'planning', 'reading',
+    'workout', 'groceries', 'travel', 'family', 'budget', 'invoice', 'backup', 'server', 'garden', 'recipe',
+    'journal', 'weekend', 'morning', 'evening', 'coffee', 'library', 'concert', 'doctor', 'birthday', 'holiday',
+)
+SEED_PREFIX = "seed-"
+SEED_DIRECTORY_FANOUT = 2
+
+
+class Command(BaseCommand):
+    help = 'Seeds the database with synthetic daily notes, tags and tree hierarchy for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', type=int, default=1, help='Number of years of daily notes, ending today')
+        parser.add_argument('--size', type=int, default=2000, help='Approximate size of every note in characters')
+        parser.add_argument('--tags', type=int, default=0, help='Number of distinct tags')
+        parser.add_argument('--tags-per-note', type=int, default=2, help='Number of tags attached to every note')
+        parser.add_argument('--depth', type=int, default=0,
+                            help='Depth of directory hierarchy created inside personal directory')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of random number generator')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of notes to be saved in a single transaction')
+
+    def handle(self, *args, **options):
+        if options['years'] < 1 or options['size'] < 1:
+            raise CommandError("Number of years and size of notes must be positive")
+        if options['tags'] and options['tags_per_note'] > options['tags']:
+            raise CommandError("Number of tags per note can not exceed number of tags")
+
+        self.stdout.write(self.style.SUCCESS("Seeding MyNotes database"))
+        start = time.time()
+        generator = random.Random(options['seed'])
+
+        created = self.seed_notes(generator, options['years'], options['size'], options['batch_size'])
+        tagged = self.seed_tags(generator, options['tags'], options['tags_per_note'])
+        directories = self.seed_tree(options['depth'])
+
+        self.stdout.write(self.style.SUCCESS(
+            "Successfully seeded {} notes, {} tag mappings and {} leaf directories in {:.1f}s".format(
+                created, tagged, directories, time.time() - start)))
+
+    def seed_notes(self, generator, years, size, batch_size):
+        """Seed daily notes of every day of last few years
+
+        Args:
+            generator (random.Random): Random number generator
+            years (int): Number of years
+            size (int): Approximate size of every note in characters
+            batch_size (int): Number of notes to be saved in a single transaction
+
+        Returns:
+            Number of notes created, dates already having a note are skipped
+        """
+        end = datetime.date(*utils.get_todays_date())
+        day = end - datetime.timedelta(days=365 * years - 1)
+        directories = {}
+        created = 0
+        batch = []
+        while day <= end:
+            batch.append((day.year, day.month, day.day, self.generate_content(generator, size)))
+            day += datetime.timedelta(days=1)
+            if len(batch) == batch_size or day > end:
+                created += dbutils.import_notes(batch, directories)
+                self.stdout.write("Seeded notes till {}".format(utils.get_formatted_date(*batch[-1][:3])))
+                batch = []
+        return created
+
+    @staticmethod
+    def generate_content(generator, size):
+        """Generate content of a note made up of lines of random words
+
+        Args:
+            generator (random.Random): Random number generator
+            size (int): Approximate size of content in characters
+
+        Returns:
+            Content of the note
+        """
+        lines = []
+        length = 0
+        while length < size:
+            line = ' '.join(generator.choice(VOCABULARY) for _ in range(generator.randint(4, 12)))
+            lines.append(line)
+            length += len(line) + 1
+        return '\n'.join(lines)[:size]
+
+    @staticmethod
+    def seed_tags(generator, count, tags_per_note):
+        """Seed tags and attach random tags to every daily note
+
+        Args:
+            generator (random.Random): Random number generator
+            count (int): Number of distinct tags
+            tags_per_note (int): Number of tags attached to every note
+
+        Returns:
+            Number of tag mappings created
+        """
+        if not count or not tags_per_note:
+            return 0
+        names = ["{}{}".format(SEED_PREFIX, index) for index in range(count)]
+        with transaction.atomic():
+            existing = set(models.Tag.objects.filter(tag__in=names).values_list('tag', flat=True))
+            models.Tag.objects.bulk_create([models.Tag(tag=name) for name in names if name not in existing])
+            tags = list(models.Tag.objects.filter(tag__in=names).order_by('pk').values_list('pk', flat=True))
+
+            # Only notes without any seeded tag are tagged, so reseeding does not duplicate mappings
+            tagged = models.Mapping.objects.filter(tag__in=tags).values('document')
+            documents = models.Document.objects.filter(
+                type__type=constants.DAILY_NOTES_DOCUMENT_TYPE
+            ).exclude(pk__in=tagged).order_by('pk').values_list('pk', flat=True)
+            mappings = [
+                models.Mapping(document_id=document, tag_id=tag)
+                for document in documents.iterator()
+                for tag in generator.sample(tags, tags_per_note)
+            ]
+            models.Mapping.objects.bulk_create(mappings)
+        dbutils.invalidate_note_index()
+        return len(mappings)
+
+    @staticmethod
+    def seed_tree(depth):
+        """Seed directory hierarchy of given depth inside personal directory, every directory has a fixed number of
+        sub-directories
+
+        Args:
+            depth (int): Depth of hierarchy
+
+        Returns:
+            Number of leaf directories
+        """
+        if depth < 1:
+            return 0
+        paths = [[constants.ROOT_DIRECTORY, constants.PERSONAL_DIRECTORY]]
+        for level in range(depth):
+            paths = [path + ["{}level-{}-{}".format(SEED_PREFIX, level + 1, index)]
+                     for path in paths for index in range(SEED_DIRECTORY_FANOUT)]
+        with transaction.atomic():
+            for path in paths:
+                dbutils.create_tree(path)
+        return len(paths)
@@ -4,8 +4,8 @@ To run this script execute, python manage.py setup
 """
 
 from django.core.management.base import BaseCommand
-from django.db import connection
 
+from mynotes import dbutils
 from mynotes import models
 from mynotes import constants
 
@@ -32,15 +32,12 @@ class Command(BaseCommand):
         models.DocumentType(type=constants.DAILY_NOTES_DOCUMENT_TYPE).save()
         models.DocumentType(type=constants.NOTES_DOCUMENT_TYPE).save()
 
-        # 5. Record "root" directory in tree
-        cmd= "insert into mynotes_tree values(0, 'root', null, 0);"
-        cursor = connection.cursor()
-        cursor.execute(cmd)
-        cursor.close()
+        # 5. Record "root" directory in tree, root is its own parent
+        models.Tree(id=0, entity=constants.ROOT_DIRECTORY, document=None, parent_id=0,
+                    path=constants.ROOT_DIRECTORY).save()
 
         # 6. Record 2 directories (daily-notes and personal) in root directory
-        root = models.Tree.objects.get(entity__exact=constants.ROOT_DIRECTORY)
-        models.Tree(entity=constants.DAILY_NOTES_DIRECTORY, parent=root, document=None).save()
-        models.Tree(entity=constants.PERSONAL_DIRECTORY, parent=root, document=None).save()
+        dbutils.create_tree([constants.ROOT_DIRECTORY, constants.DAILY_NOTES_DIRECTORY])
+        dbutils.create_tree([constants.ROOT_DIRECTORY, constants.PERSONAL_DIRECTORY])
 
         self.stdout.write(self.style.SUCCESS("Successfully setup MyNotes database"))
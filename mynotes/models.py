@@ -2,7 +2,11 @@
 Description: Models are defined in this module
 """
 
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.utils import timezone
+
+from . import constants
 
 
 class Encryption(models.Model):
@@ -20,10 +24,25 @@ class Data(models.Model):
     flag = models.CharField(max_length=30)
     encrypt_key = models.ForeignKey(to=Encryption, on_delete=models.CASCADE)
     mtime = models.TimeField()
+    # Used by PostgreSQL only, its GIN index is created once database is migrated
+    search_vector = SearchVectorField(null=True)
+    size = models.IntegerField(default=0)
+
+
+class Chunk(models.Model):
+    data = models.ForeignKey(to=Data, on_delete=models.CASCADE, related_name='chunks')
+    index = models.IntegerField()
+    offset = models.IntegerField()
+    length = models.IntegerField()
+    content = models.BinaryField()
+
+    class Meta:
+        ordering = ['index']
+        unique_together = ('data', 'index')
 
 
 class Tag(models.Model):
-    tag = models.CharField(max_length=30)
+    tag = models.CharField(max_length=30, unique=True)
 
 
 class DocumentType(models.Model):
@@ -31,20 +50,95 @@ class DocumentType(models.Model):
 
 
 class Document(models.Model):
-    name = models.CharField(max_length=30)
+    name = models.CharField(max_length=30, unique=True)
     type = models.ForeignKey(to=DocumentType, on_delete=models.CASCADE)
     data = models.ForeignKey(to=Data, on_delete=models.CASCADE)
+    date = models.DateField(null=True, db_index=True)
     ctime = models.TimeField()
     atime = models.TimeField()
     mtime = models.TimeField()
+    modified = models.DateTimeField(default=timezone.now, db_index=True)
+    # Number of saves, which versions the note, autosaves amending the latest revision are counted as well
+    revision = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['type', 'date']),
+        ]
+
+
+class Revision(models.Model):
+    document = models.ForeignKey(to=Document, on_delete=models.CASCADE, related_name='revisions')
+    number = models.IntegerField()
+    snapshot = models.BooleanField(default=False)
+    autosave = models.BooleanField(default=False)
+    content = models.BinaryField()
+    size = models.IntegerField()
+    ctime = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['number']
+        unique_together = ('document', 'number')
+
+
+class Attachment(models.Model):
+    document = models.ForeignKey(to=Document, on_delete=models.CASCADE, related_name='attachments')
+    data = models.ForeignKey(to=Data, on_delete=models.CASCADE)
+    digest = models.CharField(max_length=64, db_index=True)
+    name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=255)
+    ctime = models.DateTimeField(default=timezone.now)
+
+
+class Job(models.Model):
+    kind = models.CharField(max_length=30)
+    arguments = models.TextField(default='{}')
+    state = models.CharField(max_length=16, default=constants.JOB_QUEUED)
+    progress = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=constants.JOB_MAX_ATTEMPTS)
+    cancel_requested = models.BooleanField(default=False)
+    result = models.TextField(default='')
+    ctime = models.DateTimeField(default=timezone.now)
+    run_after = models.DateTimeField(default=timezone.now)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'run_after']),
+        ]
 
 
 class Tree(models.Model):
     entity = models.CharField(max_length=30)
     parent = models.ForeignKey(to='self', on_delete=models.CASCADE)
     document = models.ForeignKey(to=Document, on_delete=models.CASCADE, null=True)
+    # Null until rebuild_tree_paths backfills nodes created before paths were stored, nulls never collide
+    path = models.CharField(max_length=255, null=True, unique=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['parent', 'entity']),
+        ]
+
+
+class Term(models.Model):
+    # Vocabulary of notes for autocomplete and fuzzy matching, count is number of notes containing the term
+    term = models.CharField(max_length=constants.TERM_MAX_LENGTH, unique=True)
+    count = models.IntegerField(default=0)
+
+
+class CacheVersion(models.Model):
+    # Version of cached data shared by all the processes, renewed by whichever process changes the data
+    name = models.CharField(max_length=30, unique=True)
+    version = models.CharField(max_length=32)
 
 
 class Mapping(models.Model):
     document = models.ForeignKey(to=Document, on_delete=models.CASCADE)
     tag = models.ForeignKey(to=Tag, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('document', 'tag')
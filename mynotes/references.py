@@ -0,0 +1,148 @@
+"""
+Description: Process-wide cache of reference rows (data types, encryption keys, document types and root directory of
+the tree). These rows are effectively static, hence they are fetched on first use and invalidated whenever they change.
+"""
+
+import threading
+
+from . import constants
+from . import models
+
+# Field by which rows of each reference table are looked up
+REFERENCE_FIELDS = {
+    models.DataType: 'type',
+    models.Encryption: 'algo',
+    models.DocumentType: 'type',
+}
+
+_references = {}
+_lock = threading.Lock()
+
+
+def _load(model):
+    """Get all the rows of a reference table, fetching them from db if not cached
+
+    Args:
+        model (class): Reference model class
+
+    Returns:
+        Dictionary of model objects by their lookup field
+    """
+    objects = _references.get(model)
+    if objects is None:
+        field = REFERENCE_FIELDS[model]
+        objects = {getattr(obj, field): obj for obj in model.objects.all()}
+        with _lock:
+            _references[model] = objects
+    return objects
+
+
+def _get(model, value):
+    """Get a row of a reference table
+
+    Args:
+        model (class): Reference model class
+        value (str): Value of lookup field
+
+    Returns:
+        Model object
+
+    Raises:
+        model.DoesNotExist: If row does not exist
+    """
+    objects = _load(model)
+    if value not in objects:
+        # Row may have been added by another process, refresh once before giving up
+        invalidate(model)
+        objects = _load(model)
+    try:
+        return objects[value]
+    except KeyError:
+        raise model.DoesNotExist("{} '{}' not found! Please check if setup is executed.".format(model.__name__, value))
+
+
+def get_data_type(type):
+    """Get data type object
+
+    Args:
+        type (str): Data type, e.g. constants.TEXT_DATA_TYPE
+
+    Returns:
+        Model object for a data type
+    """
+    return _get(models.DataType, type)
+
+
+def get_encryption(algo):
+    """Get encryption object
+
+    Args:
+        algo (str): Encryption algorithm, e.g. constants.NO_ENCRYPTION_ALGORITHM
+
+    Returns:
+        Model object for an encryption
+    """
+    return _get(models.Encryption, algo)
+
+
+def get_document_type(type):
+    """Get document type object
+
+    Args:
+        type (str): Document type, e.g. constants.DAILY_NOTES_DOCUMENT_TYPE
+
+    Returns:
+        Model object for a document type
+    """
+    return _get(models.DocumentType, type)
+
+
+def get_document_types():
+    """Get all the document types
+
+    Returns:
+        List of document types
+    """
+    return list(_load(models.DocumentType))
+
+
+def get_root_directory():
+    """Get root directory node of the tree
+
+    Returns:
+        Model object for a tree node
+    """
+    root = _references.get(models.Tree)
+    if root is None:
+        try:
+            root = models.Tree.objects.get(path=constants.ROOT_DIRECTORY, document=None)
+        except models.Tree.DoesNotExist:
+            raise Exception("Entry '{}' not found in the tree! Please check if setup is executed.".format(
+                constants.ROOT_DIRECTORY))
+        with _lock:
+            _references[models.Tree] = root
+    return root
+
+
+def invalidate(model):
+    """Drop cached rows of a reference table
+
+    Args:
+        model (class): Reference model class
+    """
+    with _lock:
+        _references.pop(model, None)
+
+
+def on_reference_changed(sender, **kwargs):
+    """Signal handler to invalidate cached rows when a reference table changes
+    """
+    invalidate(sender)
+
+
+def on_tree_changed(sender, instance, **kwargs):
+    """Signal handler to invalidate cached root directory when it changes
+    """
+    root = _references.get(models.Tree)
+    if instance.path == constants.ROOT_DIRECTORY or (root is not None and root.pk == instance.pk):
+        invalidate(models.Tree)
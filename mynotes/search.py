@@ -0,0 +1,288 @@
+"""
+Description: Full-text search index of notes, picked by vendor of the database connection so that callers use the
+same API on every backend. On PostgreSQL, search vector of every data record is saved in its search_vector column
+backed by a GIN index. On SQLite, content is indexed by an FTS5 virtual table whose rowid is id of the data record.
+"""
+
+import time
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import F, FloatField, Q, TextField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+from . import constants
+from . import models
+from . import storage
+from . import utils
+
+POSTGRES_INDEX_QUERY = (
+    "create index if not exists mynotes_data_search_vector_gin on mynotes_data using gin (search_vector);"
+)
+
+FTS_TABLE_QUERY = (
+    "create virtual table if not exists mynotes_data_fts using fts5(content, tokenize = 'porter unicode61');"
+)
+FTS_DELETE_QUERY = "delete from mynotes_data_fts where rowid = %s;"
+FTS_INSERT_QUERY = "insert into mynotes_data_fts (rowid, content) values (%s, %s);"
+# FTS5 table is joined with documents, so that matching and ranking are done by a single full-text query. bm25 is lower
+# for more relevant rows, hence negated to rank higher for more relevant rows like ts_rank.
+FTS_JOIN_CONDITIONS = ["mynotes_data_fts.rowid = mynotes_document.data_id", "mynotes_data_fts match %s"]
+FTS_RANK = "-bm25(mynotes_data_fts)"
+FTS_BATCH_SIZE = 500
+# Number of SQLite virtual machine instructions between checks of deadline of a query
+SQLITE_PROGRESS_INTERVAL = 1000
+
+
+def is_postgres():
+    """Check if database is PostgreSQL, otherwise it is SQLite
+
+    Returns:
+        True for PostgreSQL
+    """
+    return connection.vendor == 'postgresql'
+
+
+def get_search_vector(content):
+    """Get expression computing full-text search vector of content, to be saved along with data record
+
+    Args:
+        content (str): Content of the data
+
+    Returns:
+        Search vector expression, None if database keeps search index outside data records
+    """
+    if not is_postgres():
+        return None
+    return SearchVector(Value(content, output_field=TextField()), config=constants.SEARCH_CONFIG)
+
+
+def sync_index(data, content):
+    """Bring search index kept outside data records in sync with a data record just written. Search vector saved
+    along with the record is all the index needed on PostgreSQL.
+
+    Args:
+        data (models.Data): Data object just written
+        content (str): Content of the data
+    """
+    if not is_postgres():
+        _write_fts_rows([(data.pk, content)])
+
+
+def index_content(data, content):
+    """Refresh search index of a data record
+
+    Args:
+        data (models.Data): Data object whose content is changed
+        content (str): New content of the data
+    """
+    if is_postgres():
+        models.Data.objects.filter(pk=data.pk).update(search_vector=get_search_vector(content))
+    else:
+        _write_fts_rows([(data.pk, content)])
+
+
+def index_contents(data_list, contents):
+    """Index content of newly created data records in bulk
+
+    Args:
+        data_list (list): Data objects
+        contents (list): Content of each data object
+    """
+    if not is_postgres():
+        _write_fts_rows([(data.pk, content) for data, content in zip(data_list, contents)])
+        return
+    # Inline content is indexed right inside the db, chunked content one record at a time
+    models.Data.objects.filter(
+        pk__in=[data.pk for data in data_list], size__lte=constants.INLINE_CONTENT_LIMIT
+    ).update(search_vector=SearchVector('data', config=constants.SEARCH_CONFIG))
+    for data, content in zip(data_list, contents):
+        if storage.is_chunked(data):
+            index_content(data, content)
+
+
+def rebuild_index(progress=None):
+    """Rebuild search index of all the text data records
+
+    Args:
+        progress (callable): Called with number of data records indexed so far and total number of data records
+
+    Returns:
+        Number of data records indexed
+    """
+    text_data = models.Data.objects.filter(type__type=constants.TEXT_DATA_TYPE)
+    total = text_data.count() if progress else 0
+    if is_postgres():
+        count = text_data.filter(size__lte=constants.INLINE_CONTENT_LIMIT).update(
+            search_vector=SearchVector('data', config=constants.SEARCH_CONFIG)
+        )
+        for data in text_data.filter(size__gt=constants.INLINE_CONTENT_LIMIT).iterator():
+            if progress and count % FTS_BATCH_SIZE == 0:
+                progress(count, total)
+            index_content(data, storage.read_content(data))
+            count += 1
+        return count
+
+    with connection.cursor() as cursor:
+        cursor.execute("delete from mynotes_data_fts;")
+    # Records are fetched in batches, a read cursor left open while writing would hold the database write lock until
+    # the whole index is rebuilt
+    count = 0
+    data_ids = list(text_data.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(data_ids), FTS_BATCH_SIZE):
+        batch = text_data.filter(pk__in=data_ids[start:start + FTS_BATCH_SIZE])
+        count += _insert_fts_rows([(data.pk, storage.read_content(data)) for data in batch])
+        if progress:
+            progress(count, total)
+    return count
+
+
+def prune_index():
+    """Remove search index of data records which no longer exist, search vector saved along with a data record is
+    removed along with the record itself
+
+    Returns:
+        Number of entries removed
+    """
+    if is_postgres():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute("delete from mynotes_data_fts where rowid not in (select id from mynotes_data);")
+        return cursor.rowcount
+
+
+def get_prefix_condition(field, prefix):
+    """Get condition matching rows whose field starts with a prefix, in a way served by the index of the field. On
+    PostgreSQL, LIKE is served by the pattern index Django creates along with index of a text field. On SQLite, LIKE
+    is case-insensitive and not served by an index, whereas range comparison is.
+
+    Args:
+        field (str): Name of a text field
+        prefix (str): Non-empty prefix
+
+    Returns:
+        Q object
+    """
+    if is_postgres():
+        return Q(**{field + '__startswith': prefix})
+    low, high = utils.get_prefix_range(prefix)
+    return Q(**{field + '__gte': low, field + '__lt': high})
+
+
+def fetch_within_budget(queryset, deadline):
+    """Fetch rows of a query which is cancelled by database once deadline passes. On PostgreSQL, query is cancelled by
+    statement_timeout of its transaction. On SQLite, query is interrupted by a progress handler checking deadline.
+
+    Args:
+        queryset (QuerySet): Query of rows, sliced to the number of rows needed
+        deadline (float): time.monotonic() deadline, None for no deadline
+
+    Returns:
+        Tuple of list of rows, and flag which is False if deadline has passed
+    """
+    if deadline is None:
+        return list(queryset), True
+    budget = int((deadline - time.monotonic()) * 1000)
+    if budget <= 0:
+        return [], False
+    if is_postgres():
+        # A local setting lasts until the outermost transaction ends rather than the savepoint, hence timeout is set
+        # back afterwards when query runs within a transaction already
+        restore = connection.in_atomic_block
+        with transaction.atomic(), connection.cursor() as cursor:
+            if restore:
+                cursor.execute("show statement_timeout;")
+                timeout = cursor.fetchone()[0]
+            cursor.execute("set local statement_timeout = %s;", [budget])
+            try:
+                with transaction.atomic():
+                    return list(queryset), True
+            except OperationalError:
+                return [], False
+            finally:
+                if restore:
+                    cursor.execute("select set_config('statement_timeout', %s, true);", [timeout])
+
+    connection.ensure_connection()
+    connection.connection.set_progress_handler(lambda: time.monotonic() > deadline, SQLITE_PROGRESS_INTERVAL)
+    try:
+        return list(queryset), True
+    except OperationalError:
+        return [], False
+    finally:
+        connection.connection.set_progress_handler(None, 0)
+
+
+def filter_documents(documents, search_str):
+    """Filter documents whose data matches search string, all the words of search string have to match
+
+    Args:
+        documents (QuerySet): Documents to be filtered
+        search_str (str): Search string
+
+    Returns:
+        Queryset of matching documents annotated by rank, higher for more relevant documents
+    """
+    if is_postgres():
+        query = SearchQuery(search_str, config=constants.SEARCH_CONFIG)
+        # ts_rank is real, cast to double precision so that ranks compared against a cursor keep their exact value
+        return documents.filter(data__search_vector=query).annotate(
+            rank=Cast(SearchRank(F('data__search_vector'), query), FloatField())
+        )
+
+    query = get_fts_query(search_str)
+    if not query:
+        return documents.none()
+    return documents.extra(tables=['mynotes_data_fts'], where=FTS_JOIN_CONDITIONS, params=[query]).annotate(
+        rank=RawSQL(FTS_RANK, [], output_field=FloatField())
+    )
+
+
+def get_fts_query(search_str):
+    """Convert search string into FTS5 query matching all of its words, taken literally
+
+    Args:
+        search_str (str): Search string
+
+    Returns:
+        FTS5 query string, empty if search string has no words
+    """
+    return ' '.join('"{}"'.format(word.replace('"', '""')) for word in search_str.split())
+
+
+def _write_fts_rows(rows):
+    """Replace rows of FTS5 table
+
+    Args:
+        rows (list): Tuples containing data id and its content
+    """
+    with connection.cursor() as cursor:
+        cursor.executemany(FTS_DELETE_QUERY, [(pk,) for pk, _ in rows])
+    _insert_fts_rows(rows)
+
+
+def _insert_fts_rows(rows):
+    """Insert rows into FTS5 table
+
+    Args:
+        rows (list): Tuples containing data id and its content
+
+    Returns:
+        Number of rows inserted
+    """
+    if rows:
+        with connection.cursor() as cursor:
+            cursor.executemany(FTS_INSERT_QUERY, rows)
+    return len(rows)
+
+
+def on_post_migrate(sender, using, **kwargs):
+    """Create search index structures Django migrations can not express, once database is migrated
+    """
+    database = connections[using]
+    with database.cursor() as cursor:
+        if database.vendor == 'postgresql':
+            cursor.execute(POSTGRES_INDEX_QUERY)
+        elif database.vendor == 'sqlite':
+            cursor.execute(FTS_TABLE_QUERY)
@@ -0,0 +1,24 @@
+"""
+Description: Embedded deployment on SQLite. Every new connection is tuned by pragmas, write-ahead log lets readers
+proceed concurrently with a writer and memory-mapped reads avoid a system call per page.
+"""
+
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'wal'),
+    # With write-ahead log, syncing only at checkpoints still keeps the database consistent
+    ('synchronous', 'normal'),
+    ('busy_timeout', 5000),
+    ('cache_size', -64 * 1024),
+    ('temp_store', 'memory'),
+    ('mmap_size', 256 * 1024 * 1024),
+)
+
+
+def on_connection_created(sender, connection, **kwargs):
+    """Apply pragmas to a new SQLite connection
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in SQLITE_PRAGMAS:
+            cursor.execute("pragma {} = {};".format(pragma, value))
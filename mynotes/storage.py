@@ -0,0 +1,178 @@
+"""
+Description: Content storage of notes. Short content is kept inline in Data record whereas long content is split
+into compressed chunks, so that it can be read by range or streamed without loading it as a whole
+"""
+
+import zlib
+
+from django.db.models import F
+
+from . import constants
+from . import models
+
+
+def is_chunked(data):
+    """Check if content of a data record is stored in chunks
+
+    Args:
+        data (models.Data): Data object
+
+    Returns:
+        True if content is stored in chunks, False if it is stored inline
+    """
+    return data.size > constants.INLINE_CONTENT_LIMIT
+
+
+def get_content_size(data):
+    """Get length of content of a data record
+
+    Args:
+        data (models.Data): Data object
+
+    Returns:
+        Number of characters in the content
+    """
+    return data.size if is_chunked(data) else len(data.data)
+
+
+def prepare_content(data, content):
+    """Set content of an unsaved data record and build compressed chunks of long content
+
+    Args:
+        data (models.Data): Data object
+        content (str): Content to be stored
+
+    Returns:
+        List of unsaved chunk objects, their data has to be assigned once data record is saved
+    """
+    data.size = len(content)
+    data.data = '' if is_chunked(data) else content
+    if not is_chunked(data):
+        return []
+    return [models.Chunk(index=index, offset=offset, length=len(part), content=compress(part))
+            for index, (offset, part) in enumerate(split_content(content))]
+
+
+def write_content(data, content, previous=None):
+    """Save data record along with its content, splitting long content into compressed chunks
+
+    Args:
+        data (models.Data): Data object, saved as well if it is new
+        content (str): Content to be stored
+        previous (str): Content currently stored, if known only chunks whose part of content changed are rewritten
+    """
+    had_chunks = data.pk is not None and is_chunked(data)
+    chunks = prepare_content(data, content)
+    data.save()
+
+    if had_chunks:
+        unchanged = set()
+        if previous is not None:
+            previous_parts = [part for _, part in split_content(previous)]
+            unchanged = {index for index, (_, part) in enumerate(split_content(content))
+                         if index < len(previous_parts) and previous_parts[index] == part}
+        models.Chunk.objects.filter(data=data).exclude(index__in=unchanged).delete()
+        chunks = [chunk for chunk in chunks if chunk.index not in unchanged]
+    for chunk in chunks:
+        chunk.data = data
+    models.Chunk.objects.bulk_create(chunks)
+
+
+def read_content(data):
+    """Read complete content of a data record
+
+    Args:
+        data (models.Data): Data object
+
+    Returns:
+        Content
+    """
+    if not is_chunked(data):
+        return data.data
+    return ''.join(decompress(chunk.content) for chunk in data.chunks.all())
+
+
+def read_content_range(data, start, end=None):
+    """Read part of content of a data record, fetching only the chunks overlapping the range
+
+    Args:
+        data (models.Data): Data object
+        start (int): Offset of first character
+        end (int): Offset after last character, None to read till end
+
+    Returns:
+        Content from start till end
+
+    Raises:
+        ValueError: If start or end is negative
+    """
+    # Negative offsets would count from the end of inline content but not of chunked content
+    if start < 0 or (end is not None and end < 0):
+        raise ValueError("Offsets must not be negative, got start {} and end {}".format(start, end))
+    if not is_chunked(data):
+        return data.data[start:end]
+
+    end = data.size if end is None else min(end, data.size)
+    if start >= end:
+        return ''
+    chunks = models.Chunk.objects.filter(data=data, offset__lt=end).annotate(
+        end=F('offset') + F('length')
+    ).filter(end__gt=start)
+    content = []
+    for chunk in chunks:
+        part = decompress(chunk.content)
+        content.append(part[max(start - chunk.offset, 0):end - chunk.offset])
+    return ''.join(content)
+
+
+def stream_content(data):
+    """Stream content of a data record, decompressing one chunk at a time
+
+    Args:
+        data (models.Data): Data object
+
+    Yields:
+        Parts of content in order
+    """
+    if not is_chunked(data):
+        yield data.data
+        return
+    for chunk in models.Chunk.objects.filter(data=data).iterator(chunk_size=1):
+        yield decompress(chunk.content)
+
+
+def split_content(content):
+    """Split content into parts of constants.CONTENT_CHUNK_SIZE characters
+
+    Args:
+        content (str): Content to be split
+
+    Returns:
+        List of tuples containing offset and part of content
+    """
+    return [(offset, content[offset:offset + constants.CONTENT_CHUNK_SIZE])
+            for offset in range(0, len(content), constants.CONTENT_CHUNK_SIZE)]
+
+
+def compress(content):
+    """Compress a part of content
+
+    Args:
+        content (str): Content
+
+    Returns:
+        Compressed bytes
+    """
+    return zlib.compress(content.encode('utf-8'), constants.CONTENT_COMPRESSION_LEVEL)
+
+
+def decompress(content):
+    """Decompress a part of content compressed by compress()
+
+    Args:
+        content (bytes): Compressed bytes
+
+    Returns:
+        Content
+    """
+    return zlib.decompress(content).decode('utf-8')
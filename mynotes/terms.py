@@ -0,0 +1,392 @@
+"""
+Description: Vocabulary of notes for autocomplete and fuzzy matching, picked by vendor of the database connection like
+search index. Terms are counted in Term table once notes written are committed. On PostgreSQL, terms are matched
+through a pg_trgm GIN index, elsewhere through a trigram index kept in process memory and loaded from Term table
+periodically.
+"""
+
+import bisect
+import heapq
+import logging
+import math
+import threading
+import time
+from collections import Counter
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models import F
+
+from . import constants
+from . import models
+from . import search
+from . import storage
+from . import utils
+
+POSTGRES_TRIGRAM_QUERIES = (
+    "create extension if not exists pg_trgm;",
+    "create index if not exists mynotes_term_term_trgm on mynotes_term using gin (term gin_trgm_ops);",
+)
+# Keeps number of variables of a query within the limit of SQLite
+TERM_BATCH_SIZE = 500
+# Terms are inserted in the order given, which is sorted
+TERM_COUNT_QUERY = ("insert into mynotes_term (term, count) values {} "
+                    "on conflict (term) do update set count = mynotes_term.count + excluded.count;")
+
+logger = logging.getLogger(__name__)
+
+
+class TermIndex:
+    """Trigram index of terms kept in process memory. Index is loaded from Term table in a background thread once it is
+    older than constants.TERM_INDEX_TTL, while terms of notes written by this process are applied to it as they are
+    committed.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # time.monotonic() at which Term table was read for the loaded index, None if never loaded
+        self.loaded = None
+        self.loader = None
+        # Deltas committed while index is being loaded, along with time.monotonic() of their commit
+        self.pending = []
+        # Replaced as a whole when index is loaded, so that readers never see a half loaded index
+        self.state = ({}, [], {})
+
+    def is_stale(self):
+        """Check if index has to be loaded again
+
+        Returns:
+            True if index was never loaded or is older than constants.TERM_INDEX_TTL
+        """
+        return self.loaded is None or time.monotonic() - self.loaded > constants.TERM_INDEX_TTL
+
+    def load(self):
+        """Load index from Term table. Deltas committed before Term table is read are already counted by it, those
+        committed later are applied to the loaded index.
+        """
+        try:
+            snapshot = time.monotonic()
+            counts = dict(models.Term.objects.filter(count__gt=0).values_list('term', 'count'))
+            trigrams = {}
+            for term in counts:
+                for trigram in utils.get_trigrams(term):
+                    trigrams.setdefault(trigram, []).append(term)
+            state = (counts, sorted(counts), trigrams)
+            with self.lock:
+                for committed, deltas in self.pending:
+                    if committed >= snapshot:
+                        self._apply(state, deltas)
+                self.state = state
+                self.loaded = snapshot
+        except Exception:
+            logger.exception("Loading of term index failed")
+        finally:
+            with self.lock:
+                self.pending = []
+                self.loader = None
+            # Thread has a connection of its own
+            connection.close()
+
+    def apply(self, deltas, committed):
+        """Apply changes of counts of terms to a loaded index
+
+        Args:
+            deltas (dict): Change of count by term
+            committed (float): time.monotonic() at which deltas were committed
+        """
+        with self.lock:
+            if self.loader is not None:
+                self.pending.append((committed, deltas))
+            if self.loaded is not None and committed >= self.loaded:
+                self._apply(self.state, deltas)
+
+    @staticmethod
+    def _apply(state, deltas):
+        """Apply changes of counts of terms to state of index
+
+        Args:
+            state (tuple): Dictionary of counts by term, sorted list of terms and dictionary of terms by trigram
+            deltas (dict): Change of count by term
+        """
+        counts, terms, trigrams = state
+        for term, delta in deltas.items():
+            if term not in counts:
+                if delta <= 0:
+                    continue
+                bisect.insort(terms, term)
+                for trigram in utils.get_trigrams(term):
+                    trigrams.setdefault(trigram, []).append(term)
+            counts[term] = counts.get(term, 0) + delta
+
+    def get_state(self, wait=False):
+        """Get index, starting to load it in a background thread if stale. Meanwhile, a stale index keeps being used,
+        so that a request never loads index itself.
+
+        Args:
+            wait (bool): Wait for index to be loaded if it was never loaded
+
+        Returns:
+            Tuple of dictionary of counts by term, sorted list of terms and dictionary of terms by trigram, and flag
+            which is False if index was never loaded
+        """
+        if self.is_stale():
+            with self.lock:
+                if self.loader is None:
+                    self.loader = threading.Thread(target=self.load, daemon=True)
+                    self.loader.start()
+                loader = self.loader
+            if wait and self.loaded is None:
+                loader.join()
+        return self.state, self.loaded is not None
+
+
+_index = TermIndex()
+
+
+def update_terms(previous, content):
+    """Count terms added to a note and discount terms removed from it, once the transaction saving the note commits
+
+    Args:
+        previous (str): Content before save, empty if note is newly created
+        content (str): Content after save
+    """
+    old, new = utils.extract_terms(previous), utils.extract_terms(content)
+    deltas = dict.fromkeys(new - old, 1)
+    deltas.update(dict.fromkeys(old - new, -1))
+    _apply_deltas(deltas)
+
+
+def add_terms(contents):
+    """Count terms of notes newly created in bulk, once the transaction creating them commits
+
+    Args:
+        contents (list): Contents of the notes
+    """
+    deltas = Counter()
+    for content in contents:
+        deltas.update(utils.extract_terms(content))
+    _apply_deltas(deltas)
+
+
+def _apply_deltas(deltas):
+    """Apply changes of counts to Term table once the transaction writing notes commits. Terms shared by many notes are
+    counted by every save, hence they are counted outside the transaction saving a note, so that the lock of a note is
+    never held while waiting for locks of terms.
+
+    Args:
+        deltas (dict): Change of count by term
+    """
+    deltas = {term: delta for term, delta in deltas.items() if delta}
+    if deltas:
+        transaction.on_commit(lambda: _count_terms(deltas))
+
+
+def _count_terms(deltas):
+    """Apply changes of counts to Term table, creating terms seen for the first time. Counts are updated relative to
+    the stored count, so that concurrent saves of different notes are not lost. Every statement is a transaction of
+    its own which locks its terms in sorted order, hence concurrent counts never deadlock. Counts missed by a failure
+    are recounted by rebuild_terms.
+
+    Args:
+        deltas (dict): Change of count by term
+    """
+    added = sorted(term for term, delta in deltas.items() if delta > 0)
+    removed = {}
+    for term in sorted(term for term, delta in deltas.items() if delta < 0):
+        removed.setdefault(deltas[term], []).append(term)
+    try:
+        with connection.cursor() as cursor:
+            # Two parameters per term
+            for start in range(0, len(added), TERM_BATCH_SIZE // 2):
+                batch = added[start:start + TERM_BATCH_SIZE // 2]
+                cursor.execute(TERM_COUNT_QUERY.format(', '.join(['(%s, %s)'] * len(batch))),
+                               [value for term in batch for value in (term, deltas[term])])
+        # Terms never counted (e.g. of notes saved before terms were counted) are not discounted
+        for delta, group in sorted(removed.items()):
+            for start in range(0, len(group), TERM_BATCH_SIZE):
+                models.Term.objects.filter(term__in=group[start:start + TERM_BATCH_SIZE]).update(
+                    count=F('count') + delta)
+    except DatabaseError:
+        logger.exception("Counting of terms failed, counts are corrected by rebuilding terms")
+        return
+    if not search.is_postgres():
+        _index.apply(deltas, time.monotonic())
+
+
+def rebuild_terms(progress=None):
+    """Recount terms of all the notes from their content
+
+    Args:
+        progress (callable): Called with number of notes counted so far and total number of notes
+
+    Returns:
+        Number of distinct terms
+    """
+    data_ids = list(models.Document.objects.filter(
+        data__type__type=constants.TEXT_DATA_TYPE
+    ).order_by('data').values_list('data', flat=True))
+    counts = Counter()
+    for start in range(0, len(data_ids), TERM_BATCH_SIZE):
+        for data in models.Data.objects.filter(pk__in=data_ids[start:start + TERM_BATCH_SIZE]):
+            counts.update(utils.extract_terms(storage.read_content(data)))
+        if progress:
+            progress(min(start + TERM_BATCH_SIZE, len(data_ids)), len(data_ids))
+
+    with transaction.atomic():
+        models.Term.objects.all().delete()
+        models.Term.objects.bulk_create([models.Term(term=term, count=count) for term, count in counts.items()])
+    _index.loaded = None
+    return len(counts)
+
+
+def prune_terms():
+    """Remove terms no longer found in any note
+
+    Returns:
+        Number of terms removed
+    """
+    return models.Term.objects.filter(count__lte=0).delete()[0]
+
+
+def suggest_terms(prefix, limit=constants.AUTOCOMPLETE_LIMIT, deadline=None):
+    """Suggest terms completing a prefix, most frequent first. When prefix has fewer completions than limit, they are
+    followed by terms similar to the prefix, which tolerates typos, most similar first.
+
+    Args:
+        prefix (str): Prefix of a term
+        limit (int): Maximum number of suggestions
+        deadline (float): time.monotonic() by which suggestions are needed, None for no deadline
+
+    Returns:
+        Tuple of list of tuples containing term and its count, and flag which is False if matching ran out of time
+    """
+    prefix = prefix.lower()
+    if not prefix:
+        return [], True
+    suggestions, complete = _get_prefixed_terms(prefix, limit, deadline)
+    if complete and len(suggestions) < limit and len(prefix) >= constants.TERM_MIN_LENGTH:
+        similar, complete = _get_similar_terms(prefix, limit, deadline)
+        suggested = {term for term, _ in suggestions}
+        suggestions += [(term, count) for term, count in similar if term not in suggested][:limit - len(suggestions)]
+    return suggestions, complete
+
+
+def correct_words(words, deadline=None):
+    """Correct words not found in any note to a similar term. Among similar terms, the one more likely meant is
+    picked by weighing similarity by how common the term is, so that a rare near-miss does not win over a common word.
+
+    Args:
+        words (list): Words, e.g. of a search string
+        deadline (float): time.monotonic() by which correction is needed, None for no deadline
+
+    Returns:
+        List of corrected words, same as words if none of them is corrected
+    """
+    candidates = {word.lower() for word in words} & utils.extract_terms(' '.join(words))
+    unknown = candidates - _get_known_terms(candidates)
+    corrections = {}
+    for word in unknown:
+        similar, _ = _get_similar_terms(word, constants.CORRECTION_CANDIDATES, deadline)
+        if similar:
+            corrections[word] = max(similar, key=lambda candidate: utils.get_trigram_similarity(
+                word, candidate[0]) * math.log1p(candidate[1]))[0]
+    return [corrections.get(word.lower(), word) for word in words]
+
+
+def _is_late(deadline):
+    """Check if deadline has passed
+
+    Args:
+        deadline (float): time.monotonic() deadline, None for no deadline
+
+    Returns:
+        True if deadline has passed
+    """
+    return deadline is not None and time.monotonic() > deadline
+
+
+def _get_known_terms(terms):
+    """Get terms found in at least one note
+
+    Args:
+        terms (set): Terms to be looked up
+
+    Returns:
+        Set of terms found
+    """
+    if search.is_postgres():
+        return set(models.Term.objects.filter(term__in=terms, count__gt=0).values_list('term', flat=True))
+    (counts, _, _), _ = _index.get_state(wait=True)
+    return {term for term in terms if counts.get(term, 0) > 0}
+
+
+def _get_prefixed_terms(prefix, limit, deadline):
+    """Get most frequent terms starting with a prefix
+
+    Args:
+        prefix (str): Lowercase prefix
+        limit (int): Maximum number of terms
+        deadline (float): time.monotonic() deadline, None for no deadline
+
+    Returns:
+        Tuple of list of tuples containing term and its count, and flag which is False if deadline has passed
+    """
+    if search.is_postgres():
+        return search.fetch_within_budget(models.Term.objects.filter(
+            term__startswith=prefix, count__gt=0
+        ).order_by('-count', 'term').values_list('term', 'count')[:limit], deadline)
+
+    (counts, terms, _), loaded = _index.get_state(wait=deadline is None)
+    if not loaded:
+        return [], False
+    low, high = utils.get_prefix_range(prefix)
+    completions = terms[bisect.bisect_left(terms, low):bisect.bisect_left(terms, high)]
+    suggestions = heapq.nsmallest(limit, (term for term in completions if counts.get(term, 0) > 0),
+                                  key=lambda term: (-counts[term], term))
+    return [(term, counts[term]) for term in suggestions], not _is_late(deadline)
+
+
+def _get_similar_terms(term, limit, deadline):
+    """Get terms whose trigram similarity with a term is at least constants.TRIGRAM_SIMILARITY_THRESHOLD, most
+    similar first
+
+    Args:
+        term (str): Lowercase term
+        limit (int): Maximum number of terms
+        deadline (float): time.monotonic() deadline, None for no deadline
+
+    Returns:
+        Tuple of list of tuples containing term and its count, and flag which is False if deadline has passed
+    """
+    if search.is_postgres():
+        # % operator is served by the trigram index, its threshold is pg_trgm.similarity_threshold (0.3 by default)
+        return search.fetch_within_budget(models.Term.objects.filter(term__trigram_similar=term, count__gt=0).annotate(
+            similarity=TrigramSimilarity('term', term)
+        ).order_by('-similarity', '-count', 'term').values_list('term', 'count')[:limit], deadline)
+
+    (counts, _, trigrams), loaded = _index.get_state(wait=deadline is None)
+    if not loaded:
+        return [], False
+    query = utils.get_trigrams(term)
+    shared = Counter()
+    for trigram in query:
+        if _is_late(deadline):
+            return [], False
+        shared.update(trigrams.get(trigram, ()))
+    similar = []
+    for candidate, count in shared.items():
+        similarity = count / (len(query) + len(utils.get_trigrams(candidate)) - count)
+        if similarity >= constants.TRIGRAM_SIMILARITY_THRESHOLD and counts.get(candidate, 0) > 0:
+            similar.append((-similarity, -counts[candidate], candidate))
+    return [(candidate, counts[candidate]) for _, _, candidate in heapq.nsmallest(limit, similar)], True
+
+
+def on_post_migrate(sender, using, **kwargs):
+    """Create trigram index of terms on PostgreSQL, once database is migrated
+    """
+    database = connections[using]
+    if database.vendor != 'postgresql':
+        return
+    with database.cursor() as cursor:
+        for query in POSTGRES_TRIGRAM_QUERIES:
+            cursor.execute(query)
@@ -1,3 +1,1119 @@
-from django.test import TestCase
+"""
+Description: Tests of utilities, content storage, views and management commands of notes
+"""
 
-# Create your tests here.
+import datetime
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import blobstore
+from . import constants
+from . import dbutils
+from . import jobs
+from . import models
+from . import references
+from . import storage
+from . import terms
+from . import utils
+
+
+def setup_database():
+    """Create entries of reference tables which every note depends on, as done by setup command
+    """
+    call_command('setup', stdout=io.StringIO())
+
+
+class SearchCursorTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        for rank, pk in ((0.0607927, 42), (-12.5, 1), (1e-20, 7)):
+            with self.subTest(rank=rank, pk=pk):
+                self.assertEqual(utils.decode_search_cursor(utils.encode_search_cursor(rank, pk)), (rank, pk))
+
+    def test_malformed_cursor(self):
+        for cursor in ("", "not a cursor", utils.encode_search_cursor(0.5, 1)[:-4],
+                       utils.encode_search_cursor("rank", 1), utils.encode_search_cursor(0.5, "pk")):
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                utils.decode_search_cursor(cursor)
+
+
+class SearchPagingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        setup_database()
+        for day in range(1, 8):
+            # Notes mentioning the word more often rank higher, some of them rank the same
+            dbutils.save_note(2019, 1, day, "apple " * (day % 3 + 1) + "pie")
+        dbutils.save_note(2019, 1, 8, "banana")
+
+    def test_pages_cover_every_hit_once(self):
+        names, cursor = [], None
+        while True:
+            page, cursor = dbutils.search_data_in_documents("apple", cursor=cursor, limit=3)
+            self.assertLessEqual(len(page), 3)
+            names.extend(name for name, _ in page)
+            if cursor is None:
+                break
+        self.assertEqual(len(names), 7)
+        self.assertEqual(set(names), {utils.generate_notes_file_name(2019, 1, day).replace('-', '/')
+                                      for day in range(1, 8)})
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            dbutils.search_data_in_documents("apple", cursor="not a cursor")
+
+
+class TreeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        setup_database()
+
+    def test_create_tree(self):
+        path = [constants.ROOT_DIRECTORY, constants.PERSONAL_DIRECTORY, "projects", "mynotes"]
+        dbutils.create_tree(path)
+        dbutils.create_tree(path + ["design"])
+        node = dbutils.get_tree_node(path)
+        self.assertEqual(node.path, dbutils.get_tree_path(path))
+        self.assertEqual(node.parent.path, dbutils.get_tree_path(path[:-1]))
+        self.assertEqual(models.Tree.objects.filter(entity="mynotes").count(), 1)
+
+    def test_directory_created_concurrently(self):
+        path = [constants.ROOT_DIRECTORY, constants.PERSONAL_DIRECTORY]
+        existing = dbutils.get_tree_node(path)
+        node = dbutils._create_directory(path[-1], existing.parent, dbutils.get_tree_path(path))
+        self.assertEqual(node.pk, existing.pk)
+
+    def test_rebuild_tree_paths(self):
+        dbutils.save_note(2019, 1, 2, "note")
+        models.Tree.objects.exclude(path=constants.ROOT_DIRECTORY).update(path=None)
+        updated = dbutils.rebuild_tree_paths()
+        self.assertEqual(updated, models.Tree.objects.count() - 1)
+        self.assertEqual(dbutils.get_tree_node(
+            [constants.ROOT_DIRECTORY, constants.DAILY_NOTES_DIRECTORY, "2019", "1", "2"]).document.name,
+            utils.generate_notes_file_name(2019, 1, 2))
+
+    def test_merge_duplicate_directories(self):
+        dbutils.save_note(2019, 1, 2, "note")
+        year = dbutils.get_tree_node([constants.ROOT_DIRECTORY, constants.DAILY_NOTES_DIRECTORY, "2019"])
+        # Duplicates created before paths were stored, duplicate month is merged once its year is merged
+        duplicate = models.Tree.objects.create(entity="2019", parent=year.parent)
+        month = models.Tree.objects.create(entity="1", parent=duplicate)
+        models.Tree.objects.create(entity="3", parent=month)
+        call_command('merge_duplicate_notes', stdout=io.StringIO())
+        dbutils.rebuild_tree_paths()
+        self.assertFalse(models.Tree.objects.filter(pk__in=[duplicate.pk, month.pk]).exists())
+        self.assertEqual(models.Tree.objects.filter(path__isnull=True).count(), 0)
+        month_path = dbutils.get_tree_path([constants.ROOT_DIRECTORY, constants.DAILY_NOTES_DIRECTORY, "2019", "1"])
+        self.assertEqual(sorted(models.Tree.objects.filter(parent__path=month_path).values_list('entity', flat=True)),
+                         ["2", "3"])
+
+    def test_subtree_is_matched_exactly(self):
+        dbutils.create_tree([constants.ROOT_DIRECTORY, constants.PERSONAL_DIRECTORY, "Work", "a_b"])
+        dbutils.create_tree([constants.ROOT_DIRECTORY, constants.PERSONAL_DIRECTORY, "work", "axb"])
+        dbutils.create_tree([constants.ROOT_DIRECTORY, constants.PERSONAL_DIRECTORY + "s", "work"])
+        personal = [constants.ROOT_DIRECTORY, constants.PERSONAL_DIRECTORY]
+        self.assertEqual([node.entity for node in dbutils.get_tree_subtree(personal + ["Work"])], ["a_b"])
+        self.assertEqual([node.entity for node in dbutils.get_tree_subtree(personal)], ["Work", "a_b", "work", "axb"])
+        self.assertTrue(dbutils.is_tree_ancestor(personal, personal + ["work", "axb"]))
+        self.assertFalse(dbutils.is_tree_ancestor(personal + ["Work"], personal + ["work", "axb"]))
+        other = [constants.ROOT_DIRECTORY, constants.PERSONAL_DIRECTORY + "s", "work"]
+        self.assertFalse(dbutils.is_tree_ancestor(personal, other))
+
+
+class StorageTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        setup_database()
+
+    def create_data(self, content):
+        data = models.Data(type=references.get_data_type(constants.TEXT_DATA_TYPE), flag=0,
+                           encrypt_key=references.get_encryption(constants.NO_ENCRYPTION_ALGORITHM), mtime='00:00')
+        storage.write_content(data, content)
+        return models.Data.objects.get(pk=data.pk)
+
+    def test_inline_content(self):
+        data = self.create_data("short content")
+        self.assertFalse(storage.is_chunked(data))
+        self.assertEqual(storage.read_content(data), "short content")
+        self.assertEqual(storage.read_content_range(data, 6), "content")
+        self.assertEqual(storage.read_content_range(data, 0, 5), "short")
+
+    def test_range_across_chunks(self):
+        size = constants.CONTENT_CHUNK_SIZE
+        content = ''.join(chr(ord('a') + index % 26) for index in range(size * 2)) + "😀" * (size // 2)
+        data = self.create_data(content)
+        self.assertTrue(storage.is_chunked(data))
+        self.assertEqual(data.chunks.count(), 3)
+        self.assertEqual(storage.read_content(data), content)
+        self.assertEqual(''.join(storage.stream_content(data)), content)
+        for start, end in ((0, size), (size - 5, size + 5), (size - 1, 2 * size + 1), (2 * size - 3, None),
+                           (0, None), (size, size), (len(content) - 1, len(content) + 10), (len(content) + 1, None)):
+            with self.subTest(start=start, end=end):
+                self.assertEqual(storage.read_content_range(data, start, end), content[start:end])
+
+    def test_rewrite_keeps_unchanged_chunks(self):
+        size = constants.CONTENT_CHUNK_SIZE
+        content = "a" * size + "b" * size
+        data = self.create_data(content)
+        first = data.chunks.get(index=0).pk
+        changed = content[:-1] + "c"
+        storage.write_content(data, changed, previous=content)
+        self.assertEqual(data.chunks.get(index=0).pk, first)
+        self.assertEqual(storage.read_content(data), changed)
+        self.assertEqual(storage.read_content_range(data, size - 2, size + 2), changed[size - 2:size + 2])
+
+    def test_shrink_to_inline_content(self):
+        data = self.create_data("a" * (constants.CONTENT_CHUNK_SIZE + 1))
+        storage.write_content(data, "short")
+        self.assertFalse(data.chunks.exists())
+        self.assertEqual(storage.read_content(data), "short")
+
+    def test_negative_offsets(self):
+        data = self.create_data("content")
+        for start, end in ((-1, None), (0, -1)):
+            with self.subTest(start=start, end=end), self.assertRaises(ValueError):
+                storage.read_content_range(data, start, end)
+
+
+class NotesRawViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        setup_database()
+        dbutils.save_note(2019, 1, 2, "raw content")
+
+    def test_whole_content(self):
+        response = self.client.get(reverse('note-raw', args=[2019, 1, 2]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b"raw content")
+
+    def test_range(self):
+        response = self.client.get(reverse('note-raw', args=[2019, 1, 2]), {'start': 4, 'end': 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"con")
+
+    def test_negative_offsets(self):
+        for params in ({'start': -3}, {'start': 0, 'end': -1}):
+            with self.subTest(params=params):
+                response = self.client.get(reverse('note-raw', args=[2019, 1, 2]), params)
+                self.assertEqual(response.status_code, 400)
+
+
+class ImportNotesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        setup_database()
+        dbutils.save_note(2019, 1, 3, "already saved")
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as note_file:
+            note_file.write(content)
+        return path
+
+    def import_notes(self, path):
+        stderr = io.StringIO()
+        call_command('import_notes', path, batch_size=2, stdout=io.StringIO(), stderr=stderr)
+        return stderr.getvalue()
+
+    def test_import_directory(self):
+        long_content = "line\n" * constants.CONTENT_CHUNK_SIZE
+        self.write_file("2019/01/01.md", "first")
+        self.write_file("2019-01-02.txt", long_content)
+        self.write_file("2019/01/03.md", "imported again")
+        self.write_file("2019/01/04.jpg", "not a note")
+        self.write_file("2019/02/30.md", "impossible date")
+        self.write_file("notes.md", "no date")
+        errors = self.import_notes(self.directory)
+        self.assertEqual(dbutils.get_notes_for_date(2019, 1, 1), "first")
+        self.assertEqual(dbutils.get_notes_for_date(2019, 1, 2), long_content)
+        self.assertEqual(dbutils.get_notes_for_date(2019, 1, 3), "already saved")
+        self.assertEqual(models.Document.objects.count(), 3)
+        self.assertIn("2019-2-30 is not a valid date", errors)
+        self.assertIn("date not found", errors)
+        node = dbutils.get_tree_node([constants.ROOT_DIRECTORY, constants.DAILY_NOTES_DIRECTORY, "2019", "1", "2"])
+        self.assertEqual(node.document.date.isoformat(), "2019-01-02")
+
+    def test_import_jsonl(self):
+        path = self.write_file("notes.jsonl", "\n".join([
+            json.dumps({'date': "2019-01-01", 'content': "first"}),
+            json.dumps({'name': "2019-01-02", 'content': "second"}),
+            json.dumps({'date': "2019-02-30", 'content': "impossible date"}),
+            json.dumps({'date': "2019-01-04"}),
+            "not json",
+            "",
+        ]))
+        errors = self.import_notes(path)
+        self.assertEqual(dbutils.get_notes_for_date(2019, 1, 1), "first")
+        self.assertEqual(dbutils.get_notes_for_date(2019, 1, 2), "second")
+        self.assertEqual(models.Document.objects.count(), 3)
+        self.assertEqual(len(errors.splitlines()), 3)
+        self.assertEqual([result[0] for result in dbutils.search_data_in_documents("second")[0]], ["2019/1/2"])
+
+
+class ExportNotesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        setup_database()
+        cls.contents = {(2019, 1, 1): "first", (2019, 1, 2): "ü" * (constants.CONTENT_CHUNK_SIZE + 10)}
+        for (year, month, day), content in cls.contents.items():
+            dbutils.save_note(year, month, day, content)
+        dbutils.set_tags_for_date(2019, 1, 1, ["work"])
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def export_notes(self, name, **options):
+        output = os.path.join(self.directory, name)
+        call_command('export_notes', output, stdout=io.StringIO(), **options)
+        return output
+
+    def read_jsonl(self, path):
+        with open(path, encoding='utf-8') as archive:
+            return [json.loads(line) for line in archive]
+
+    def test_jsonl_round_trip(self):
+        output = self.export_notes("notes.jsonl", chunk_size=1)
+        notes = self.read_jsonl(output)
+        self.assertEqual([note['date'] for note in notes], ["2019-01-01", "2019-01-02"])
+        self.assertEqual(notes[0]['tags'], ["work"])
+        self.assertEqual(notes[1]['path'], dbutils.get_tree_path(
+            [constants.ROOT_DIRECTORY, constants.DAILY_NOTES_DIRECTORY, "2019", "1", "2"]))
+
+        models.Document.objects.all().delete()
+        call_command('import_notes', output, stdout=io.StringIO())
+        for (year, month, day), content in self.contents.items():
+            self.assertEqual(dbutils.get_notes_for_date(year, month, day), content)
+
+    def test_tar(self):
+        output = self.export_notes("notes.tar.gz")
+        with tarfile.open(output) as archive:
+            members = {member.name: member for member in archive.getmembers()}
+            name = dbutils.get_tree_path([constants.ROOT_DIRECTORY, constants.DAILY_NOTES_DIRECTORY, "2019", "1",
+                                          "2"]) + ".txt"
+            self.assertEqual(archive.extractfile(members[name]).read().decode('utf-8'), self.contents[(2019, 1, 2)])
+            self.assertEqual(json.loads(members[name].pax_headers['MYNOTES.date']), "2019-01-02")
+
+    def test_incremental_export(self):
+        state_file = os.path.join(self.directory, "state")
+        self.assertEqual(len(self.read_jsonl(self.export_notes("all.jsonl", state_file=state_file))), 2)
+        self.assertEqual(self.read_jsonl(self.export_notes("none.jsonl", state_file=state_file)), [])
+        # Changing only tags of a note marks it modified as well
+        dbutils.set_tags_for_date(2019, 1, 2, ["travel"])
+        notes = self.read_jsonl(self.export_notes("changed.jsonl", state_file=state_file))
+        self.assertEqual([(note['date'], note['tags']) for note in notes], [("2019-01-02", ["travel"])])
+
+
+class DeltaTests(SimpleTestCase):
+
+    def assert_round_trip(self, old, new):
+        self.assertEqual(utils.apply_delta(old, utils.generate_delta(old, new)), new)
+
+    def test_round_trip(self):
+        self.assert_round_trip("one\ntwo\nthree\n", "one\n2\nthree\nfour\n")
+        self.assert_round_trip("one\ntwo\nthree", "two\nthree")
+        self.assert_round_trip("", "new\ncontent")
+        self.assert_round_trip("old\ncontent\n", "")
+        self.assert_round_trip("same\n", "same\n")
+        self.assert_round_trip("no trailing newline", "no trailing newline\n")
+        self.assert_round_trip("ünïcode\n😀 line\n", "ünïcode\n😀 changed line\n")
+
+    def test_unchanged_lines_are_kept_by_length(self):
+        delta = utils.generate_delta("keep\nold\n", "keep\nnew\n")
+        self.assertEqual(delta, [['=', 5], ['-', 4], ['+', "new\n"]])
+
+
+class RevisionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        setup_database()
+
+    def test_reconstruct_across_snapshots(self):
+        count = constants.REVISION_SNAPSHOT_INTERVAL * 2 + 3
+        contents = ["".join("line {}\n".format(line) for line in range(number)) for number in range(1, count + 1)]
+        for content in contents:
+            dbutils.save_note(2019, 1, 2, content)
+        # Saving unchanged content records no revision
+        dbutils.save_note(2019, 1, 2, contents[-1])
+
+        revisions = dbutils.get_revisions_for_date(2019, 1, 2)
+        self.assertEqual([revision.number for revision in revisions], list(range(count, 0, -1)))
+        self.assertEqual([revision.number for revision in revisions if revision.snapshot],
+                         [constants.REVISION_SNAPSHOT_INTERVAL * 2 + 1, constants.REVISION_SNAPSHOT_INTERVAL + 1, 1])
+        for number, content in enumerate(contents, 1):
+            with self.subTest(number=number):
+                self.assertEqual(dbutils.get_revision_diff_for_date(2019, 1, 2, number)[0], content)
+        _, diff = dbutils.get_revision_diff_for_date(2019, 1, 2, constants.REVISION_SNAPSHOT_INTERVAL + 1)
+        self.assertEqual([line for line in diff if line.startswith('+') and not line.startswith('+++')],
+                         ["+line {}\n".format(constants.REVISION_SNAPSHOT_INTERVAL)])
+
+    def test_note_saved_before_revisions(self):
+        dbutils.save_note(2019, 1, 2, "old content")
+        document = dbutils.fetch_note_object_for_date(2019, 1, 2)
+        document.revisions.all().delete()
+        models.Document.objects.filter(pk=document.pk).update(revision=0)
+        dbutils.save_note(2019, 1, 2, "new content")
+        self.assertEqual(dbutils.get_revision_diff_for_date(2019, 1, 2, 1)[0], "old content")
+        self.assertEqual(dbutils.get_revision_diff_for_date(2019, 1, 2, 2)[0], "new content")
+
+    def test_missing_revision(self):
+        dbutils.save_note(2019, 1, 2, "content")
+        with self.assertRaises(models.Revision.DoesNotExist):
+            dbutils.get_revision_diff_for_date(2019, 1, 2, 5)
+
+
+class SaveNoteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        setup_database()
+
+    def test_create_and_update(self):
+        version = dbutils.save_note(2019, 1, 2, "first")
+        document = dbutils.fetch_note_object_for_date(2019, 1, 2)
+        self.assertEqual(document.revision, 1)
+        self.assertEqual(dbutils.get_revision_diff_for_date(2019, 1, 2, 1)[0], "first")
+        self.assertNotEqual(dbutils.save_note(2019, 1, 2, "second", version=version), version)
+        self.assertEqual(dbutils.get_notes_for_date(2019, 1, 2), "second")
+        self.assertEqual(models.Tree.objects.filter(document__isnull=False).count(), 1)
+
+    def test_version_mismatch(self):
+        with self.assertRaises(dbutils.NoteVersionMismatch):
+            dbutils.save_note(2019, 1, 2, "first", version='*')
+        version = dbutils.save_note(2019, 1, 2, "first")
+        dbutils.save_note(2019, 1, 2, "second", version='*')
+        with self.assertRaises(dbutils.NoteVersionMismatch):
+            dbutils.save_note(2019, 1, 2, "third", version=version)
+        self.assertEqual(dbutils.get_notes_for_date(2019, 1, 2), "second")
+
+    def test_note_created_concurrently(self):
+        dbutils.save_note(2019, 1, 2, "concurrent")
+        first = QuerySet.first
+        lookups = []
+
+        def first_after_concurrent_save(queryset):
+            # Lookup of the note misses it as if another save committed it right after, hence insert fails
+            lookups.append(queryset.model)
+            return None if len(lookups) == 1 else first(queryset)
+
+        with mock.patch.object(QuerySet, 'first', autospec=True, side_effect=first_after_concurrent_save):
+            version = dbutils.save_note(2019, 1, 2, "mine")
+        self.assertIs(lookups[0], models.Document)
+        self.assertEqual(models.Document.objects.count(), 1)
+        self.assertEqual(dbutils.get_notes_for_date(2019, 1, 2), "mine")
+        self.assertEqual(dbutils.get_note_version_for_date(2019, 1, 2), version)
+        self.assertEqual([revision.number for revision in dbutils.get_revisions_for_date(2019, 1, 2)], [2, 1])
+
+
+class NoteLookupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        setup_database()
+        dbutils.save_note(2019, 1, 2, "daily note")
+
+    def test_note_is_looked_up_by_type_and_date(self):
+        document = dbutils.fetch_note_object_for_date(2019, 1, 2)
+        # A document of another type on the same date is not the daily note
+        models.Document.objects.create(name="plan", type=references.get_document_type(constants.NOTES_DOCUMENT_TYPE),
+                                       data=document.data, date=document.date, ctime='00:00', atime='00:00',
+                                       mtime='00:00')
+        self.assertEqual(dbutils.fetch_note_object_for_date(2019, 1, 2).pk, document.pk)
+        self.assertEqual(dbutils.get_note_version_for_date(2019, 1, 2), dbutils.get_note_version(document))
+        dbutils.save_note(2019, 1, 2, "updated")
+        self.assertEqual(dbutils.get_notes_for_date(2019, 1, 2), "updated")
+
+    def test_invalid_date(self):
+        with self.assertRaises(models.Document.DoesNotExist):
+            dbutils.fetch_note_object_for_date(2019, 2, 30)
+        self.assertIsNone(dbutils.get_note_version_for_date(2019, 2, 30))
+        self.assertEqual(dbutils.get_tags_for_date(2019, 2, 30), [])
+
+    def test_note_saved_before_dates(self):
+        models.Document.objects.update(date=None)
+        # Reads and writes miss the note alike until its date is backfilled
+        self.assertIsNone(dbutils.get_note_version_for_date(2019, 1, 2))
+        with self.assertRaises(models.Document.DoesNotExist):
+            dbutils.fetch_note_object_for_date(2019, 1, 2)
+        call_command('backfill_note_dates', stdout=io.StringIO())
+        dbutils.set_tags_for_date(2019, 1, 2, ["work"])
+        self.assertEqual(dbutils.get_tags_for_date(2019, 1, 2), ["work"])
+        self.assertEqual(dbutils.get_notes_for_date(2019, 1, 2), "daily note")
+
+
+class NoteApiViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        setup_database()
+        cls.version = dbutils.save_note(2019, 1, 2, "first")
+
+    def setUp(self):
+        self.url = reverse('note-api', args=[2019, 1, 2])
+
+    def put(self, content, **headers):
+        return self.client.put(self.url, json.dumps({'content': content}), content_type='application/json',
+                               **headers)
+
+    def test_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"{}"'.format(self.version))
+        self.assertEqual(response.json()['content'], "first")
+
+    def test_get_unchanged_note(self):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"{}"'.format(self.version))
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], '"{}"'.format(self.version))
+
+    def test_get_changed_note(self):
+        response = self.client.get(self.url)
+        self.put("second")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['content'], "second")
+
+    def test_put_matching_version(self):
+        response = self.put("second", HTTP_IF_MATCH='"{}"'.format(self.version))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"{}"'.format(response.json()['version']))
+        self.assertNotEqual(response.json()['version'], self.version)
+
+    def test_put_changed_note(self):
+        self.put("second")
+        response = self.put("third", HTTP_IF_MATCH='"{}"'.format(self.version))
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(self.client.get(self.url).json()['content'], "second")
+
+    def test_put_weak_entity_tag(self):
+        response = self.put("second", HTTP_IF_MATCH='W/"{}"'.format(self.version))
+        self.assertEqual(response.status_code, 412)
+
+    def test_put_invalid_body(self):
+        response = self.client.put(self.url, json.dumps({'content': 1}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.put(self.url, "content", content_type='text/plain')
+        self.assertEqual(response.status_code, 415)
+
+    def test_missing_note(self):
+        response = self.client.get(reverse('note-api', args=[2019, 1, 3]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('note-api', args=[2019, 2, 30]))
+        self.assertEqual(response.status_code, 404)
+
+
+class NotePageCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        setup_database()
+        dbutils.save_note(2019, 1, 2, "first")
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('note', args=[2019, 1, 2])
+
+    @staticmethod
+    def in_another_process():
+        # Writes of another process leave cache of this process untouched
+        return mock.patch.object(dbutils, 'cache', LocMemCache('another-process', {}))
+
+    def test_note_saved_by_another_process(self):
+        self.assertContains(self.client.get(self.url), "first")
+        with self.in_another_process():
+            dbutils.save_note(2019, 1, 2, "second")
+        self.assertContains(self.client.get(self.url), "second")
+
+    def test_note_written_without_dbutils(self):
+        self.assertContains(self.client.get(self.url), "first")
+        document = dbutils.fetch_note_object_for_date(2019, 1, 2)
+        storage.write_content(document.data, "second")
+        models.Document.objects.filter(pk=document.pk).update(modified=timezone.now())
+        self.assertContains(self.client.get(self.url), "second")
+
+    def test_note_imported_by_another_process(self):
+        url = reverse('note', args=[2019, 3, 4])
+        self.assertNotContains(self.client.get(url), "imported")
+        self.assertNotContains(self.client.get(self.url), "2019/3")
+        with self.in_another_process():
+            dbutils.import_notes([(2019, 3, 4, "imported")], {})
+        self.assertContains(self.client.get(url), "imported")
+        # Sidebar of every page lists the new month
+        self.assertContains(self.client.get(self.url), "2019/3 (1)")
+
+    def test_tags_set_by_another_process(self):
+        self.assertContains(self.client.get(self.url), "No tags yet")
+        with self.in_another_process():
+            dbutils.set_tags_for_date(2019, 1, 2, ["work"])
+        response = self.client.get(self.url)
+        self.assertContains(response, "work</a> (1)")
+        self.assertEqual(dbutils.get_tag_counts(), [("work", 1)])
+        with self.in_another_process():
+            dbutils.set_tags_for_date(2019, 1, 2, [])
+        self.assertEqual(dbutils.get_tag_counts(), [])
+
+    def test_rolled_back_write(self):
+        version = dbutils.get_note_index_version()
+        with transaction.atomic():
+            dbutils.save_note(2019, 3, 4, "rolled back")
+            self.assertNotEqual(dbutils.get_note_index_version(), version)
+            self.assertContains(self.client.get(self.url), "2019/3 (1)")
+            transaction.set_rollback(True)
+        self.assertEqual(dbutils.get_note_index_version(), version)
+        self.assertNotContains(self.client.get(self.url), "2019/3")
+
+
+class SnippetTests(SimpleTestCase):
+
+    def test_matches_are_escaped_and_marked(self):
+        pattern = utils.compile_search_pattern("a+b")
+        snippets = utils.get_highlighted_snippets(["<p>", "x a+b y"], pattern, width=2)
+        self.assertEqual(snippets, "...x <i><strong>a+b</strong></i> y")
+
+    def test_match_across_parts(self):
+        pattern = utils.compile_search_pattern("needle")
+        parts = ["hay " * 10 + "nee", "dle", " hay" * 10]
+        self.assertEqual(utils.get_highlighted_snippets(parts, pattern, width=4),
+                         "...hay <i><strong>needle</strong></i> hay...")
+
+    def test_overlapping_windows_are_merged(self):
+        pattern = utils.compile_search_pattern("b")
+        self.assertEqual(utils.get_highlighted_snippets(["aaab", "aba", "aaaaab"], pattern, width=1, matches=3),
+                         "...a<i><strong>b</strong></i>a<i><strong>b</strong></i>a... "
+                         "...a<i><strong>b</strong></i>")
+
+    def test_parts_are_read_until_enough_matches(self):
+        pattern = utils.compile_search_pattern("b")
+        read = []
+
+        def parts():
+            for part in ["ab", "ab", "ab", "ab"]:
+                read.append(part)
+                yield part
+
+        self.assertEqual(utils.get_highlighted_snippets(parts(), pattern, width=1, matches=2),
+                         "a<i><strong>b</strong></i>a<i><strong>b</strong></i>a...")
+        self.assertEqual(len(read), 3)
+
+    def test_no_match(self):
+        self.assertEqual(utils.get_highlighted_snippets(["abc", "def"], None, width=2), "abcd...")
+        self.assertEqual(utils.get_highlighted_snippets(["abc"], utils.compile_search_pattern("x"), width=2), "abc")
+
+
+class SearchSnippetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        setup_database()
+        content = "needle " * constants.SEARCH_SNIPPET_MATCHES + "hay " * constants.CONTENT_CHUNK_SIZE
+        dbutils.save_note(2019, 1, 2, content)
+
+    def test_only_chunks_with_snippets_are_read(self):
+        document = dbutils.fetch_note_object_for_date(2019, 1, 2)
+        self.assertGreater(document.data.chunks.count(), 2)
+        with mock.patch.object(storage, 'decompress', wraps=storage.decompress) as decompress:
+            results, _ = dbutils.search_data_in_documents("needle")
+        self.assertEqual(decompress.call_count, 1)
+        self.assertEqual(results[0][0], "2019/1/2")
+        self.assertTrue(results[0][1].startswith("<i><strong>needle</strong></i> <i><strong>needle</strong></i>"))
+
+
+class TagTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        setup_database()
+        dbutils.save_note(2019, 1, 2, "first", tags=["work", "home"])
+        dbutils.save_note(2019, 1, 3, "second", tags=["work"])
+
+    def test_only_changed_mappings_are_written(self):
+        kept = models.Mapping.objects.get(document__date='2019-01-02', tag__tag="work").pk
+        modified = dbutils.fetch_note_object_for_date(2019, 1, 2).modified
+        dbutils.set_tags_for_date(2019, 1, 2, ["work", "travel"])
+        self.assertEqual(dbutils.get_tags_for_date(2019, 1, 2), ["travel", "work"])
+        self.assertTrue(models.Mapping.objects.filter(pk=kept).exists())
+        self.assertGreater(dbutils.fetch_note_object_for_date(2019, 1, 2).modified, modified)
+
+    def test_unchanged_tags(self):
+        modified = dbutils.fetch_note_object_for_date(2019, 1, 2).modified
+        version = dbutils.get_note_index_version()
+        dbutils.set_tags_for_date(2019, 1, 2, ["home", "work"])
+        self.assertEqual(dbutils.fetch_note_object_for_date(2019, 1, 2).modified, modified)
+        self.assertEqual(dbutils.get_note_index_version(), version)
+
+    def test_tag_counts(self):
+        self.assertEqual(dbutils.get_tag_counts(), [("home", 1), ("work", 2)])
+        dbutils.set_tags_for_date(2019, 1, 3, [])
+        self.assertEqual(dbutils.get_tag_counts(), [("home", 1), ("work", 1)])
+
+    def test_tag_is_mapped_to_a_document_once(self):
+        mapping = models.Mapping.objects.first()
+        with self.assertRaises(IntegrityError):
+            models.Mapping.objects.create(document=mapping.document, tag=mapping.tag)
+
+
+class TreeListingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        setup_database()
+        dbutils.save_note(2019, 1, 2, "note")
+        cls.path = "/".join([constants.ROOT_DIRECTORY, constants.DAILY_NOTES_DIRECTORY])
+
+    def test_one_level(self):
+        with self.assertNumQueries(1):
+            listing = dbutils.get_tree_listing(self.path.split("/"))
+        self.assertEqual(listing['path'], self.path)
+        self.assertEqual([child['name'] for child in listing['children']], ["2019"])
+        self.assertTrue(listing['children'][0]['has_children'])
+        self.assertNotIn('children', listing['children'][0])
+
+    def test_whole_subtree(self):
+        listing = dbutils.get_tree_listing(self.path.split("/"), depth=None)
+        note = listing['children'][0]['children'][0]['children'][0]
+        self.assertEqual(note['path'], self.path + "/2019/1/2")
+        self.assertFalse(note['has_children'])
+        self.assertEqual(note['document']['name'], utils.generate_notes_file_name(2019, 1, 2))
+        self.assertEqual(note['document']['size'], len("note"))
+
+    def test_missing_path(self):
+        self.assertIsNone(dbutils.get_tree_listing([constants.ROOT_DIRECTORY, "missing"]))
+
+    def test_view(self):
+        response = self.client.get(reverse('tree-api'), {'path': self.path + "/2019", 'depth': 'all'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['children'][0]['children'][0]['name'], "2")
+        self.assertEqual(self.client.get(reverse('tree-api'), {'depth': '-1'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('tree-api'), {'depth': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('tree-api'), {'path': "root/missing"}).status_code, 404)
+
+
+class ByteRangeTests(SimpleTestCase):
+
+    def test_range(self):
+        self.assertEqual(utils.parse_byte_range("bytes=0-9", 100), (0, 9))
+        self.assertEqual(utils.parse_byte_range("bytes=90-200", 100), (90, 99))
+
+    def test_open_range(self):
+        self.assertEqual(utils.parse_byte_range("bytes=10-", 100), (10, 99))
+
+    def test_suffix_range(self):
+        self.assertEqual(utils.parse_byte_range("bytes=-10", 100), (90, 99))
+        self.assertEqual(utils.parse_byte_range("bytes=-200", 100), (0, 99))
+
+    def test_unsatisfiable_range(self):
+        for header, size in (("bytes=100-", 100), ("bytes=100-200", 100), ("bytes=-0", 100), ("bytes=-10", 0)):
+            with self.subTest(header=header, size=size), self.assertRaises(ValueError):
+                utils.parse_byte_range(header, size)
+
+    def test_whole_content_is_served_for_other_ranges(self):
+        for header in ("", "bytes=-", "bytes=9-0", "bytes=0-1,5-6", "items=0-9", "bytes=a-b"):
+            with self.subTest(header=header):
+                self.assertIsNone(utils.parse_byte_range(header, 100))
+
+
+class AttachmentViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        setup_database()
+        dbutils.save_note(2019, 1, 2, "with attachment")
+
+    def setUp(self):
+        blob_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, blob_root)
+        blob_settings = override_settings(MYNOTES_BLOB_ROOT=blob_root)
+        blob_settings.enable()
+        self.addCleanup(blob_settings.disable)
+        self.content = bytes(range(256)) * 4
+        attachment = dbutils.add_attachment_for_date(2019, 1, 2, SimpleUploadedFile(
+            "file.bin", self.content, content_type='application/octet-stream'))
+        self.url = reverse('attachment', args=[2019, 1, 2, attachment.pk])
+        self.etag = '"{}"'.format(attachment.digest)
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        self.addCleanup(response.close)
+        return response
+
+    def test_whole_content(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], self.etag)
+
+    def test_range(self):
+        response = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+
+    def test_suffix_range(self):
+        response = self.get(HTTP_RANGE='bytes=-24')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 1000-1023/1024')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-24:])
+
+    def test_unsatisfiable_range(self):
+        response = self.get(HTTP_RANGE='bytes=1024-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_range_of_changed_copy(self):
+        response = self.get(HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_range_of_same_copy(self):
+        response = self.get(HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE=self.etag)
+        self.assertEqual(response.status_code, 206)
+
+
+class BlobStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        blob_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, blob_root)
+        blob_settings = override_settings(MYNOTES_BLOB_ROOT=blob_root)
+        blob_settings.enable()
+        self.addCleanup(blob_settings.disable)
+
+    def test_identical_content_is_stored_once(self):
+        first = blobstore.store_blob(SimpleUploadedFile("first.txt", b"content"))
+        second = blobstore.store_blob(SimpleUploadedFile("second.txt", b"content"))
+        self.assertEqual(first, second)
+        self.assertEqual(list(blobstore.list_blobs()), [first[0]])
+
+    def test_reused_blob_is_kept_by_compaction(self):
+        digest, _ = blobstore.store_blob(SimpleUploadedFile("file.txt", b"content"))
+        # Blob stored long ago and no longer referenced, which compaction would delete
+        os.utime(blobstore.get_blob_path(digest), (0, 0))
+        self.assertEqual(list(blobstore.list_blobs(min_age=constants.BLOB_GRACE_PERIOD)), [digest])
+        blobstore.store_blob(SimpleUploadedFile("file.txt", b"content"))
+        self.assertEqual(list(blobstore.list_blobs(min_age=constants.BLOB_GRACE_PERIOD)), [])
+
+
+class EditOperationTests(SimpleTestCase):
+
+    def test_operations_are_applied_in_order(self):
+        operations = [
+            {'op': constants.EDIT_INSERT_OPERATION, 'offset': 5, 'text': ", world"},
+            {'op': constants.EDIT_DELETE_OPERATION, 'offset': 0, 'length': 1},
+            {'op': constants.EDIT_INSERT_OPERATION, 'offset': 0, 'text': "H"},
+        ]
+        self.assertEqual(utils.apply_edit_operations("hello", operations), "Hello, world")
+
+    def test_offsets_are_counted_in_characters(self):
+        operations = [{'op': constants.EDIT_DELETE_OPERATION, 'offset': 1, 'length': 1}]
+        self.assertEqual(utils.apply_edit_operations("a😀b", operations), "ab")
+
+    def test_bounds(self):
+        self.assertEqual(utils.apply_edit_operations("abc", [
+            {'op': constants.EDIT_INSERT_OPERATION, 'offset': 3, 'text': "d"},
+            {'op': constants.EDIT_DELETE_OPERATION, 'offset': 0, 'length': 4},
+        ]), "")
+        invalid = [
+            {'op': constants.EDIT_INSERT_OPERATION, 'offset': 4, 'text': "d"},
+            {'op': constants.EDIT_INSERT_OPERATION, 'offset': -1, 'text': "d"},
+            {'op': constants.EDIT_DELETE_OPERATION, 'offset': 1, 'length': 3},
+            {'op': constants.EDIT_DELETE_OPERATION, 'offset': 0, 'length': -1},
+        ]
+        for operation in invalid:
+            with self.subTest(operation=operation), self.assertRaises(ValueError):
+                utils.apply_edit_operations("abc", [operation])
+
+    def test_errors(self):
+        invalid = [
+            {'op': constants.EDIT_INSERT_OPERATION, 'offset': "0", 'text': "d"},
+            {'op': constants.EDIT_INSERT_OPERATION, 'offset': True, 'text': "d"},
+            {'op': constants.EDIT_INSERT_OPERATION, 'offset': 0, 'text': None},
+            {'op': constants.EDIT_DELETE_OPERATION, 'offset': 0, 'length': 1.0},
+            {'op': "replace", 'offset': 0},
+            "insert",
+        ]
+        for operation in invalid:
+            with self.subTest(operation=operation), self.assertRaises(ValueError):
+                utils.apply_edit_operations("abc", [operation])
+        with self.assertRaises(ValueError):
+            utils.apply_edit_operations("abc", {'op': constants.EDIT_DELETE_OPERATION, 'offset': 0, 'length': 1})
+        with self.assertRaises(ValueError):
+            utils.apply_edit_operations("abc", [{'op': constants.EDIT_INSERT_OPERATION, 'offset': 0, 'text': ""}] *
+                                        (constants.MAX_EDIT_OPERATIONS + 1))
+
+
+
+class AutosaveTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        setup_database()
+        cls.version = dbutils.save_note(2019, 1, 2, "first\n")
+
+    def patch(self, version, text):
+        operations = [{'op': constants.EDIT_INSERT_OPERATION, 'offset': 0, 'text': text}]
+        return dbutils.patch_note(2019, 1, 2, operations, version)
+
+    def get_revisions(self):
+        return [(revision.number, revision.autosave) for revision in dbutils.get_revisions_for_date(2019, 1, 2)]
+
+    def test_autosaves_amend_latest_revision(self):
+        versions = [self.version]
+        for text in ("c\n", "b\n", "a\n"):
+            versions.append(self.patch(versions[-1], text))
+        self.assertEqual(len(set(versions)), len(versions))
+        self.assertEqual(self.get_revisions(), [(2, True), (1, False)])
+        self.assertEqual(dbutils.get_revision_diff_for_date(2019, 1, 2, 2)[0], "a\nb\nc\nfirst\n")
+
+    def test_save_after_autosaves_records_revision(self):
+        version = self.patch(self.version, "b\n")
+        version = dbutils.save_note(2019, 1, 2, "saved\n", version=version)
+        self.patch(version, "a\n")
+        self.assertEqual(self.get_revisions(), [(4, True), (3, False), (2, True), (1, False)])
+        self.assertEqual(dbutils.get_revision_diff_for_date(2019, 1, 2, 2)[0], "b\nfirst\n")
+        self.assertEqual(dbutils.get_revision_diff_for_date(2019, 1, 2, 4)[0], "a\nsaved\n")
+
+    def test_autosave_after_window_records_revision(self):
+        version = self.patch(self.version, "b\n")
+        models.Revision.objects.filter(number=2).update(
+            ctime=timezone.now() - datetime.timedelta(seconds=constants.REVISION_AUTOSAVE_WINDOW + 1))
+        self.patch(version, "a\n")
+        self.assertEqual(self.get_revisions(), [(3, True), (2, True), (1, False)])
+        self.assertEqual(dbutils.get_revision_diff_for_date(2019, 1, 2, 3)[0], "a\nb\nfirst\n")
+
+    def test_autosaved_snapshot_is_amended(self):
+        for number in range(2, constants.REVISION_SNAPSHOT_INTERVAL + 1):
+            dbutils.save_note(2019, 1, 2, "first\n" * number)
+        version = dbutils.get_note_version_for_date(2019, 1, 2)
+        version = self.patch(version, "b\n")
+        self.patch(version, "a\n")
+        number = constants.REVISION_SNAPSHOT_INTERVAL + 1
+        revision = dbutils.get_revisions_for_date(2019, 1, 2)[0]
+        self.assertEqual((revision.number, revision.snapshot), (number, True))
+        content, diff = dbutils.get_revision_diff_for_date(2019, 1, 2, number)
+        self.assertEqual(content, "a\nb\n" + "first\n" * (number - 1))
+        self.assertEqual([line for line in diff if line.startswith('+') and not line.startswith('+++')],
+                         ["+a\n", "+b\n"])
+
+    def test_patch_view(self):
+        url = reverse('note-api', args=[2019, 1, 2])
+        operations = [{'op': constants.EDIT_INSERT_OPERATION, 'offset': 0, 'text': "the "}]
+        response = self.client.patch(url, json.dumps({'version': self.version, 'operations': operations}),
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(dbutils.get_notes_for_date(2019, 1, 2), "the first\n")
+        response = self.client.patch(url, json.dumps({'version': self.version, 'operations': operations}),
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 412)
+
+
+class JobTests(TestCase):
+
+    def test_claim_due_jobs_oldest_first(self):
+        first = dbutils.enqueue_job(constants.REINDEX_JOB)
+        later = dbutils.enqueue_job(constants.COMPACTION_JOB)
+        models.Job.objects.filter(pk=later.pk).update(run_after=timezone.now() + datetime.timedelta(hours=1))
+        second = dbutils.enqueue_job(constants.TREE_REPAIR_JOB)
+        claimed = dbutils.claim_jobs(5)
+        self.assertEqual([job.pk for job in claimed], [first.pk, second.pk])
+        self.assertEqual({(job.state, job.attempts) for job in claimed}, {(constants.JOB_RUNNING, 1)})
+        self.assertEqual(dbutils.claim_jobs(5), [])
+
+    def test_retry_with_backoff(self):
+        job = dbutils.enqueue_job(constants.REINDEX_JOB, max_attempts=2)
+        dbutils.claim_jobs(1)
+        self.assertEqual(dbutils.fail_job(job.pk, "error"), constants.JOB_QUEUED)
+        job.refresh_from_db()
+        self.assertGreater(job.run_after, timezone.now() + datetime.timedelta(seconds=constants.JOB_RETRY_DELAY - 1))
+        self.assertEqual(dbutils.claim_jobs(1), [])
+        models.Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        self.assertEqual(dbutils.claim_jobs(1)[0].attempts, 2)
+        self.assertEqual(dbutils.fail_job(job.pk, "error"), constants.JOB_FAILED)
+        self.assertEqual(dbutils.get_job_details(models.Job.objects.get(pk=job.pk))['result'], "error")
+
+    def test_cancel(self):
+        queued = dbutils.enqueue_job(constants.REINDEX_JOB)
+        self.assertTrue(dbutils.cancel_job(queued.pk))
+        self.assertEqual(models.Job.objects.get(pk=queued.pk).state, constants.JOB_CANCELLED)
+        self.assertFalse(dbutils.cancel_job(queued.pk))
+
+        running = dbutils.enqueue_job(constants.REINDEX_JOB)
+        dbutils.claim_jobs(1)
+        self.assertTrue(dbutils.cancel_job(running.pk))
+        self.assertTrue(dbutils.update_job_progress(running.pk, 1, 2))
+        # Cancellation takes precedence over retrying a failed attempt
+        self.assertEqual(dbutils.fail_job(running.pk, "error"), constants.JOB_CANCELLED)
+
+    def test_execute_job(self):
+        def handler(arguments, progress):
+            progress(1, 2)
+            return "done"
+
+        job = dbutils.enqueue_job(constants.REINDEX_JOB)
+        dbutils.claim_jobs(1)
+        with mock.patch.dict(jobs.JOB_HANDLERS, {constants.REINDEX_JOB: handler}):
+            self.assertEqual(jobs.execute_job(job.pk), constants.JOB_SUCCEEDED)
+            details = dbutils.get_job_details(models.Job.objects.get(pk=job.pk))
+            self.assertEqual((details['result'], details['progress'], details['total']), ("done", 2, 2))
+
+            job = dbutils.enqueue_job(constants.REINDEX_JOB)
+            dbutils.claim_jobs(1)
+            dbutils.cancel_job(job.pk)
+            self.assertEqual(jobs.execute_job(job.pk), constants.JOB_CANCELLED)
+
+    def test_invalid_arguments(self):
+        for kind, arguments in ((constants.JOB_KINDS[0] + "s", {}),
+                                (constants.EXPORT_JOB, {}),
+                                (constants.EXPORT_JOB, {'output': "notes.tar", 'format': "tar"}),
+                                (constants.EXPORT_JOB, {'output': 1}),
+                                (constants.EXPORT_JOB, {'output': "../notes.tar"}),
+                                (constants.EXPORT_JOB, {'output': "notes.tar", 'since': "yesterday"})):
+            with self.subTest(kind=kind, arguments=arguments), self.assertRaises(ValueError):
+                dbutils.enqueue_job(kind, arguments)
+        self.assertFalse(models.Job.objects.exists())
+
+    def test_api(self):
+        response = self.client.post(reverse('jobs-api'), json.dumps({'kind': constants.EXPORT_JOB}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse('jobs-api'), json.dumps({'kind': constants.REINDEX_JOB}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        url = response['Location']
+        self.assertEqual(self.client.get(url).json()['state'], constants.JOB_QUEUED)
+        self.assertEqual(self.client.delete(url).status_code, 202)
+        self.assertEqual(self.client.delete(url).status_code, 409)
+        self.assertEqual(self.client.get(reverse('job-api', args=[0])).status_code, 404)
+        self.assertEqual(len(self.client.get(reverse('jobs-api')).json()['jobs']), 1)
+
+
+class SearchFilterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        setup_database()
+        dbutils.save_note(2019, 1, 2, "apple pie", tags=["food"])
+        dbutils.save_note(2019, 2, 3, "apple juice")
+        dbutils.save_note(2020, 1, 4, "apple tart", tags=["food"])
+
+    def search(self, **filters):
+        return sorted(name for name, _ in dbutils.search_data_in_documents("apple", **filters)[0])
+
+    def test_type(self):
+        self.assertEqual(self.search(document_type=constants.DAILY_NOTES_DOCUMENT_TYPE),
+                         ["2019/1/2", "2019/2/3", "2020/1/4"])
+        with self.assertRaises(models.DocumentType.DoesNotExist):
+            self.search(document_type="unknown")
+
+    def test_date_range(self):
+        self.assertEqual(self.search(date_from=datetime.date(2019, 2, 3)), ["2019/2/3", "2020/1/4"])
+        self.assertEqual(self.search(date_to=datetime.date(2019, 2, 3)), ["2019/1/2", "2019/2/3"])
+        self.assertEqual(self.search(date_from=datetime.date(2019, 1, 3), date_to=datetime.date(2019, 12, 31)),
+                         ["2019/2/3"])
+
+    def test_path(self):
+        path = [constants.ROOT_DIRECTORY, constants.DAILY_NOTES_DIRECTORY]
+        self.assertEqual(self.search(path=path + ["2019"]), ["2019/1/2", "2019/2/3"])
+        self.assertEqual(self.search(path=path + ["2019", "1", "2"]), ["2019/1/2"])
+        # Path matches whole nodes only
+        self.assertEqual(self.search(path=path + ["201"]), [])
+
+    def test_filters_combined_with_tags(self):
+        self.assertEqual(self.search(tags=["food"], date_to=datetime.date(2019, 12, 31)), ["2019/1/2"])
+        self.assertEqual(sorted(name for name, _ in dbutils.search_data_in_documents("", tags=["food"])[0]),
+                         ["2019/1/2", "2020/1/4"])
+
+    def test_view(self):
+        response = self.client.get(reverse('search'), {'search_str': "apple", 'date_from': "2020-01-01",
+                                                       'path': "/root/daily-notes/"})
+        self.assertEqual([name for name, _ in response.context['documents']], ["2020/1/4"])
+        response = self.client.get(reverse('search'), {'search_str': "apple", 'date_from': "2020-01-01",
+                                                       'date_to': "2019-01-01"})
+        self.assertNotIn('documents', response.context)
+
+
+class TrigramSimilarityTests(SimpleTestCase):
+
+    def test_similarity(self):
+        self.assertEqual(utils.get_trigram_similarity("word", "word"), 1)
+        self.assertEqual(utils.get_trigram_similarity("abc", "xyz"), 0)
+        # As computed by pg_trgm, similarity('word', 'words') is 0.571429
+        self.assertAlmostEqual(utils.get_trigram_similarity("word", "words"), 4 / 7)
+
+    def test_similarity_is_symmetric(self):
+        self.assertEqual(utils.get_trigram_similarity("notes", "ntoes"), utils.get_trigram_similarity("ntoes", "notes"))
+        self.assertGreaterEqual(utils.get_trigram_similarity("meeting", "meetnig"),
+                                constants.TRIGRAM_SIMILARITY_THRESHOLD)
+
+
+class TermCountTests(TransactionTestCase):
+
+    def setUp(self):
+        setup_database()
+
+    def get_counts(self):
+        return dict(models.Term.objects.filter(count__gt=0).values_list('term', 'count'))
+
+    def test_terms_are_counted_once_committed(self):
+        with transaction.atomic():
+            dbutils.save_note(2019, 1, 2, "apple pie")
+            self.assertEqual(self.get_counts(), {})
+        dbutils.save_note(2019, 1, 3, "apple tart")
+        self.assertEqual(self.get_counts(), {"apple": 2, "pie": 1, "tart": 1})
+        with mock.patch.object(terms, '_index', terms.TermIndex()):
+            self.assertEqual(terms.suggest_terms("ap")[0], [("apple", 2)])
+            dbutils.save_note(2019, 1, 2, "banana pie")
+            self.assertEqual(self.get_counts(), {"apple": 1, "banana": 1, "pie": 1, "tart": 1})
+            # Index kept in process memory is updated as well
+            self.assertEqual(terms.suggest_terms("ap")[0], [("apple", 1)])
+
+    def test_rolled_back_save_is_not_counted(self):
+        with transaction.atomic():
+            dbutils.save_note(2019, 1, 2, "apple pie")
+            transaction.set_rollback(True)
+        self.assertEqual(self.get_counts(), {})
+
+    def test_imported_notes(self):
+        dbutils.import_notes([(2019, 1, 2, "apple pie"), (2019, 1, 3, "apple")], {})
+        self.assertEqual(self.get_counts(), {"apple": 2, "pie": 1})
+
+    def test_terms_never_counted_are_not_discounted(self):
+        dbutils.save_note(2019, 1, 2, "apple pie")
+        models.Term.objects.all().delete()
+        dbutils.save_note(2019, 1, 2, "apple")
+        self.assertFalse(models.Term.objects.exists())
+
+    def test_failed_count_does_not_fail_save(self):
+        with mock.patch.object(terms.models.Term.objects, 'filter', side_effect=DatabaseError("locked")), \
+                self.assertLogs(terms.logger, 'ERROR'):
+            dbutils.save_note(2019, 1, 2, "apple")
+            dbutils.save_note(2019, 1, 2, "pie")
+        self.assertEqual(dbutils.get_notes_for_date(2019, 1, 2), "pie")
@@ -10,7 +10,20 @@ from . import views
 urlpatterns = [
     path('', views.notes_view, name='note'),
     path('<int:year>/<int:month>/<int:day>', views.notes_view, name='note'),
+    path('<int:year>/<int:month>/<int:day>/raw', views.notes_raw_view, name='note-raw'),
+    path('<int:year>/<int:month>/<int:day>/attachments', views.attachments_view, name='attachments'),
+    path('<int:year>/<int:month>/<int:day>/attachments/<int:attachment_id>', views.attachment_view,
+         name='attachment'),
+    path('<int:year>/<int:month>/<int:day>/revisions', views.revisions_view, name='revisions'),
+    path('<int:year>/<int:month>/<int:day>/revisions/<int:number>', views.revisions_view, name='revisions'),
     path('settings', views.settings, name='settings'),
+    path('stats', views.stats_view, name='stats'),
     path('search/', views.search_view, name='search'),
+    path('list/<int:year>/<int:month>', views.notes_list_view, name='notes-list'),
+    path('api/notes/<int:year>/<int:month>/<int:day>', views.note_api_view, name='note-api'),
+    path('api/tree', views.tree_api_view, name='tree-api'),
+    path('api/autocomplete', views.autocomplete_api_view, name='autocomplete-api'),
+    path('api/jobs', views.jobs_api_view, name='jobs-api'),
+    path('api/jobs/<int:job_id>', views.job_api_view, name='job-api'),
 ]
 
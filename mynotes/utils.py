@@ -2,13 +2,19 @@
 Description: Utilities module to support various other methods and operations
 """
 
+import base64
 import datetime
+import difflib
+import math
 import re
 
+from django.utils.html import escape
 from django.utils.safestring import mark_safe
 
 from . import constants
 
+TERM_PATTERN = re.compile(r'\w+')
+
 
 def get_todays_date():
     """Return today's date in form of a tuple
@@ -37,6 +43,40 @@ def get_formatted_date(year=None, month=None, day=None):
     return "{}/{}/{}".format(year, month, day)
 
 
+def is_valid_date(year, month, day):
+    """Check if year, month and day make a valid date
+
+    Args:
+        year (int): Year
+        month (int): Month
+        day (int): Day
+
+    Returns:
+        True if date is valid, False otherwise
+    """
+    try:
+        datetime.date(year, month, day)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def get_month_range(year, month):
+    """Get range of dates of a month
+
+    Args:
+        year (int): Year
+        month (int): Month
+
+    Returns:
+        (first date of the month, first date of next month)
+    """
+    first = datetime.date(year, month, 1)
+    if month == 12:
+        return first, datetime.date(year + 1, 1, 1)
+    return first, datetime.date(year, month + 1, 1)
+
+
 def convert_epoch_to_datetime(epoch_time):
     """Convert epoch time to user friendly date-time formatted string
 
@@ -63,20 +103,333 @@ def generate_notes_file_name(year, month, day):
     return "{}-{}-{}".format(year, month, day)
 
 
-def format_certain_string_in_content(content, string, case_insensitive=True):
-    """Format string with string in the content to mark it as bold and italics
+def extract_terms(content):
+    """Extract distinct terms of content for autocomplete, lowercase words within term length limits which are not
+    just digits
+
+    Args:
+        content (str): Content
+
+    Returns:
+        Set of terms
+    """
+    return {
+        word for word in TERM_PATTERN.findall(content.lower())
+        if constants.TERM_MIN_LENGTH <= len(word) <= constants.TERM_MAX_LENGTH and not word.isdigit()
+    }
+
+
+def get_trigrams(term):
+    """Get trigrams of a term, padded the same way as pg_trgm so that similarity matches on every backend
+
+    Args:
+        term (str): Lowercase term
+
+    Returns:
+        Set of trigrams
+    """
+    padded = "  {} ".format(term)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def get_trigram_similarity(term, other):
+    """Get trigram similarity of two terms, ratio of shared trigrams to all the trigrams as computed by pg_trgm
+
+    Args:
+        term (str): Lowercase term
+        other (str): Another lowercase term
+
+    Returns:
+        Similarity between 0 and 1
+    """
+    trigrams, other_trigrams = get_trigrams(term), get_trigrams(other)
+    shared = len(trigrams & other_trigrams)
+    return shared / (len(trigrams) + len(other_trigrams) - shared)
+
+
+def get_prefix_range(prefix):
+    """Get range of strings starting with a prefix, when strings are compared code point by code point
+
+    Args:
+        prefix (str): Non-empty prefix
+
+    Returns:
+        Tuple of lower bound (inclusive) and upper bound (exclusive)
+    """
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def compile_search_pattern(search_str, case_insensitive=True):
+    """Compile pattern matching any of the words of search string, taken literally
+
+    Args:
+        search_str (str): Search string
+        case_insensitive (bool): Flag to match case-insensitively
+
+    Returns:
+        Compiled pattern, None if search string has no words
+    """
+    words = sorted(set(search_str.split()), key=len, reverse=True)
+    if not words:
+        return None
+    return re.compile('|'.join(re.escape(word) for word in words), re.I if case_insensitive else 0)
+
+
+def get_highlighted_snippets(parts, pattern, width=constants.SEARCH_SNIPPET_WIDTH,
+                             matches=constants.SEARCH_SNIPPET_MATCHES):
+    """Get snippets of content around first few matches of pattern, with matches marked as bold and italics. Content
+    is read one part at a time and only until enough matches are found.
+
+    Args:
+        parts (iterable): Parts of content to be searched in order, e.g. as yielded by storage.stream_content
+        pattern (re.Pattern): Pattern compiled by compile_search_pattern
+        width (int): Number of characters shown on either side of a match
+        matches (int): Maximum number of matches to show snippets for
+
+    Returns:
+        Escaped snippets marked safe for HTML output purposes
+    """
+    stream = iter(parts)
+    # Beginning of content shown when nothing matches, longer than the snippet only if content continues
+    head = ''
+    # Content read and not dropped yet, which starts at offset
+    text, offset = '', 0
+    # Position up to which content has been searched
+    position = 0
+    # Window around the last match, which a window around the next match may overlap and be merged with
+    window = None
+    # Tuples containing content of the windows which can not grow anymore and whether content continues after them
+    windows = []
+    count = 0
+    finished = False
+    while count < matches and not finished and (pattern or len(head) <= 2 * width):
+        part = next(stream, None)
+        finished = part is None
+        if not finished:
+            head = (head + part)[:2 * width + 1]
+            text += part
+        for match in pattern.finditer(text, position - offset) if pattern else ():
+            # Window of a match has to be read in full, otherwise the match is searched again after the next part
+            if not finished and match.end() + width >= len(text):
+                break
+            start, end = max(offset + match.start() - width, 0), offset + min(match.end() + width, len(text))
+            if window and start <= window[1]:
+                window[1] = end
+            else:
+                if window:
+                    windows.append((window[0], text[window[0] - offset:window[1] - offset], True))
+                window = [start, end]
+            position = offset + match.end()
+            count += 1
+            if count == matches:
+                break
+        else:
+            # Pattern matches words taken literally, hence a match is never longer than the pattern and a match
+            # continuing in the next part starts within that many last characters
+            position = max(position, offset + len(text) - len(pattern.pattern if pattern else ''))
+
+        # Drop content which neither the last window nor the window of the next match reaches
+        keep = max(window[0] if window else position - width, offset)
+        text, offset = text[keep - offset:], keep
+
+    if window:
+        windows.append((window[0], text[window[0] - offset:window[1] - offset], window[1] < offset + len(text)))
+    if not windows:
+        windows.append((0, head[:2 * width], len(head) > 2 * width))
+
+    snippets = []
+    for start, snippet, continued in windows:
+        parts = []
+        offset = 0
+        for match in pattern.finditer(snippet) if pattern else ():
+            parts.append(escape(snippet[offset:match.start()]))
+            parts.append("<i><strong>{}</strong></i>".format(escape(match.group())))
+            offset = match.end()
+        parts.append(escape(snippet[offset:]))
+        snippets.append("{}{}{}".format("..." if start else "", ''.join(parts), "..." if continued else ""))
+    return mark_safe(' '.join(snippets))
+
+
+def parse_tags(tags_str):
+    """Parse tags separated by comma, tags are lowercased and duplicates are dropped
+
+    Args:
+        tags_str (str): Tags separated by comma
+
+    Returns:
+        Sorted list of tags
+
+    Raises:
+        ValueError: If any tag is too long
+    """
+    tags = {tag.strip().lower() for tag in tags_str.split(constants.TAG_SEPARATOR)} - {''}
+    for tag in tags:
+        if len(tag) > constants.TAG_MAX_LENGTH:
+            raise ValueError("Tag '{}' is longer than {} characters".format(tag, constants.TAG_MAX_LENGTH))
+    return sorted(tags)
+
+
+def encode_search_cursor(rank, pk):
+    """Encode position of the last search result of a page into an opaque cursor
+
+    Args:
+        rank (float): Relevance rank of the last result
+        pk (int): Primary key of the last result's document
+
+    Returns:
+        URL-safe cursor string
+    """
+    position = "{!r}:{}".format(rank, pk)
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_search_cursor(cursor):
+    """Decode cursor generated by encode_search_cursor
+
+    Args:
+        cursor (str): Cursor string
+
+    Returns:
+        (rank, pk)
+
+    Raises:
+        ValueError: If cursor is malformed
+    """
+    try:
+        rank, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return float(rank), int(pk)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid search cursor '{}'. Reason - {}".format(cursor, e))
+
+
+def generate_delta(old, new):
+    """Generate compact delta to turn old content into new content, diffing line by line
+
+    Args:
+        old (str): Old content
+        new (str): New content
+
+    Returns:
+        List of operations, ['=', n] to keep n characters, ['-', n] to delete n characters and ['+', text] to
+        insert text
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    delta = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old_lines, new_lines).get_opcodes():
+        if tag == 'equal':
+            delta.append(['=', sum(len(line) for line in old_lines[i1:i2])])
+            continue
+        if tag in ('delete', 'replace'):
+            delta.append(['-', sum(len(line) for line in old_lines[i1:i2])])
+        if tag in ('insert', 'replace'):
+            delta.append(['+', ''.join(new_lines[j1:j2])])
+    return delta
+
+
+def apply_delta(old, delta):
+    """Apply delta generated by generate_delta on old content
+
+    Args:
+        old (str): Old content
+        delta (list): List of operations
+
+    Returns:
+        New content
+    """
+    new = []
+    offset = 0
+    for operation, value in delta:
+        if operation == '=':
+            new.append(old[offset:offset + value])
+            offset += value
+        elif operation == '-':
+            offset += value
+        else:
+            new.append(value)
+    return ''.join(new)
+
+
+def apply_edit_operations(content, operations):
+    """Apply edit operations one after another, offset of an operation refers to content resulting from the previous
+    ones. Offsets and lengths are counted in characters (Unicode code points).
+
+    Args:
+        content (str): Content to be edited
+        operations (list): Dictionaries, either {'op': 'insert', 'offset': int, 'text': str} or
+            {'op': 'delete', 'offset': int, 'length': int}
+
+    Returns:
+        Edited content
+
+    Raises:
+        ValueError: If any operation is invalid or out of bounds of the content
+    """
+    if not isinstance(operations, list) or len(operations) > constants.MAX_EDIT_OPERATIONS:
+        raise ValueError("operations must be a list of at most {} operations".format(constants.MAX_EDIT_OPERATIONS))
+    for number, operation in enumerate(operations, 1):
+        if not isinstance(operation, dict):
+            raise ValueError("Operation {} must be an object".format(number))
+        offset = operation.get('offset')
+        if type(offset) is not int or not 0 <= offset <= len(content):
+            raise ValueError("Offset of operation {} is out of bounds".format(number))
+        if operation.get('op') == constants.EDIT_INSERT_OPERATION:
+            text = operation.get('text')
+            if not isinstance(text, str):
+                raise ValueError("Text of operation {} must be a string".format(number))
+            content = content[:offset] + text + content[offset:]
+        elif operation.get('op') == constants.EDIT_DELETE_OPERATION:
+            length = operation.get('length')
+            if type(length) is not int or not 0 <= length <= len(content) - offset:
+                raise ValueError("Length of operation {} is out of bounds".format(number))
+            content = content[:offset] + content[offset + length:]
+        else:
+            raise ValueError("Operation {} must either be insert or delete".format(number))
+    return content
+
+
+def parse_byte_range(header, size):
+    """Parse Range header requesting a single range of bytes
+
+    Args:
+        header (str): Value of Range header
+        size (int): Size of the content in bytes
+
+    Returns:
+        Tuple of offsets of first and last byte (inclusive), None if header does not request a single valid range of
+        bytes and whole content is to be served
+
+    Raises:
+        ValueError: If range is not satisfiable
+    """
+    match = re.match(r'^bytes=(\d*)-(\d*)$', header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range, i.e. last few bytes
+        if not int(last) or not size:
+            raise ValueError("Range not satisfiable")
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def get_percentile(values, percent):
+    """Get percentile of sorted values using nearest-rank method
 
     Args:
-        content (str): Content that needs to be formatted
-        string (str): Part of content that needs to be formatted
-        case_insensitive (bool): Flag to replace string case-insensitively
+        values (list): Sorted values
+        percent (int): Percentile
 
     Returns:
-        Formatted string and marked safe for HTML output purposes
+        Value at percentile, None if there are no values
     """
-    new_string = "<i><strong>{}</strong></i>".format(string)
-    if case_insensitive:
-        data = re.sub(string, new_string, content, flags=re.I)
-    else:
-        data = re.sub(string, new_string, content)
-    return mark_safe(data)
+    if not values:
+        return None
+    index = max(math.ceil(percent / 100 * len(values)) - 1, 0)
+    return values[min(index, len(values) - 1)]
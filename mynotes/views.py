@@ -2,61 +2,373 @@
 Description: Views are defined in this module
 """
 
-from django.shortcuts import render
-from . import utils, dbutils
+import json
+
+from django.http import (FileResponse, Http404, HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed,
+                         HttpResponseNotModified, JsonResponse, QueryDict, StreamingHttpResponse)
+from django.middleware.csrf import get_token
+from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.http import parse_etags, quote_etag
+from django.views.decorators.csrf import csrf_exempt
+
+from . import blobstore, constants, instrumentation, utils, dbutils, models
 from . import forms
 
 
 def settings(request):
-    """View for setting page
+    """View for setting page, maintenance jobs can be queued from here as well
     """
+    if request.method == 'POST':
+        kind = request.POST.get('kind')
+        if kind not in constants.MAINTENANCE_JOB_KINDS:
+            return HttpResponseBadRequest("Invalid job")
+        dbutils.enqueue_job(kind)
+        return redirect('settings')
     context = {
         'settings': dbutils.get_settings(),
         'search_form': forms.SearchForm(),
+        'job_kinds': constants.MAINTENANCE_JOB_KINDS,
+        'jobs': dbutils.get_recent_jobs(),
     }
     return render(request, 'mynotes/settings.html', context)
 
 
+def stats_view(request):
+    """View for rolling latency percentiles of every view
+    """
+    return JsonResponse(instrumentation.get_view_percentiles())
+
+
 def notes_view(request, year=None, month=None, day=None):
     """View for notes page
     """
+    if (year or month or day) and not utils.is_valid_date(year, month, day):
+        raise Http404("Invalid date {}".format(utils.get_formatted_date(year, month, day)))
     if request.method == 'POST':
         form = forms.NoteForm(request.POST)
         if not form.is_valid():
             context = {}
             return render(request, 'mynotes/notes_page.html', context)
         notes = form.cleaned_data['content']
-        dbutils.save_note(year, month, day, notes.replace('\n', ''))
+        dbutils.save_note(year, month, day, notes.replace('\r\n', '\n'), tags=form.cleaned_data['tags'])
 
     if not (year or month or day):
         year, month, day = utils.get_todays_date()
-    notes = dbutils.get_notes_for_date(year, month, day)
-    stats = dbutils.get_access_and_modify_time_for_notes(year, month, day)
+
+    # Page is cached with a placeholder for CSRF token, which is replaced by token of the request being served
+    key = dbutils.get_note_page_key(year, month, day)
+    page = dbutils.get_cached_note_page(key)
+    if page is None:
+        notes = dbutils.get_notes_for_date(year, month, day)
+        stats = dbutils.get_access_and_modify_time_for_notes(year, month, day)
+        context = {
+            'date': utils.get_formatted_date(year, month, day),
+            'notes': notes,
+            'tags': ', '.join(dbutils.get_tags_for_date(year, month, day)),
+            'version': dbutils.get_note_version_for_date(year, month, day),
+            'attachments': dbutils.get_attachments_for_date(year, month, day),
+            # Sidebar is a cached fragment, hence index, list of notes and tag counts are evaluated only if it is
+            # rendered
+            'index': dbutils.get_note_index,
+            'tag_counts': dbutils.get_tag_counts,
+            'index_version': dbutils.get_note_index_version(),
+            'list': lambda: dbutils.get_list_of_notes(year, month),
+            'list_year': year,
+            'list_month': month,
+            'form': forms.NoteForm(),
+            'search_form': forms.SearchForm(),
+            'alert': {},
+            'csrf_token': constants.CSRF_TOKEN_PLACEHOLDER,
+        }
+        context.update(stats)
+        page = render_to_string('mynotes/notes_page.html', context, request)
+        dbutils.cache_note_page(key, page)
+    return HttpResponse(page.replace(constants.CSRF_TOKEN_PLACEHOLDER, get_token(request)))
+
+
+def notes_raw_view(request, year, month, day):
+    """View to download content of a note as plain text, streamed or partially by 'start' and 'end' offsets
+    """
+    try:
+        if 'start' in request.GET or 'end' in request.GET:
+            start = int(request.GET.get('start', 0))
+            end = int(request.GET['end']) if 'end' in request.GET else None
+            if start < 0 or (end is not None and end < 0):
+                return HttpResponseBadRequest("Invalid range, offsets must not be negative")
+            return HttpResponse(dbutils.get_notes_range_for_date(year, month, day, start, end),
+                                content_type='text/plain; charset=utf-8')
+        return StreamingHttpResponse(dbutils.stream_notes_for_date(year, month, day),
+                                     content_type='text/plain; charset=utf-8')
+    except ValueError:
+        return HttpResponseBadRequest("Invalid range")
+    except models.Document.DoesNotExist:
+        raise Http404("Notes not found for date {}".format(utils.get_formatted_date(year, month, day)))
+
+
+def attachments_view(request, year, month, day):
+    """View to attach an uploaded file to a note. Upload is spooled to a temporary file on disk as it arrives.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    form = forms.AttachmentForm(request.POST, request.FILES)
+    if not form.is_valid():
+        return HttpResponseBadRequest("Invalid attachment")
+    try:
+        dbutils.add_attachment_for_date(year, month, day, form.cleaned_data['file'])
+    except models.Document.DoesNotExist:
+        raise Http404("Notes not found for date {}".format(utils.get_formatted_date(year, month, day)))
+    return redirect('note', year, month, day)
+
+
+def attachment_view(request, year, month, day, attachment_id):
+    """View to download an attachment of a note, whole or a single range of bytes as requested by Range header.
+    Blob file is handed over to the server as is, so that it can be sent without being read into memory.
+    """
+    try:
+        attachment = dbutils.fetch_attachment_for_date(year, month, day, attachment_id)
+        blob = blobstore.open_blob(attachment.digest)
+    except (models.Attachment.DoesNotExist, FileNotFoundError):
+        raise Http404("Attachment not found")
+    size = attachment.data.size
+    etag = quote_etag(attachment.digest)
+
+    # Range is honoured only if client's copy is still the same, content of an attachment never changes though
+    byte_range = None
+    if request.META.get('HTTP_IF_RANGE', etag) == etag:
+        try:
+            byte_range = utils.parse_byte_range(request.META.get('HTTP_RANGE', ''), size)
+        except ValueError:
+            blob.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{}'.format(size)
+            return response
+
+    if byte_range is None:
+        response = FileResponse(blob, as_attachment=True, filename=attachment.name,
+                                content_type=attachment.content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(blobstore.BlobRange(blob, start, end), status=206, as_attachment=True,
+                                filename=attachment.name, content_type=attachment.content_type)
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    return response
+
+
+def revisions_view(request, year, month, day, number=None):
+    """View for revision history of a note, along with diff of a revision against its previous revision
+    """
+    try:
+        revisions = dbutils.get_revisions_for_date(year, month, day)
+        content, diff = dbutils.get_revision_diff_for_date(year, month, day, number) if number else (None, None)
+    except (models.Document.DoesNotExist, models.Revision.DoesNotExist) as e:
+        raise Http404(e)
     context = {
         'date': utils.get_formatted_date(year, month, day),
-        'notes': notes,
-        'list': dbutils.get_list_of_notes(),
-        'form': forms.NoteForm(),
+        'revisions': revisions,
+        'number': number,
+        'content': content,
+        'diff': diff,
         'search_form': forms.SearchForm(),
-        'alert': {},
     }
-    context.update(stats)
-    return render(request, 'mynotes/notes_page.html', context)
+    return render(request, 'mynotes/revisions_page.html', context)
+
+
+@csrf_exempt
+def note_api_view(request, year, month, day):
+    """JSON API to read and write a note. Reads honour If-None-Match and answer 304 while note is unchanged, writes
+    honour If-Match and answer 412 if note has changed since the client read it. PATCH applies edit operations
+    (insert/delete at offset) to a known version of the note, so that autosave sends only the changed text.
+    """
+    if not utils.is_valid_date(year, month, day):
+        return JsonResponse({'error': "Invalid date {}".format(utils.get_formatted_date(year, month, day))},
+                            status=404)
+
+    if request.method == 'GET':
+        try:
+            document = dbutils.fetch_note_object_for_date(year, month, day)
+        except models.Document.DoesNotExist:
+            return JsonResponse({'error': "Notes not found for date {}".format(
+                utils.get_formatted_date(year, month, day))}, status=404)
+        etag = quote_etag(dbutils.get_note_version(document))
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+        else:
+            response = JsonResponse(dbutils.get_note_details(document))
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    if request.method in ('PUT', 'PATCH'):
+        # Requiring JSON content type keeps browsers from forging cross-site writes without a preflight request
+        if request.content_type != 'application/json':
+            return JsonResponse({'error': "Content type must be application/json"}, status=415)
+        if_match = parse_etags(request.META.get('HTTP_IF_MATCH', ''))
+        if len(if_match) > 1:
+            return JsonResponse({'error': "Only a single entity tag is supported in If-Match"}, status=400)
+        version = None
+        if if_match:
+            # Strong entity tags are quoted versions, weak ones never match
+            version = if_match[0][1:-1] if if_match[0].startswith('"') else if_match[0]
+        try:
+            body = json.loads(request.body.decode('utf-8'))
+            if request.method == 'PUT':
+                content = body['content']
+                if not isinstance(content, str):
+                    raise TypeError("content must be a string")
+                version = dbutils.save_note(year, month, day, content, version=version)
+            else:
+                version = version or body['version']
+                if not isinstance(version, str):
+                    raise TypeError("version must be a string")
+                version = dbutils.patch_note(year, month, day, body['operations'], version)
+        except (KeyError, TypeError, ValueError) as e:
+            return JsonResponse({'error': "Invalid request body. Reason - {}".format(e)}, status=400)
+        except models.Document.DoesNotExist:
+            return JsonResponse({'error': "Notes not found for date {}".format(
+                utils.get_formatted_date(year, month, day))}, status=404)
+        except dbutils.NoteVersionMismatch as e:
+            return JsonResponse({'error': str(e)}, status=412)
+        response = JsonResponse({'version': version})
+        response['ETag'] = quote_etag(version)
+        return response
+
+    return HttpResponseNotAllowed(['GET', 'PUT', 'PATCH'])
+
+
+def notes_list_view(request, year, month):
+    """View to lazily load list of notes of a month in the sidebar
+    """
+    return JsonResponse({'notes': dbutils.get_list_of_notes(year, month)})
+
+
+def tree_api_view(request):
+    """JSON API to browse the tree, one level at a time or the whole subtree under a path
+    """
+    path = request.GET.get('path', constants.ROOT_DIRECTORY).strip(constants.TREE_PATH_SEPARATOR)
+    depth = request.GET.get('depth', '1')
+    try:
+        depth = None if depth == 'all' else int(depth)
+        if depth is not None and depth < 0:
+            raise ValueError("depth must not be negative")
+    except ValueError as e:
+        return JsonResponse({'error': "Invalid depth. Reason - {}".format(e)}, status=400)
+    listing = dbutils.get_tree_listing(path.split(constants.TREE_PATH_SEPARATOR), depth)
+    if listing is None:
+        return JsonResponse({'error': "Path '{}' not found".format(path)}, status=404)
+    return JsonResponse(listing)
+
+
+def autocomplete_api_view(request):
+    """JSON API to suggest terms and notes completing a prefix, queried as user types. Suggestions are returned within
+    a latency budget, 'complete' is false if they were cut short by it.
+    """
+    prefix = request.GET.get('q', '').strip()[:constants.TERM_MAX_LENGTH]
+    suggestions = {'terms': [], 'notes': [], 'complete': True}
+    if prefix:
+        suggestions = dbutils.get_autocomplete_suggestions(prefix)
+    response = JsonResponse({
+        'terms': [{'term': term, 'count': count} for term, count in suggestions['terms']],
+        'notes': [{'name': name, 'url': reverse('note', args=(date.year, date.month, date.day))}
+                  for name, date in suggestions['notes']],
+        'complete': suggestions['complete'],
+    })
+    # Same prefix is requested again as user corrects typing, briefly stale suggestions are fine
+    response['Cache-Control'] = 'private, max-age={}'.format(constants.TERM_INDEX_TTL)
+    return response
+
+
+def jobs_api_view(request):
+    """JSON API to list recent background jobs and to queue a job, queued job is executed by run_worker. Writes are
+    protected by CSRF token like forms, as jobs write files on the server.
+    """
+    if request.method == 'GET':
+        return JsonResponse({'jobs': dbutils.get_recent_jobs()})
+
+    if request.method == 'POST':
+        if request.content_type != 'application/json':
+            return JsonResponse({'error': "Content type must be application/json"}, status=415)
+        try:
+            body = json.loads(request.body.decode('utf-8'))
+            arguments = body.get('arguments', {})
+            if not isinstance(arguments, dict):
+                raise TypeError("arguments must be an object")
+            job = dbutils.enqueue_job(body['kind'], arguments)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            return JsonResponse({'error': "Invalid request body. Reason - {}".format(e)}, status=400)
+        response = JsonResponse(dbutils.get_job_details(job), status=202)
+        response['Location'] = reverse('job-api', args=(job.pk,))
+        return response
+
+    return HttpResponseNotAllowed(['GET', 'POST'])
+
+
+def job_api_view(request, job_id):
+    """JSON API to track progress of a background job and to cancel it
+    """
+    try:
+        if request.method == 'GET':
+            return JsonResponse(dbutils.get_job_details(models.Job.objects.get(pk=job_id)))
+        if request.method == 'DELETE':
+            if not dbutils.cancel_job(job_id):
+                return JsonResponse({'error': "Job {} has already finished".format(job_id)}, status=409)
+            return JsonResponse(dbutils.get_job_details(models.Job.objects.get(pk=job_id)), status=202)
+    except models.Job.DoesNotExist:
+        return JsonResponse({'error': "Job {} not found".format(job_id)}, status=404)
+    return HttpResponseNotAllowed(['GET', 'DELETE'])
 
 
 def search_view(request):
     """View for search page
     """
-    if request.method == 'POST':
-        form = forms.SearchForm(request.POST)
+    params = request.POST if request.method == 'POST' else request.GET
+    if 'search_str' in params or 'tag' in params:
+        form = forms.SearchForm(params)
         if form.is_valid():
             type = form.cleaned_data['type']
+            tag = form.cleaned_data['tag']
             search_str = form.cleaned_data['search_str']
-            documents = dbutils.search_data_in_documents(search_str)
+            filters = {
+                'tags': [tag] if tag else None,
+                'document_type': type or None,
+                'date_from': form.cleaned_data['date_from'],
+                'date_to': form.cleaned_data['date_to'],
+                'path': form.cleaned_data['path'],
+            }
+            try:
+                documents, next_cursor = dbutils.search_data_in_documents(search_str, cursor=params.get('cursor'),
+                                                                          **filters)
+            except ValueError:
+                # Stale or tampered cursor, restart from the first page
+                documents, next_cursor = dbutils.search_data_in_documents(search_str, **filters)
+            original_search_str = None
+            if not documents and search_str and 'cursor' not in params:
+                # Nothing matches, which may be a typo, search for the most similar words found in notes instead
+                correction = dbutils.get_search_correction(search_str)
+                if correction:
+                    documents, next_cursor = dbutils.search_data_in_documents(correction, **filters)
+                    original_search_str, search_str = search_str, correction
+            next_page = None
+            if next_cursor:
+                next_page = QueryDict(mutable=True)
+                next_page.update({field: params.get(field, '') for field in form.fields})
+                next_page.update({'search_str': search_str, 'cursor': next_cursor})
+                next_page = next_page.urlencode()
             context = {
                 'search_str': search_str,
+                'original_search_str': original_search_str,
                 'document_type': type,
+                'tag': tag,
+                'date_from': filters['date_from'],
+                'date_to': filters['date_to'],
+                'path': constants.TREE_PATH_SEPARATOR.join(filters['path'] or []),
                 'documents': documents,
+                'next_page': next_page,
                 'search_form': form,
             }
             return render(request, 'mynotes/search_page.html', context)
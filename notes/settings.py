@@ -38,9 +38,11 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
 MIDDLEWARE = [
+    'mynotes.instrumentation.RequestStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,7 +56,7 @@ ROOT_URLCONF = 'notes.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'mynotes.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -74,17 +76,75 @@ WSGI_APPLICATION = 'notes.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
 
-DATABASES = {
+# PostgreSQL by default, set MYNOTES_DATABASE=sqlite for an embedded single-user deployment without a database server
+
+if os.environ.get('MYNOTES_DATABASE') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('MYNOTES_SQLITE_PATH', os.path.join(BASE_DIR, 'db.sqlite3')),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql_psycopg2',
+            'NAME': '',
+            'USER': '',
+            'PASSWORD': '',
+            'HOST': '',
+            'PORT': '',
+        }
+    }
+
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+# Rendered note pages and index of notes are cached under keys derived from versions stored in the database, so a
+# write made by any process invalidates them. Configure a shared cache (e.g. memcached) to share entries between
+# processes.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
-        'NAME': '',
-        'USER': '',
-        'PASSWORD': '',
-        'HOST': '',
-        'PORT': '',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+# File attachments
+# Uploads are spooled to a temporary file on disk instead of memory, and stored in a content-addressed blob store
+
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+MYNOTES_BLOB_ROOT = os.path.join(BASE_DIR, 'blobs')
+
+# Background jobs
+# Archives and state files of export jobs are written under this directory only
+
+MYNOTES_EXPORT_ROOT = os.path.join(BASE_DIR, 'exports')
+
+# Instrumentation
+# Every request is logged with its SQL query count and timings, queries slower than this threshold are logged along
+# with the function which issued them
+
+MYNOTES_SLOW_QUERY_MS = 100
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'mynotes': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 